@@ -3,12 +3,20 @@
 DeFAI Sentinel ML Server - Application Entry Point
 A Flask application that serves ML models for risk assessment and anomaly detection
 """
-from flask import Flask, request, jsonify
+import time
+
+# Taken before the other imports so the logged startup time includes them
+boot_started = time.perf_counter()
+
+from flask import Flask, Response, has_request_context, request, jsonify, stream_with_context
 import os
 import logging
+import hmac
 import json
-import time
+import math
 import sys
+import threading
+from functools import partial
 from pathlib import Path
 
 # Load environment variables
@@ -23,36 +31,89 @@ except ImportError:
 # Import anomaly detector if it exists
 try:
     from src.models.anomaly_detector import DeFiAnomalyDetector
+    from src.models.online_update import OnlineForestUpdater
+    from src.serving.inference_scheduler import InferenceScheduler
+    from src.serving.model_manager import ModelManager
+    from src.serving.model_registry import ModelRegistry
     HAS_ANOMALY_DETECTOR = True
 except ImportError:
     HAS_ANOMALY_DETECTOR = False
     print("Warning: Could not import anomaly detector module, using mock data only")
 
+# Import feature extraction if it exists
+try:
+    from src.features.feature_cache import FeatureCache
+    from src.features.transaction_features import TransactionFeatureExtractor
+    HAS_FEATURE_EXTRACTOR = True
+except ImportError:
+    HAS_FEATURE_EXTRACTOR = False
+    print("Warning: Could not import feature extraction module, server-side features disabled")
+
+from src.models.batch_scoring import ADDRESS_FEATURE_COUNT, ANOMALY_THRESHOLD, stack_feature_dicts
+from src.serving.log_pipeline import RouteSampler, configure_logging, parse_sample_rates
+from src.serving.metrics import BATCH_SIZE_BUCKETS, MetricsRegistry, method_label
+from src.serving.ndjson_stream import iter_ndjson_chunks, score_transaction_stream
+from src.serving.portfolio import portfolio_risk
+from src.serving.process_stats import loaded_heavy_modules, resident_set_bytes
+from src.serving.profiling import PROFILED_ENVIRON_KEY, ProfilingMiddleware
+from src.serving.risk_table import RiskScoreTable, RiskTableRefresher, fallback_risk_score
+from src.serving.wire_format import MATRIX_MEDIA_TYPE, WireFormatError, decode_matrix, encode_matrix
+
+import_seconds = time.perf_counter() - boot_started
+
 # Configure logging
 log_level = os.environ.get('LOG_LEVEL', 'INFO')
 numeric_level = getattr(logging, log_level.upper(), logging.INFO)
 
-# Ensure log directory exists
+# Log file next to this module unless LOG_FILE says otherwise (empty: stderr only)
 log_dir = os.path.dirname(__file__)
-log_file = os.path.join(log_dir, 'ml_server.log')
+log_file = os.environ.get('LOG_FILE', os.path.join(log_dir, 'ml_server.log'))
+log_handlers = [logging.StreamHandler()]
+if log_file:
+    log_handlers.append(logging.FileHandler(log_file))
 
-logging.basicConfig(
-    level=numeric_level,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(log_file)
-    ]
+# Log calls only enqueue the record; a background thread formats and writes it
+log_pipeline = configure_logging(
+    numeric_level,
+    handlers=log_handlers,
+    json_format=os.environ.get('LOG_FORMAT', 'text').lower() == 'json',
+    queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
+    block_seconds=float(os.environ.get('LOG_QUEUE_BLOCK_MS', 0)) / 1000
 )
 logger = logging.getLogger('ml-server')
 
+def current_route():
+    """URL rule of the request being handled, or None outside a request"""
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return None
+
+# Sample high-volume INFO logs per route; warnings and errors are always kept
+log_pipeline.add_sampler(RouteSampler(
+    current_route,
+    parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES', '')),
+    default_rate=float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+))
+
 def create_app():
+    app_started = time.perf_counter()
     app = Flask(__name__)
+    # Bodies are read into memory (except on the streaming endpoint); cap their size
+    max_request_mb = float(os.environ.get('MAX_REQUEST_MB', 64))
+    app.config['MAX_CONTENT_LENGTH'] = int(max_request_mb * 1024 * 1024) or None
     
     # Log startup information
-    logger.info(f"Starting DeFAI Sentinel ML Server")
-    logger.info(f"Environment variables loaded: {env_loaded}")
-    logger.info(f"Anomaly detector module available: {HAS_ANOMALY_DETECTOR}")
+    logger.info("Starting DeFAI Sentinel ML Server")
+    logger.info("Environment variables loaded: %s", env_loaded)
+    logger.info("Anomaly detector module available: %s", HAS_ANOMALY_DETECTOR)
+    
+    # The lite profile serves exported flat forests only, so sklearn, scipy
+    # and joblib are never imported; pandas is only needed for large batches
+    serving_profile = os.environ.get('SERVING_PROFILE', 'full').lower()
+    if serving_profile not in ('full', 'lite'):
+        logger.warning("Unknown SERVING_PROFILE %r, using 'full'", serving_profile)
+        serving_profile = 'full'
+    logger.info("Serving profile: %s", serving_profile)
     
     # Enable CORS if needed
     if os.environ.get('ENABLE_CORS', 'False').lower() == 'true':
@@ -75,22 +136,285 @@ def create_app():
         "0x0bc529c00c6401aef6d220be8c6ea1667f6ad93e": 55,  # Yearn Finance
     }
     
+    def load_risk_scores():
+        """Seed scores plus any precomputed scores found at RISK_SCORES_PATH"""
+        scores = dict(RISK_SCORES)
+        scores_path = Path(__file__).parent / os.environ.get('RISK_SCORES_PATH', 'models/risk_scores.json')
+        if scores_path.exists():
+            with open(scores_path) as f:
+                scores.update({address.lower(): score for address, score in json.load(f).items()})
+        return scores
+    
+    # Memory-mapped risk score table shared by all workers, rebuilt in the background
+    risk_table_path = Path(__file__).parent / os.environ.get('RISK_TABLE_PATH', 'models/risk_scores.bin')
+    risk_table_refresher = RiskTableRefresher(
+        load_risk_scores,
+        risk_table_path,
+        interval=float(os.environ.get('RISK_TABLE_REFRESH_SECONDS', 300))
+    )
+    try:
+        risk_table_refresher.refresh_now()
+    except Exception as e:
+        logger.error("Error building risk score table: %s", e)
+    risk_table_refresher.start()
+    risk_table = RiskScoreTable(risk_table_path)
+    logger.info("Risk score table mapped from %s (%d entries)", risk_table_path, len(risk_table))
+    
     # Try to load the anomaly detector model
-    anomaly_detector = None
+    model_manager = None
     if HAS_ANOMALY_DETECTOR:
         model_path = os.environ.get('ANOMALY_MODEL_PATH', 'models/anomaly_detector.joblib')
         model_path = Path(__file__).parent / model_path
         
-        logger.info(f"Looking for anomaly detector model at: {model_path}")
+        logger.info("Looking for anomaly detector model at: %s", model_path)
+        
+        load_model = partial(DeFiAnomalyDetector.load_model, flat_only=serving_profile == 'lite')
+        
+        # Memory-mapped loading lets forked workers share the model's pages
+        model_manager = ModelManager(
+            model_path,
+            load_model,
+            mmap_mode='r' if os.environ.get('MODEL_MMAP', 'True').lower() == 'true' else None,
+            probe_path=os.environ.get('ANOMALY_PROBE_PATH')
+        )
         
         if model_path.exists():
             try:
-                anomaly_detector = DeFiAnomalyDetector.load_model(str(model_path))
-                logger.info(f"Loaded anomaly detector model from {model_path}")
+                model_manager.reload()
+                logger.info("Loaded anomaly detector model from %s", model_path)
             except Exception as e:
-                logger.error(f"Error loading anomaly detector model: {e}")
+                logger.error("Error loading anomaly detector model: %s", e)
+        else:
+            logger.warning("Anomaly detector model not found at %s. Using mock data.", model_path)
+        
+        watch_interval = float(os.environ.get('MODEL_WATCH_INTERVAL', 30))
+        if watch_interval > 0:
+            model_manager.start_watching(watch_interval)
+    
+    # Specialised per-protocol (or per-chain) models, loaded on first use
+    model_registry = None
+    if model_manager:
+        model_registry = ModelRegistry(
+            Path(__file__).parent / os.environ.get('PROTOCOL_MODELS_DIR', 'models/protocols'),
+            load_model,
+            fallback=lambda: model_manager.detector,
+            mmap_mode=model_manager.mmap_mode,
+            max_models=int(os.environ.get('PROTOCOL_MODELS_MAX', 64)),
+            max_bytes=int(float(os.environ.get('PROTOCOL_MODELS_MAX_MB', 1024)) * 1024 * 1024)
+        )
+    
+    # Refresh the global model online from the rows it scores (opt-in)
+    online_updater = None
+    online_update_interval = float(os.environ.get('ONLINE_UPDATE_INTERVAL', 0))
+    if model_manager and online_update_interval > 0:
+        online_updater = OnlineForestUpdater(
+            lambda: model_manager.detector,
+            lambda detector, expected: model_manager.swap(detector, expected=expected),
+            reservoir_size=int(os.environ.get('ONLINE_UPDATE_RESERVOIR', 10000)),
+            replace_fraction=float(os.environ.get('ONLINE_UPDATE_REPLACE_FRACTION', 0.1)),
+            min_rows=int(os.environ.get('ONLINE_UPDATE_MIN_ROWS', 1000)),
+            max_score=float(os.environ.get('ONLINE_UPDATE_MAX_SCORE', ANOMALY_THRESHOLD))
+        )
+        model_manager.set_observers(model_manager.score_observer, online_updater.observe)
+        online_updater.start(online_update_interval)
+        logger.info("Online model updates every %ss", online_update_interval)
+        if serving_profile == 'lite':
+            logger.warning("Online model updates load sklearn to grow trees, even in the lite profile")
+    
+    # Coalesce concurrent single-protocol requests into batched model calls (opt-in:
+    # each request may wait up to INFERENCE_MAX_LATENCY_MS for company)
+    inference_scheduler = None
+    if (model_manager and model_manager.detector is not None
+            and os.environ.get('INFERENCE_BATCHING', 'False').lower() == 'true'):
+        inference_scheduler = InferenceScheduler(
+            # Resolve the detector per batch so hot-swapped models are picked up
+            lambda feature_matrix: model_manager.detector.score_batch(feature_matrix),
+            max_batch_size=int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 64)),
+            max_latency_ms=float(os.environ.get('INFERENCE_MAX_LATENCY_MS', 5))
+        )
+        logger.info("Inference micro-batching enabled: %s", inference_scheduler.stats())
+    
+    # Server-side feature state built from ingested transactions; the graph and
+    # address counts are capped so a long-running server's memory stays bounded
+    feature_extractor = None
+    feature_lock = threading.Lock()
+    if HAS_FEATURE_EXTRACTOR:
+        feature_extractor = TransactionFeatureExtractor(
+            profile_sketch_width=int(os.environ.get('FEATURE_PROFILE_SKETCH_WIDTH', 262144)) or None,
+            graph_max_edges=int(os.environ.get('FEATURE_GRAPH_MAX_EDGES', 1000000)) or None,
+            feature_cache=FeatureCache(
+                max_entries=int(os.environ.get('FEATURE_CACHE_SIZE', 10000)),
+                ttl_seconds=float(os.environ.get('FEATURE_CACHE_TTL', 30)),
+                max_bytes=int(float(os.environ.get('FEATURE_CACHE_MAX_MB', 64)) * 1024 * 1024)
+            )
+        )
+    
+    # Request, phase and model metrics exposed on /metrics; recording is a
+    # per-thread list increment, everything else is read at scrape time
+    metrics = MetricsRegistry()
+    request_duration = metrics.histogram(
+        'sentinel_request_duration_seconds', 'Request latency by route', ('route', 'method', 'status'))
+    phase_duration = metrics.histogram(
+        'sentinel_phase_duration_seconds', 'Time spent in each request phase', ('phase',))
+    feature_phase = phase_duration.labels('feature_extraction')
+    scoring_phase = phase_duration.labels('scoring')
+    serialization_phase = phase_duration.labels('serialization')
+    model_batch_size = metrics.histogram(
+        'sentinel_model_batch_size', 'Rows per anomaly model scoring call', buckets=BATCH_SIZE_BUCKETS)
+    mock_fallbacks = metrics.counter(
+        'sentinel_mock_fallbacks_total', 'Anomaly responses produced by mock scoring', ('endpoint',))
+    
+    def cache_stats():
+        return feature_extractor.feature_cache.stats() if feature_extractor else {}
+    
+    def registry_stats():
+        return model_registry.stats() if model_registry else {}
+    
+    metrics.callback('sentinel_feature_cache_lookups_total', 'Feature cache lookups by result',
+                     lambda: {(result,): cache_stats().get(key) for result, key in (('hit', 'hits'), ('miss', 'misses'))},
+                     kind='counter', labelnames=('result',))
+    metrics.callback('sentinel_feature_cache_hit_ratio', 'Feature cache hit rate since startup',
+                     lambda: cache_stats().get('hit_rate'))
+    metrics.callback('sentinel_feature_cache_entries', 'Cached feature vectors',
+                     lambda: cache_stats().get('entries'))
+    metrics.callback('sentinel_protocol_model_lookups_total', 'Per-protocol model lookups by result',
+                     lambda: {(result,): registry_stats().get(key)
+                              for result, key in (('hit', 'hits'), ('miss', 'misses'), ('fallback', 'fallbacks'))},
+                     kind='counter', labelnames=('result',))
+    metrics.callback('sentinel_protocol_models_loaded', 'Per-protocol models in memory',
+                     lambda: registry_stats().get('loaded'))
+    metrics.callback('sentinel_model_load_seconds', 'Time taken by the last load of the global model',
+                     lambda: model_manager.load_seconds if model_manager else None)
+    metrics.callback('sentinel_protocol_model_load_seconds_total', 'Time spent loading per-protocol models',
+                     lambda: registry_stats().get('load_seconds'), kind='counter')
+    metrics.callback('sentinel_inference_queue_depth', 'Requests waiting in the inference scheduler',
+                     lambda: inference_scheduler.stats()['queue_depth'] if inference_scheduler else None)
+    metrics.callback('sentinel_risk_table_entries', 'Entries in the mapped risk score table',
+                     lambda: len(risk_table))
+    metrics.callback('sentinel_online_updates_total', 'Online model updates installed',
+                     lambda: online_updater.updates if online_updater else None, kind='counter')
+    metrics.callback('sentinel_online_update_seconds', 'Duration of the last online model update',
+                     lambda: online_updater.last_update_seconds if online_updater else None)
+    metrics.callback('sentinel_online_reservoir_rows', 'Rows in the online update reservoir',
+                     lambda: online_updater.reservoir.size if online_updater and online_updater.reservoir else None)
+    metrics.callback('sentinel_log_queue_depth', 'Log records waiting for the writer thread',
+                     lambda: log_pipeline.queue.qsize())
+    metrics.callback('sentinel_log_records_dropped_total', 'Log records dropped because the queue was full',
+                     lambda: log_pipeline.dropped, kind='counter')
+    metrics.callback('sentinel_log_records_sampled_out_total', 'INFO log records skipped by per-route sampling',
+                     lambda: log_pipeline.sampled_out, kind='counter')
+    boot = {}
+    metrics.callback('sentinel_startup_seconds', 'Time from the first import to the app being ready',
+                     lambda: boot.get('seconds'))
+    metrics.callback('sentinel_process_resident_memory_bytes', 'Resident memory of this worker',
+                     resident_set_bytes)
+    
+    def observe_scoring(n_rows, seconds):
+        model_batch_size.observe(n_rows)
+        scoring_phase.observe(seconds)
+    if model_manager:
+        model_manager.set_observers(observe_scoring, model_manager.sample_observer)
+    if model_registry:
+        model_registry.score_observer = observe_scoring
+    
+    @app.before_request
+    def start_request_timer():
+        request.environ['sentinel.started'] = time.perf_counter()
+    
+    @app.after_request
+    def record_request_duration(response):
+        started = request.environ.get('sentinel.started')
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            request.environ['sentinel.route'] = route
+            request_duration.labels(route, method_label(request.method), response.status_code).observe(time.perf_counter() - started)
+        return response
+    
+    def respond(payload):
+        """jsonify, recording the time spent serializing"""
+        started = time.perf_counter()
+        response = jsonify(payload)
+        serialization_phase.observe(time.perf_counter() - started)
+        return response
+    
+    def current_detector():
+        """The active anomaly detector, or None when no model is loaded"""
+        return model_manager.detector if model_manager else None
+    
+    def resolve_detector(address, chain=None):
+        """(model key, detector) for a protocol; the key is None for the global model"""
+        if model_registry is None:
+            return None, current_detector()
+        return model_registry.get(address, chain)
+    
+    def finite_number(value):
+        """A JSON number as a finite float; ValueError for anything else"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("expected a number")
+        try:
+            number = float(value)
+        except OverflowError:
+            number = math.inf
+        if not math.isfinite(number):
+            raise ValueError("expected a finite number")
+        return number
+    
+    simulated_latency_enabled = os.environ.get('SIMULATE_LATENCY', 'False').lower() == 'true'
+    
+    def simulate_latency(seconds):
+        """Add an artificial processing delay when SIMULATE_LATENCY is enabled"""
+        if not simulated_latency_enabled:
+            return
+        if request.environ.get('sentinel.async'):
+            # Awaited by the ASGI bridge without holding a worker thread
+            request.environ['sentinel.simulated_latency'] = seconds
         else:
-            logger.warning(f"Anomaly detector model not found at {model_path}. Using mock data.")
+            time.sleep(seconds)
+    
+    def model_anomaly_response(address, anomaly_score, model_key=None):
+        """Build the anomaly response for a score produced by the ML model"""
+        anomaly_score = float(anomaly_score)
+        response = {
+            "address": address,
+            "timestamp": int(time.time()),
+            "anomaly_detected": bool(anomaly_score > ANOMALY_THRESHOLD),
+            "anomaly_score": anomaly_score,
+            "model": model_key or "global",
+        }
+        if response["anomaly_detected"]:
+            response.update({
+                "anomaly_type": "ml_detected",
+                "severity": "high" if anomaly_score > 0.85 else "medium" if anomaly_score > 0.75 else "low",
+                "description": "Machine learning model detected unusual patterns in protocol data."
+            })
+        return response
+    
+    def mock_anomaly_response(address):
+        """Build a simulated anomaly response when the model is not used"""
+        import random
+        
+        # Higher risk protocols are more likely to have anomalies
+        mock_fallbacks.labels(request.endpoint).inc()
+        base_score = risk_table.get(address, 50)
+        anomaly_probability = base_score / 100
+        
+        has_anomaly = random.random() < anomaly_probability
+        
+        response = {
+            "address": address,
+            "timestamp": int(time.time()),
+            "anomaly_detected": has_anomaly,
+        }
+        
+        if has_anomaly:
+            response.update({
+                "anomaly_score": random.uniform(ANOMALY_THRESHOLD, 0.95),
+                "anomaly_type": random.choice(["price_spike", "liquidity_drop", "unusual_activity", "governance_risk"]),
+                "severity": random.choice(["low", "medium", "high"]),
+                "description": "Unusual activity detected in protocol operations."
+            })
+        
+        return response
     
     @app.route('/')
     def home():
@@ -99,8 +423,9 @@ def create_app():
             "message": "DeFAI Sentinel ML Server is running",
             "version": "1.0.0",
             "models_loaded": {
-                "anomaly_detector": anomaly_detector is not None
+                "anomaly_detector": current_detector() is not None
             },
+            "model_version": model_manager.version if model_manager else None,
             "env_loaded": env_loaded
         })
     
@@ -110,22 +435,20 @@ def create_app():
         # Lowercase the address for consistency
         address = address.lower()
         
-        # If the address is in our mock data, return it
-        if address in RISK_SCORES:
-            score = RISK_SCORES[address]
-        else:
-            # Generate a random score between 20 and 80 for unknown addresses
+        # If the address is in the precomputed table, return it
+        score = risk_table.get(address)
+        if score is None:
+            # Deterministic placeholder between 20 and 80 for unknown addresses,
+            # so every worker returns the same score without storing it
             # In a real model, we would compute this using features
-            import random
-            score = random.randint(20, 80)
-            RISK_SCORES[address] = score
+            score = fallback_risk_score(address)
         
-        logger.info(f"Returning risk score {score} for {address}")
+        logger.info("Returning risk score %s for %s", score, address)
         
-        # Simulate some processing time
-        time.sleep(0.5)
+        # Simulate some processing time (opt-in)
+        simulate_latency(0.5)
         
-        return jsonify({
+        return respond({
             "address": address,
             "risk_score": score,
             "timestamp": int(time.time()),
@@ -148,67 +471,165 @@ def create_app():
         # Extract features if available
         features = data.get('features', {})
         
+        # Without client features, use cached server-side features for addresses
+        # whose transactions have been ingested
+        window_end = data.get('window_end')
+        if window_end is not None:
+            try:
+                window_end = finite_number(window_end)
+            except ValueError as e:
+                return jsonify({"error": f"Invalid window_end: {e}"}), 400
+        has_server_features = (
+            not features and feature_extractor is not None and address in feature_extractor.graph_index
+        )
+        
         # Check if we should use the real model or mock data
         use_mock = os.environ.get('MOCK_DATA', 'True').lower() == 'true'
         
-        # Check if we should use the real model
-        if not use_mock and anomaly_detector and features and len(features) > 0:
+        # Check if we should use the real model (protocol-specific when available)
+        model_key, anomaly_detector = resolve_detector(address, data.get('chain'))
+        if (not use_mock and anomaly_detector and has_server_features
+                and anomaly_detector.n_features != ADDRESS_FEATURE_COUNT):
+            # A mock score here would look like a real one; report the misconfiguration instead
+            return jsonify({
+                "error": f"Anomaly model expects {anomaly_detector.n_features} features; "
+                         f"server-side address features have {ADDRESS_FEATURE_COUNT}"
+            }), 503
+        if not use_mock and anomaly_detector and (features or has_server_features):
             # Convert features to numpy array
             import numpy as np
             try:
-                # This is simplified - in production you'd need proper feature extraction
-                feature_array = np.array([float(v) for v in features.values()]).reshape(1, -1)
-                anomaly_score = anomaly_detector.get_anomaly_score(feature_array)
+                started = time.perf_counter()
+                if features:
+                    # This is simplified - in production you'd need proper feature extraction
+                    feature_array = np.array([float(v) for v in features.values()]).reshape(1, -1)
+                else:
+                    with feature_lock:
+                        feature_array = feature_extractor.address_features(address, window_end).reshape(1, -1)
+                feature_phase.observe(time.perf_counter() - started)
+                # Profiled requests score inline: cProfile does not see the scheduler thread
+                if inference_scheduler and not request.environ.get(PROFILED_ENVIRON_KEY):
+                    # The global model is resolved per batch so hot swaps are picked up
+                    anomaly_score = inference_scheduler.score(feature_array, anomaly_detector if model_key else None)
+                else:
+                    anomaly_score = anomaly_detector.get_anomaly_score(feature_array)
                 
                 # Determine if it's an anomaly based on threshold
-                has_anomaly = anomaly_score > 0.7
+                has_anomaly = anomaly_score > ANOMALY_THRESHOLD
                 
-                logger.info(f"Using ML model for anomaly detection: {has_anomaly} (score: {anomaly_score})")
+                logger.info("Using ML model for anomaly detection: %s (score: %s)", has_anomaly, anomaly_score)
                 
                 if has_anomaly:
-                    response = {
-                        "address": address,
-                        "timestamp": int(time.time()),
-                        "anomaly_detected": True,
-                        "anomaly_score": float(anomaly_score),
-                        "anomaly_type": "ml_detected",
-                        "severity": "high" if anomaly_score > 0.85 else "medium" if anomaly_score > 0.75 else "low",
-                        "description": "Machine learning model detected unusual patterns in protocol data."
-                    }
-                    return jsonify(response)
+                    return respond(model_anomaly_response(address, anomaly_score, model_key))
             except Exception as e:
-                logger.error(f"Error using anomaly detector model: {e}")
+                logger.error("Error using anomaly detector model: %s", e)
                 # Fall back to mock implementation
         
         # Mock implementation (fallback)
-        import random
+        response = mock_anomaly_response(address)
+        has_anomaly = response["anomaly_detected"]
         
-        # Higher risk protocols are more likely to have anomalies
-        base_score = RISK_SCORES.get(address.lower(), 50)
-        anomaly_probability = base_score / 100
+        logger.info("Anomaly detection result for %s: %s", address, has_anomaly)
         
-        has_anomaly = random.random() < anomaly_probability
+        # Simulate processing time (opt-in)
+        simulate_latency(1)
         
-        response = {
-            "address": address,
-            "timestamp": int(time.time()),
-            "anomaly_detected": has_anomaly,
-        }
+        return respond(response)
+    
+    def detect_anomaly_matrix():
+        """Score a binary feature matrix with one model; binary or JSON response by Accept"""
+        started = time.perf_counter()
+        try:
+            feature_matrix = decode_matrix(request.get_data(cache=False))
+        except WireFormatError as e:
+            return jsonify({"error": f"Invalid matrix payload: {e}"}), 400
+        feature_phase.observe(time.perf_counter() - started)
         
-        if has_anomaly:
-            response.update({
-                "anomaly_score": random.uniform(0.7, 0.95),
-                "anomaly_type": random.choice(["price_spike", "liquidity_drop", "unusual_activity", "governance_risk"]),
-                "severity": random.choice(["low", "medium", "high"]),
-                "description": "Unusual activity detected in protocol operations."
+        use_mock = os.environ.get('MOCK_DATA', 'True').lower() == 'true'
+        model_key, anomaly_detector = resolve_detector(request.args.get('address'), request.args.get('chain'))
+        if use_mock or anomaly_detector is None:
+            return jsonify({"error": "Binary scoring requires a loaded anomaly model (MOCK_DATA=false)"}), 503
+        try:
+            anomaly_scores = anomaly_detector.score_batch(feature_matrix)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid feature matrix: {e}"}), 400
+        
+        logger.info("Binary anomaly detection for %d rows", len(anomaly_scores))
+        model_name = model_key or "global"
+        if request.accept_mimetypes.best_match(['application/json', MATRIX_MEDIA_TYPE]) == MATRIX_MEDIA_TYPE:
+            started = time.perf_counter()
+            body = encode_matrix(anomaly_scores)
+            serialization_phase.observe(time.perf_counter() - started)
+            return Response(body, mimetype=MATRIX_MEDIA_TYPE, headers={
+                'X-Model': model_name,
+                'X-Anomaly-Threshold': str(ANOMALY_THRESHOLD)
             })
+        return respond({
+            "timestamp": int(time.time()),
+            "count": len(anomaly_scores),
+            "model": model_name,
+            "anomaly_scores": anomaly_scores.tolist(),
+            "anomaly_detected": (anomaly_scores > ANOMALY_THRESHOLD).tolist()
+        })
+    
+    @app.route('/api/anomaly/detect/batch', methods=['POST'])
+    def detect_anomaly_batch():
+        """Detect anomalies for many protocols with a single model call"""
+        if request.mimetype == MATRIX_MEDIA_TYPE:
+            return detect_anomaly_matrix()
+        data = request.json
+        
+        if not data or not isinstance(data, dict) or not isinstance(data.get('protocols'), list):
+            return jsonify({"error": "Invalid request format"}), 400
+        
+        protocols = data['protocols']
+        if any(not isinstance(p, dict) or not p.get('address') for p in protocols):
+            return jsonify({"error": "Protocol address is required"}), 400
+        
+        results = [None] * len(protocols)
+        use_mock = os.environ.get('MOCK_DATA', 'True').lower() == 'true'
+        
+        # Score the protocols that carry features with one N x F matrix per model
+        scored = [i for i, p in enumerate(protocols) if p.get('features')]
+        by_model = {}
+        if not use_mock:
+            for i in scored:
+                model_key, anomaly_detector = resolve_detector(protocols[i]['address'], protocols[i].get('chain'))
+                if anomaly_detector:
+                    by_model.setdefault(model_key, (anomaly_detector, []))[1].append(i)
+        for model_key, (anomaly_detector, indices) in by_model.items():
+            try:
+                started = time.perf_counter()
+                # Protocols whose features do not fit the model are left to the fallback on their own
+                feature_matrix, usable = stack_feature_dicts(
+                    [protocols[i]['features'] for i in indices], anomaly_detector.n_features
+                )
+                feature_phase.observe(time.perf_counter() - started)
+                if not usable.all():
+                    logger.warning("%d of %d protocols for model %s have malformed features",
+                                   len(indices) - int(usable.sum()), len(indices), model_key or 'global')
+                if not usable.any():
+                    continue
+                anomaly_scores = anomaly_detector.score_batch(feature_matrix)
+
+                scored_indices = [i for i, ok in zip(indices, usable.tolist()) if ok]
+                for i, anomaly_score in zip(scored_indices, anomaly_scores):
+                    results[i] = model_anomaly_response(protocols[i]['address'], anomaly_score, model_key)
+            except Exception as e:
+                logger.error("Error using anomaly detector model %s for batch: %s", model_key or 'global', e)
+                # Fall back to mock implementation
         
-        logger.info(f"Anomaly detection result for {address}: {has_anomaly}")
+        for i, protocol in enumerate(protocols):
+            if results[i] is None:
+                results[i] = mock_anomaly_response(protocol['address'])
         
-        # Simulate processing time
-        time.sleep(1)
+        logger.info("Batch anomaly detection for %d protocols", len(protocols))
         
-        return jsonify(response)
+        return respond({
+            "timestamp": int(time.time()),
+            "count": len(results),
+            "results": results
+        })
     
     @app.route('/api/user/risk', methods=['POST'])
     def user_risk_assessment():
@@ -223,46 +644,164 @@ def create_app():
         if not user_address:
             return jsonify({"error": "User address is required"}), 400
         
-        # Extract exposures if available
-        exposures = data.get('exposures', [])
-        
         # Calculate weighted risk score
-        total_value = 0
-        weighted_risk = 0
-        
-        for exposure in exposures:
-            protocol_address = exposure.get('protocol_address')
-            amount = exposure.get('amount', 0)
-            
-            if protocol_address and amount > 0:
-                # Get risk score for this protocol
-                risk_score = RISK_SCORES.get(protocol_address.lower(), 50)
-                
-                # Add to weighted calculation
-                total_value += amount
-                weighted_risk += amount * risk_score
-        
-        # Calculate final risk score
-        if total_value > 0:
-            final_risk_score = weighted_risk / total_value
-        else:
-            final_risk_score = 0
+        try:
+            risk = portfolio_risk([data], risk_table)
+        except (AttributeError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid exposure data: {e}"}), 400
+        final_risk_score = float(risk["risk_score"][0])
         
         response = {
             "user_address": user_address,
             "risk_score": round(final_risk_score, 2),
             "timestamp": int(time.time()),
-            "exposure_count": len(exposures),
-            "high_risk_exposure_count": sum(1 for e in exposures if 
-                                          RISK_SCORES.get(e.get('protocol_address', '').lower(), 0) >= 70)
+            "exposure_count": int(risk["exposure_count"][0]),
+            "high_risk_exposure_count": int(risk["high_risk_exposure_count"][0])
         }
         
-        logger.info(f"User risk assessment for {user_address}: {final_risk_score}")
+        logger.info("User risk assessment for %s: %s", user_address, final_risk_score)
         
-        # Simulate processing time
-        time.sleep(0.8)
+        # Simulate processing time (opt-in)
+        simulate_latency(0.8)
         
-        return jsonify(response)
+        return respond(response)
+
+    @app.route('/api/user/risk/batch', methods=['POST'])
+    def user_risk_assessment_batch():
+        """Assess the portfolio risk of many users in one vectorized pass"""
+        data = request.json
+        
+        if not data or not isinstance(data, dict) or not isinstance(data.get('users'), list):
+            return jsonify({"error": "Invalid request format"}), 400
+        
+        users = data['users']
+        if any(not isinstance(u, dict) or not u.get('user_address') for u in users):
+            return jsonify({"error": "User address is required"}), 400
+        
+        try:
+            risk = portfolio_risk(users, risk_table)
+        except (AttributeError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid exposure data: {e}"}), 400
+        
+        timestamp = int(time.time())
+        results = [
+            {
+                "user_address": user['user_address'],
+                "risk_score": round(risk_score, 2),
+                "timestamp": timestamp,
+                "exposure_count": exposure_count,
+                "high_risk_exposure_count": high_risk_count
+            }
+            for user, risk_score, exposure_count, high_risk_count in zip(
+                users,
+                risk["risk_score"].tolist(),
+                risk["exposure_count"].tolist(),
+                risk["high_risk_exposure_count"].tolist()
+            )
+        ]
+        
+        logger.info("Batch user risk assessment for %d users", len(users))
+        
+        return respond({
+            "timestamp": timestamp,
+            "count": len(results),
+            "results": results
+        })
+    
+    @app.route('/api/transactions/ingest', methods=['POST'])
+    def ingest_transactions():
+        """Add transactions to the server-side feature state"""
+        data = request.json
+        
+        if not data or not isinstance(data, dict) or not isinstance(data.get('transactions'), list):
+            return jsonify({"error": "Invalid request format"}), 400
+        if feature_extractor is None:
+            return jsonify({"error": "Feature extraction not available"}), 503
+        
+        try:
+            with feature_lock:
+                batch = feature_extractor.ingest(data['transactions'])
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid transaction data: {e}"}), 400
+        
+        logger.info("Ingested %d transactions touching %d addresses", len(batch), batch.n_addresses)
+        
+        return jsonify({
+            "ingested": len(batch),
+            "addresses": batch.n_addresses,
+            "timestamp": int(time.time())
+        })
+    
+    @app.route('/api/transactions/stream', methods=['POST'])
+    def stream_transactions():
+        """Ingest an NDJSON transaction stream and stream back scores per chunk"""
+        if feature_extractor is None:
+            return jsonify({"error": "Feature extraction not available"}), 503
+        
+        # The stream is read incrementally, so MAX_REQUEST_MB does not apply. Per-request
+        # limits need Flask >= 3.1, where None means "use the config", hence maxsize
+        try:
+            request.max_content_length = sys.maxsize
+        except AttributeError:
+            pass
+        
+        use_mock = os.environ.get('MOCK_DATA', 'True').lower() == 'true'
+        detector = None if use_mock else current_detector()
+        chunk_size = int(os.environ.get('STREAM_CHUNK_SIZE', 256))
+        
+        def generate():
+            count = 0
+            try:
+                chunks = iter_ndjson_chunks(request.stream, chunk_size=chunk_size)
+                for record in score_transaction_stream(chunks, feature_extractor, detector, feature_lock):
+                    count += 1
+                    yield json.dumps(record, allow_nan=False) + '\n'
+            except (KeyError, TypeError, ValueError) as e:
+                # Headers are already sent, so errors are reported in-band
+                logger.warning("Transaction stream aborted after %d results: %s", count, e)
+                yield json.dumps({"error": f"Invalid transaction data: {e}"}) + '\n'
+                return
+            logger.info("Transaction stream finished with %d results", count)
+            yield json.dumps({"done": True, "results": count, "timestamp": int(time.time())}) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    @app.route('/api/inference/stats', methods=['GET'])
+    def inference_stats():
+        """Effective batch size and queue wait of the inference scheduler"""
+        return jsonify({
+            "enabled": inference_scheduler is not None,
+            "stats": inference_scheduler.stats() if inference_scheduler else None,
+            "feature_cache": feature_extractor.feature_cache.stats() if feature_extractor else None,
+            "model_registry": model_registry.stats() if model_registry else None,
+            "online_update": online_updater.stats() if online_updater else None,
+            "model_version": model_manager.version if model_manager else None,
+            "serving_profile": serving_profile
+        })
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        """Prometheus text-format metrics"""
+        return Response(metrics.render(), content_type=MetricsRegistry.CONTENT_TYPE)
+
+    @app.route('/admin/model/reload', methods=['POST'])
+    def reload_model():
+        """Load, validate and hot-swap the anomaly detector model from disk"""
+        admin_token = os.environ.get('ADMIN_TOKEN')
+        provided = request.headers.get('X-Admin-Token', '')
+        if not admin_token or not hmac.compare_digest(provided.encode(), admin_token.encode()):
+            return jsonify({"error": "Forbidden"}), 403
+        if not model_manager:
+            return jsonify({"error": "Anomaly detector module not available"}), 503
+        
+        reload = model_manager.reload_async()
+        if request.args.get('wait', 'false').lower() != 'true':
+            return jsonify({"status": "reloading", "model": model_manager.status()}), 202
+        
+        try:
+            return jsonify({"status": "reloaded", "model": reload.result()})
+        except Exception as e:
+            return jsonify({"status": "rejected", "error": str(e), "model": model_manager.status()}), 422
 
     @app.route('/health')
     def health_check():
@@ -272,6 +811,32 @@ def create_app():
             "timestamp": int(time.time())
         })
     
+    # Opt-in request profiling; the middleware is only installed when enabled
+    profile_sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    profile_header_enabled = os.environ.get('PROFILING_ENABLED', 'False').lower() == 'true'
+    if profile_header_enabled or profile_sample_rate > 0:
+        profile_dir = Path(__file__).parent / os.environ.get('PROFILE_DIR', 'profiles')
+        app.wsgi_app = ProfilingMiddleware(
+            app.wsgi_app,
+            profile_dir,
+            sample_rate=profile_sample_rate,
+            header_enabled=profile_header_enabled,
+            admin_token=os.environ.get('ADMIN_TOKEN')
+        )
+        logger.info("Request profiling enabled (X-Profile header: %s, sample rate: %s), writing to %s",
+                    profile_header_enabled, profile_sample_rate, profile_dir)
+        if profile_header_enabled and not os.environ.get('ADMIN_TOKEN'):
+            logger.warning("PROFILING_ENABLED has no effect without ADMIN_TOKEN: X-Profile headers are ignored")
+    
+    # Per worker: imports (once per process) plus building the app
+    boot['seconds'] = import_seconds + time.perf_counter() - app_started
+    rss = resident_set_bytes()
+    heavy_modules = loaded_heavy_modules()
+    logger.info("ML server ready in %.2fs (%.2fs imports), profile %s, RSS %s, heavy modules loaded: %s",
+                boot['seconds'], import_seconds, serving_profile,
+                f"{rss / 1e6:.1f} MB" if rss is not None else 'unknown', ', '.join(heavy_modules) or 'none',
+                extra={'startup_seconds': boot['seconds'], 'rss_bytes': rss, 'heavy_modules': heavy_modules})
+    
     return app
 
 if __name__ == '__main__':
@@ -279,5 +844,5 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('DEBUG', 'True').lower() == 'true'
     
-    logger.info(f"Starting ML server on port {port} (debug={debug})")
+    logger.info("Starting ML server on port %d (debug=%s)", port, debug)
     app.run(host='0.0.0.0', port=port, debug=debug) 
\ No newline at end of file
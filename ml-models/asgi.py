@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+DeFAI Sentinel ML Server - ASGI Entry Point
+Serves the Flask application from an ASGI server (e.g. uvicorn) without
+blocking the event loop: request handling runs on a bounded thread pool.
+"""
+import os
+
+from app import create_app, logger
+from src.serving.asgi_bridge import AsgiBridge
+
+worker_threads = int(os.environ.get('ASGI_WORKER_THREADS', 32))
+app = AsgiBridge(create_app(), max_workers=worker_threads)
+logger.info("ASGI serving mode enabled with %d worker threads", worker_threads)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the ML server on one machine
+
+Starts the server in a subprocess (Flask's built-in server, uvicorn on
+`asgi:app`, or gunicorn on `app:create_app()`), or targets a running one
+with `--server external --url ...`, then replays a weighted mix of
+`/api/risk/score`, `/api/anomaly/detect` and `/api/user/risk` calls at a
+target rate with a bounded number of concurrent connections.
+
+Requests are scheduled open-loop (request i is due at start + i / rate) and
+latency is measured from the scheduled time, so queueing behind a slow
+server shows up in the percentiles instead of silently lowering the rate.
+Prints throughput and p50/p95/p99 latency per route.
+
+Usage (from ml-models/):
+    python -m benchmarks.loadtest --server uvicorn --workers 4 --rate 500 --concurrency 64 --duration 30
+    python -m benchmarks.loadtest --mix risk=1,detect=1 --env MOCK_DATA=false -o benchmarks/load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+ML_ROOT = Path(__file__).resolve().parent.parent
+
+# Protocols in the server's seed risk table, plus random unknown ones
+KNOWN_PROTOCOLS = [
+    "0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9",
+    "0x1f9840a85d5af5bf1d1762f925bdaddc4201f984",
+    "0xc00e94cb662c3520282e6f5717214004a7f26888",
+    "0x9f8f72aa9304c8b593d555f12ef6589cc3a579a2",
+    "0x6b175474e89094c44da98b954eedeac495271d0f",
+    "0x2260fac5e5542a773aa44fbcfedf7c193bc2c599",
+    "0x514910771af9ca656af840dff83e8264ecf986ca",
+    "0x0bc529c00c6401aef6d220be8c6ea1667f6ad93e",
+]
+
+class RequestFactory:
+    """Seeded request payloads in the shape the HTTP API expects"""
+
+    def __init__(self, seed: int = 0, unknown_share: float = 0.3):
+        self.rng = random.Random(seed)
+        self.unknown_share = unknown_share
+
+    def protocol(self) -> str:
+        if self.rng.random() < self.unknown_share:
+            return f"0x{self.rng.getrandbits(160):040x}"
+        return self.rng.choice(KNOWN_PROTOCOLS)
+
+    def risk(self) -> Tuple[str, str, Optional[dict]]:
+        return 'GET', f"/api/risk/score/{self.protocol()}", None
+
+    def detect(self) -> Tuple[str, str, Optional[dict]]:
+        return 'POST', '/api/anomaly/detect', {
+            "address": self.protocol(),
+            "features": {
+                "tvl": self.rng.lognormvariate(16, 2),
+                "volume": self.rng.lognormvariate(13, 2),
+                "tx_count": self.rng.randint(1, 5000),
+            },
+        }
+
+    def user(self) -> Tuple[str, str, Optional[dict]]:
+        return 'POST', '/api/user/risk', {
+            "user_address": f"0x{self.rng.getrandbits(160):040x}",
+            "exposures": [
+                {"protocol_address": self.protocol(), "amount": self.rng.lognormvariate(7, 2)}
+                for _ in range(self.rng.randint(1, 12))
+            ],
+        }
+
+ROUTES = ('risk', 'detect', 'user')
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route {name!r} (expected one of {', '.join(ROUTES)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(kind: str, port: int, workers: int, env: Dict[str, str]) -> subprocess.Popen:
+    """
+    Start the ML server in a subprocess listening on 127.0.0.1:port
+    """
+    if kind == 'flask':
+        command = [sys.executable, 'app.py']
+    elif kind == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(workers), '--log-level', 'warning']
+    elif kind == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', '8',
+                   '-b', f'127.0.0.1:{port}', 'app:create_app()']
+    else:
+        raise ValueError(f"Unknown server {kind!r}")
+    server_env = {**os.environ, 'PORT': str(port), 'DEBUG': 'False', **env}
+    return subprocess.Popen(command, cwd=ML_ROOT, env=server_env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_until_healthy(host: str, port: int, timeout: float = 60.0, process: subprocess.Popen = None) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Server on {host}:{port} did not become healthy within {timeout}s")
+
+class _Worker(threading.Thread):
+    """Sends due requests over one keep-alive connection"""
+
+    def __init__(self, host: str, port: int, jobs: queue.Queue, results: List):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.jobs = jobs
+        self.results = results
+        self.connection = None
+
+    def _send(self, method: str, path: str, body: Optional[dict]) -> int:
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        return response.status
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            route, due, method, path, body = job
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                status = self._send(method, path, body)
+            except (OSError, http.client.HTTPException):
+                status = 0
+            done = time.perf_counter()
+            # list.append is atomic; latency counts from the scheduled time
+            self.results.append((route, due, done, status))
+
+def run_load(host: str, port: int, mix: Dict[str, float], rate: float, duration: float,
+             concurrency: int, warmup: float = 2.0, seed: int = 0) -> Dict:
+    """
+    Replay the request mix and summarise latency per route
+    """
+    factory = RequestFactory(seed)
+    rng = random.Random(seed + 1)
+    routes, weights = zip(*mix.items())
+    jobs: queue.Queue = queue.Queue(maxsize=concurrency * 4)
+    results: List = []
+    workers = [_Worker(host, port, jobs, results) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+
+    start = time.perf_counter() + 0.1
+    total = int((warmup + duration) * rate)
+    for i in range(total):
+        route = rng.choices(routes, weights)[0]
+        method, path, body = getattr(factory, route)()
+        jobs.put((route, start + i / rate, method, path, body))
+    for _ in workers:
+        jobs.put(None)
+    for worker in workers:
+        worker.join()
+
+    measured_from = start + warmup
+    measured = [r for r in results if r[1] >= measured_from]
+    elapsed = max((r[2] for r in measured), default=measured_from) - measured_from
+    report = {"target_rate": rate, "concurrency": concurrency, "duration": duration, "routes": {}}
+    for route in routes + ('all',):
+        rows = [r for r in measured if route == 'all' or r[0] == route]
+        latencies = np.array([r[2] - r[1] for r in rows]) * 1000
+        errors = sum(1 for r in rows if not 200 <= r[3] < 400)
+        report["routes"][route] = {
+            "requests": len(rows),
+            "errors": errors,
+            "throughput": len(rows) / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(rows) else None,
+            "p95_ms": float(np.percentile(latencies, 95)) if len(rows) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(rows) else None,
+            "max_ms": float(latencies.max()) if len(rows) else None,
+        }
+    return report
+
+def print_report(report: Dict) -> None:
+    print(f"target {report['target_rate']:.0f} req/s, {report['concurrency']} connections, "
+          f"{report['duration']:.0f}s measured")
+    print(f"{'route':8s} {'requests':>9s} {'errors':>7s} {'req/s':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for route, stats in report["routes"].items():
+        if not stats["requests"]:
+            continue
+        print(f"{route:8s} {stats['requests']:9d} {stats['errors']:7d} {stats['throughput']:9.1f} "
+              f"{stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the ML server")
+    parser.add_argument('--server', choices=('flask', 'uvicorn', 'gunicorn', 'external'), default='flask')
+    parser.add_argument('--url', help="Base URL of a running server (with --server external)")
+    parser.add_argument('--workers', type=int, default=1, help="Server worker processes (uvicorn/gunicorn)")
+    parser.add_argument('--env', action='append', default=[], help="KEY=VALUE passed to the server (repeatable)")
+    parser.add_argument('--mix', default='risk=5,detect=3,user=2', help="Weighted route mix")
+    parser.add_argument('--rate', type=float, default=100.0, help="Target requests per second")
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent client connections")
+    parser.add_argument('--duration', type=float, default=20.0, help="Measured seconds (after warmup)")
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.server == 'external':
+        if not args.url:
+            parser.error("--server external requires --url")
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        env = dict(item.split('=', 1) for item in args.env)
+        process = start_server(args.server, port, args.workers, env)
+    try:
+        wait_until_healthy(host, port, process=process)
+        report = run_load(host, port, parse_mix(args.mix), args.rate, args.duration,
+                          args.concurrency, args.warmup, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report["server"] = args.server
+    report["workers"] = args.workers
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for feature extraction and detector scoring
+
+Times the hot paths of TransactionFeatureExtractor and DeFiAnomalyDetector
+on seeded synthetic transactions (see benchmarks/synthetic.py) and records
+wall time (best of `--repeat` runs) and peak traced memory per benchmark
+and size. Setup work is excluded from both.
+
+Usage (from ml-models/):
+    python -m benchmarks.suite run --sizes 1k,100k,1M -o benchmarks/results.json
+    python -m benchmarks.suite compare baseline.json benchmarks/results.json --threshold 0.1
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import sklearn
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from benchmarks.synthetic import generate_transactions
+from src.features.transaction_batch import TransactionBatch
+from src.features.transaction_features import TransactionFeatureExtractor
+from src.models.anomaly_detector import DeFiAnomalyDetector
+
+# Per-row APIs are timed on at most this many rows
+SINGLE_ROWS = 10_000
+
+# The detector used by scoring benchmarks is trained on at most this many rows
+SCORING_TRAIN_ROWS = 100_000
+
+def _extractor(batch: TransactionBatch) -> TransactionFeatureExtractor:
+    extractor = TransactionFeatureExtractor()
+    extractor.update_address_profiles(batch)
+    return extractor
+
+def _records(batch: TransactionBatch, n: int) -> List[Dict]:
+    return [
+        {'from': sender, 'to': recipient, 'value': value, 'gasPrice': gas_price, 'gasUsed': gas_used}
+        for sender, recipient, value, gas_price, gas_used in zip(
+            batch.senders[:n], batch.recipients[:n], batch.value[:n], batch.gas_price[:n], batch.gas_used[:n])
+    ]
+
+def _detector(batch: TransactionBatch) -> Tuple[DeFiAnomalyDetector, np.ndarray]:
+    features = _extractor(batch).extract_basic_features_batch(batch)
+    detector = DeFiAnomalyDetector()
+    detector.train(features[:SCORING_TRAIN_ROWS])
+    return detector, features
+
+def bench_extract_basic_features(batch):
+    extractor = _extractor(batch)
+    return len(batch), lambda: extractor.extract_basic_features_batch(batch)
+
+def bench_extract_basic_features_single(batch):
+    extractor = _extractor(batch)
+    records = _records(batch, SINGLE_ROWS)
+    return len(records), lambda: [extractor.extract_basic_features(record) for record in records]
+
+def bench_extract_temporal_features(batch):
+    extractor = TransactionFeatureExtractor()
+    return len(batch), lambda: extractor.extract_temporal_features(batch)
+
+def bench_extract_network_features(batch):
+    extractor = TransactionFeatureExtractor()
+    return len(batch), lambda: extractor.extract_network_features(batch)
+
+def bench_update_address_profiles(batch):
+    return len(batch), lambda: TransactionFeatureExtractor().update_address_profiles(batch)
+
+def bench_train(batch):
+    features = _extractor(batch).extract_basic_features_batch(batch)
+    return len(batch), lambda: DeFiAnomalyDetector().train(features)
+
+def bench_get_anomaly_score(batch):
+    detector, features = _detector(batch)
+    rows = features[:SINGLE_ROWS]
+    return len(rows), lambda: [detector.get_anomaly_score(row) for row in rows]
+
+def bench_score_batch(batch):
+    detector, features = _detector(batch)
+    return len(features), lambda: detector.score_batch(features)
+
+# name -> setup(batch) returning (rows processed, timed callable)
+BENCHMARKS: Dict[str, Callable] = {
+    'extract_basic_features': bench_extract_basic_features,
+    'extract_basic_features_single': bench_extract_basic_features_single,
+    'extract_temporal_features': bench_extract_temporal_features,
+    'extract_network_features': bench_extract_network_features,
+    'update_address_profiles': bench_update_address_profiles,
+    'train': bench_train,
+    'get_anomaly_score': bench_get_anomaly_score,
+    'score_batch': bench_score_batch,
+}
+
+def parse_size(text: str) -> int:
+    """'1k' -> 1000, '1M' -> 1000000"""
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    text = text.strip().lower()
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+def measure(fn: Callable, repeat: int) -> Tuple[float, int]:
+    """
+    Best wall time over `repeat` runs, then peak traced memory of one extra run
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+def run_suite(sizes: Sequence[int], names: Sequence[str], repeat: int = 3, seed: int = 0) -> Dict:
+    results = []
+    for size in sizes:
+        batch = generate_transactions(size, seed=seed)
+        for name in names:
+            rows, fn = BENCHMARKS[name](batch)
+            seconds, peak = measure(fn, repeat)
+            results.append({
+                "name": name,
+                "size": size,
+                "rows": rows,
+                "seconds": seconds,
+                "rows_per_second": rows / seconds if seconds > 0 else None,
+                "peak_bytes": peak,
+            })
+            print(f"{name:32s} {size:>9d} {seconds * 1000:11.2f} ms {peak / 1e6:10.2f} MB", file=sys.stderr)
+    return {
+        "meta": {
+            "created": int(time.time()),
+            "seed": seed,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+            "machine": platform.platform(),
+        },
+        "results": results,
+    }
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.1, min_seconds: float = 0.001) -> List[Dict]:
+    """
+    Benchmarks whose time or peak memory grew by more than `threshold` (a fraction)
+
+    Timings where both runs are below `min_seconds` are too noisy to flag.
+    """
+    previous = {(r["name"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["name"], result["size"]))
+        if before is None:
+            continue
+        time_ratio = result["seconds"] / before["seconds"] if before["seconds"] else float('inf')
+        memory_ratio = result["peak_bytes"] / before["peak_bytes"] if before["peak_bytes"] else 1.0
+        slower = time_ratio > 1 + threshold and max(result["seconds"], before["seconds"]) >= min_seconds
+        larger = memory_ratio > 1 + threshold
+        flag = 'REGRESSION' if slower or larger else ''
+        print(f"{result['name']:32s} {result['size']:>9d} time x{time_ratio:6.2f} memory x{memory_ratio:6.2f} {flag}")
+        if flag:
+            regressions.append({**result, "time_ratio": time_ratio, "memory_ratio": memory_ratio})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Feature extraction and scoring benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the benchmarks and write JSON results")
+    run_parser.add_argument('--sizes', default='1k,100k,1M', help="Comma-separated transaction counts")
+    run_parser.add_argument('--only', help="Comma-separated benchmark names (default: all)")
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('-o', '--output', default='benchmarks/results.json')
+
+    compare_parser = commands.add_parser('compare', help="Flag regressions between two result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help="Allowed slowdown/growth (0.1 = 10%%)")
+    compare_parser.add_argument('--min-seconds', type=float, default=0.001)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        names = args.only.split(',') if args.only else list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+        report = run_suite([parse_size(size) for size in args.sizes.split(',')], names, args.repeat, args.seed)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold, args.min_seconds)
+    print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
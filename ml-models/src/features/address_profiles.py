@@ -0,0 +1,95 @@
+import hashlib
+from array import array
+from typing import Dict, Iterable, Optional
+
+class AddressProfileStore:
+    """
+    Per-address transaction counts backed by a global total counter.
+
+    Frequencies are derived lazily at read time (count / total), so ingesting a
+    transaction only touches the addresses it involves.
+
+    By default counts are exact: each address maps to a slot in a compact
+    int64 array. Passing `sketch_width` switches to a bounded count-min sketch
+    of `sketch_depth` x `sketch_width` counters, which caps memory regardless
+    of how many addresses are seen at the cost of slightly over-estimated
+    counts. Sketch cells come from a keyless hash of the address, so a
+    pickled sketch stays valid in another process.
+    """
+    __slots__ = ('total', '_index', '_counts', '_width', '_depth')
+
+    def __init__(self, sketch_width: Optional[int] = None, sketch_depth: int = 4):
+        self.total = 0
+        if sketch_width:
+            self._index: Optional[Dict[str, int]] = None
+            self._width = int(sketch_width)
+            self._depth = int(sketch_depth)
+            self._counts = array('q', bytes(8 * self._width * self._depth))
+        else:
+            self._index = {}
+            self._width = 0
+            self._depth = 0
+            self._counts = array('q')
+
+    @property
+    def bounded(self) -> bool:
+        """Whether the store uses the fixed-size count-min sketch"""
+        return self._index is None
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the count array"""
+        return len(self._counts) * self._counts.itemsize
+
+    def _sketch_cells(self, address: str):
+        # Double hashing derives one cell per sketch row from two hashes; str
+        # hash() is salted per process, which would break a restored sketch
+        digest = hashlib.blake2b(address.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        width = self._width
+        return [row * width + (h1 + row * h2) % width for row in range(self._depth)]
+
+    def add(self, address: str, count: int = 1) -> None:
+        """
+        Record `count` occurrences of an address
+        """
+        counts = self._counts
+        if self._index is None:
+            for cell in self._sketch_cells(address):
+                counts[cell] += count
+        else:
+            slot = self._index.get(address)
+            if slot is None:
+                self._index[address] = len(counts)
+                counts.append(count)
+            else:
+                counts[slot] += count
+        self.total += count
+
+    def update(self, addresses: Iterable[str]) -> None:
+        """
+        Record one occurrence for every address in the iterable
+        """
+        for address in addresses:
+            self.add(address)
+
+    def count(self, address: str) -> int:
+        """
+        Get the (possibly approximate) number of occurrences of an address
+        """
+        if self._index is None:
+            return min(self._counts[cell] for cell in self._sketch_cells(address))
+        slot = self._index.get(address)
+        return 0 if slot is None else self._counts[slot]
+
+    def frequency(self, address: str) -> float:
+        """
+        Get the share of all recorded occurrences that involve an address
+        """
+        if self.total == 0:
+            return 0.0
+        return self.count(address) / self.total
+
+    def __contains__(self, address: str) -> bool:
+        return self.count(address) > 0
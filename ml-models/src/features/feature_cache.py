@@ -0,0 +1,117 @@
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Set, Tuple
+
+CacheKey = Tuple[str, Hashable, Hashable]
+
+class FeatureCache:
+    """
+    LRU cache of feature vectors keyed by (address, window end, feature-set version).
+
+    Entries expire after `ttl_seconds` and the least recently used ones are
+    evicted once either `max_entries` or `max_bytes` (summed `nbytes` of the
+    cached arrays) is exceeded. `invalidate(address)` drops every entry for
+    an address, which callers do when new transactions for it are ingested.
+    All operations are thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 30.0,
+                 max_bytes: int = 64 * 1024 * 1024, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[CacheKey, Tuple[np.ndarray, float]]' = OrderedDict()
+        self._keys_by_address: Dict[str, Set[CacheKey]] = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: CacheKey) -> None:
+        vector, _ = self._entries.pop(key)
+        self.nbytes -= vector.nbytes
+        keys = self._keys_by_address.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_address[key[0]]
+
+    def get(self, address: str, window_end: Hashable = None, version: Hashable = None) -> Optional[np.ndarray]:
+        """
+        Return the cached vector, or None on a miss or expired entry
+        """
+        key = (address, window_end, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self._clock():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, address: str, window_end: Hashable, version: Hashable, vector: np.ndarray) -> None:
+        """
+        Cache a vector, evicting least recently used entries to stay within bounds
+        """
+        key = (address, window_end, version)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (vector, self._clock() + self.ttl_seconds)
+            self._keys_by_address.setdefault(address, set()).add(key)
+            self.nbytes += vector.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, address: str, window_end: Hashable, version: Hashable,
+                       compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Return the cached vector or compute, cache and return it
+        """
+        vector = self.get(address, window_end, version)
+        if vector is None:
+            vector = compute()
+            self.put(address, window_end, version, vector)
+        return vector
+
+    def invalidate(self, address: str) -> int:
+        """
+        Drop every cached entry for an address; returns how many were dropped
+        """
+        with self._lock:
+            keys = list(self._keys_by_address.get(address, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_address.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,185 @@
+import bisect
+import math
+import numpy as np
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.features.transaction_batch import TransactionBatch
+
+class _AddressWindow:
+    """Rolling statistics for one sender over its events inside the window"""
+    __slots__ = ('events', 'value_sum', 'gas_mean', 'gas_m2')
+
+    def __init__(self):
+        self.events = deque()
+        self.value_sum = 0.0
+        self.gas_mean = 0.0
+        self.gas_m2 = 0.0
+
+    def push(self, timestamp: float, value: float, gas_price: float) -> None:
+        # Welford update
+        self.events.append((timestamp, value, gas_price))
+        n = len(self.events)
+        delta = gas_price - self.gas_mean
+        self.gas_mean += delta / n
+        self.gas_m2 += delta * (gas_price - self.gas_mean)
+        self.value_sum += value
+
+    def pop_oldest(self) -> None:
+        # Inverse Welford update
+        _, value, gas_price = self.events.popleft()
+        n = len(self.events)
+        self.value_sum -= value
+        if n == 0:
+            self.value_sum = self.gas_mean = self.gas_m2 = 0.0
+            return
+        old_mean = self.gas_mean
+        self.gas_mean = (old_mean * (n + 1) - gas_price) / n
+        self.gas_m2 = max(self.gas_m2 - (gas_price - old_mean) * (gas_price - self.gas_mean), 0.0)
+
+    def expire(self, cutoff: float) -> None:
+        while self.events and self.events[0][0] < cutoff:
+            self.pop_oldest()
+
+class StreamingTemporalFeatures:
+    """
+    Incremental per-sender temporal features over a sliding time window.
+
+    Each transaction updates its sender's running sums in amortized O(1) and
+    expired events are dropped from the front of the window, so a live stream
+    can be featurized without re-aggregating history. Events for a given
+    sender are expected to arrive in timestamp order.
+
+    Feature rows match `TransactionFeatureExtractor.extract_temporal_features`:
+    transaction frequency (per hour), value velocity (mean value) and gas price
+    volatility (sample standard deviation). Frequency and volatility are 0.0
+    until a sender has two distinct timestamps / two events in the window.
+    """
+
+    # prune_if_grown waits for at least this many tracked senders
+    PRUNE_MIN_SENDERS = 1024
+
+    def __init__(self, window_seconds: Optional[float] = 3600.0):
+        # window_seconds=None keeps every event (unbounded window)
+        self.window_seconds = window_seconds
+        self._windows: Dict[str, _AddressWindow] = {}
+        self._prune_at = self.PRUNE_MIN_SENDERS
+
+    def update(self, transaction: Dict) -> None:
+        """
+        Add one transaction to its sender's window
+        """
+        self.push(
+            transaction['from'],
+            float(transaction['timestamp']),
+            float(transaction['value']),
+            float(transaction['gasPrice'])
+        )
+
+    def push(self, address: str, timestamp: float, value: float, gas_price: float) -> None:
+        """
+        Add one already-decoded event to a sender's window
+        """
+        window = self._windows.get(address)
+        if window is None:
+            window = self._windows[address] = _AddressWindow()
+        window.push(timestamp, value, gas_price)
+        if self.window_seconds is not None:
+            window.expire(timestamp - self.window_seconds)
+
+    def update_many(self, transactions: Iterable[Dict]) -> None:
+        """
+        Add a sequence of transactions in arrival order
+        """
+        for tx in transactions:
+            self.update(tx)
+
+    def update_batch(self, batch: TransactionBatch) -> None:
+        """
+        Add every transaction of a `TransactionBatch` in row order
+        """
+        for address, timestamp, value, gas_price in zip(
+            batch.senders.tolist(), batch.timestamp.tolist(),
+            batch.value.tolist(), batch.gas_price.tolist()
+        ):
+            self.push(address, timestamp, value, gas_price)
+
+    def get_features(self, address: str, now: Optional[float] = None) -> np.ndarray:
+        """
+        Get [tx_frequency, value_velocity, gas_volatility] for a sender
+
+        If `now` is given, the features cover the sender's events in
+        [now - window_seconds, now]. Reading never changes the state, so a
+        query for a past or future `now` does not affect later ones. Unknown
+        senders get a row of zeros.
+        """
+        window = self._windows.get(address)
+        if window is None:
+            return np.zeros(3)
+        events = window.events
+        start, stop = 0, len(events)
+        if now is not None and events:
+            # Events of a sender are in timestamp order; (t,) sorts before any (t, ...)
+            if self.window_seconds is not None and events[0][0] < now - self.window_seconds:
+                start = bisect.bisect_left(events, (now - self.window_seconds,))
+            if events[-1][0] > now:
+                stop = bisect.bisect_right(events, (now, math.inf), lo=start)
+
+        n = stop - start
+        if n <= 0:
+            return np.zeros(3)
+        if n < len(events):
+            # Part of the window: aggregate the slice instead of the running sums
+            _, values, gas_prices = np.array(list(islice(events, start, stop)), dtype=np.float64).T
+            value_sum = float(values.sum())
+            gas_m2 = float(((gas_prices - gas_prices.mean()) ** 2).sum())
+        else:
+            value_sum, gas_m2 = window.value_sum, window.gas_m2
+
+        span_hours = (events[stop - 1][0] - events[start][0]) / 3600
+        tx_frequency = n / span_hours if span_hours > 0 else 0.0
+        value_velocity = value_sum / n
+        gas_volatility = float(np.sqrt(gas_m2 / (n - 1))) if n > 1 else 0.0
+        return np.array([tx_frequency, value_velocity, gas_volatility])
+
+    def feature_rows(self, addresses: Optional[List[str]] = None,
+                     now: Optional[float] = None) -> Tuple[List[str], np.ndarray]:
+        """
+        Get feature rows for the given senders (all tracked senders by default)
+        """
+        if addresses is None:
+            addresses = list(self._windows)
+        if not addresses:
+            return [], np.empty((0, 3))
+        return addresses, np.vstack([self.get_features(addr, now) for addr in addresses])
+
+    def prune(self, now: float) -> int:
+        """
+        Drop senders with no events left in the window; returns how many were dropped
+        """
+        if self.window_seconds is None:
+            return 0
+        cutoff = now - self.window_seconds
+        idle = [addr for addr, window in self._windows.items()
+                if not window.events or window.events[-1][0] < cutoff]
+        for addr in idle:
+            del self._windows[addr]
+        return len(idle)
+
+    def prune_if_grown(self, now: float) -> int:
+        """
+        Prune once the number of tracked senders has doubled since the last
+        prune, so idle senders are dropped at amortized O(1) cost per update
+        """
+        if len(self._windows) < self._prune_at:
+            return 0
+        dropped = self.prune(now)
+        self._prune_at = max(self.PRUNE_MIN_SENDERS, 2 * len(self._windows))
+        return dropped
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._windows
@@ -0,0 +1,174 @@
+import json
+import numpy as np
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Up to this many addresses, a dict lookup is faster than importing and calling pandas
+SMALL_FACTORIZE_SIZE = 4096
+
+def factorize(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Integer codes and unique values in order of first appearance, like pd.factorize
+
+    Request-sized inputs are encoded with a dict, so the serving path does not
+    need pandas; large inputs import it on first use.
+    """
+    if len(values) > SMALL_FACTORIZE_SIZE:
+        import pandas as pd
+        codes, uniques = pd.factorize(values)
+        return codes, np.asarray(uniques, dtype=object)
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values),
+                        dtype=np.int64, count=len(values))
+    uniques = np.empty(len(index), dtype=object)
+    uniques[:] = list(index)
+    return codes, uniques
+
+class TransactionBatch:
+    """
+    Columnar batch of transactions backed by NumPy arrays.
+
+    Addresses are dictionary-encoded: `from_ids` and `to_ids` are integer
+    indices into the `addresses` vocabulary, assigned in order of first
+    appearance (senders first, then recipients). Numeric columns are float64;
+    optional columns that are missing from the input are filled with NaN.
+    """
+    NUMERIC_COLUMNS = {
+        'value': 'value',
+        'gas_price': 'gasPrice',
+        'gas_used': 'gasUsed',
+        'timestamp': 'timestamp',
+    }
+
+    def __init__(self, addresses: np.ndarray, from_ids: np.ndarray, to_ids: np.ndarray,
+                 value: np.ndarray, gas_price: np.ndarray, gas_used: np.ndarray,
+                 timestamp: np.ndarray, hashes: Optional[np.ndarray] = None):
+        self.addresses = addresses
+        self.from_ids = from_ids
+        self.to_ids = to_ids
+        self.value = value
+        self.gas_price = gas_price
+        self.gas_used = gas_used
+        self.timestamp = timestamp
+        self.hashes = hashes
+
+    def __len__(self) -> int:
+        return len(self.from_ids)
+
+    @property
+    def n_addresses(self) -> int:
+        return len(self.addresses)
+
+    @property
+    def senders(self) -> np.ndarray:
+        """Sender address for every transaction"""
+        return self.addresses[self.from_ids]
+
+    @property
+    def recipients(self) -> np.ndarray:
+        """Recipient address for every transaction"""
+        return self.addresses[self.to_ids]
+
+    @classmethod
+    def _from_columns(cls, senders, recipients, numeric: Dict[str, Optional[np.ndarray]],
+                      hashes=None) -> 'TransactionBatch':
+        n = len(senders)
+        codes, uniques = factorize(np.concatenate([
+            np.asarray(senders, dtype=object),
+            np.asarray(recipients, dtype=object)
+        ]))
+        columns = {
+            name: np.full(n, np.nan) if values is None else np.asarray(values, dtype=np.float64)
+            for name, values in numeric.items()
+        }
+        return cls(
+            addresses=uniques,
+            from_ids=codes[:n].astype(np.int64),
+            to_ids=codes[n:].astype(np.int64),
+            hashes=None if hashes is None else np.asarray(hashes, dtype=object),
+            **columns
+        )
+
+    @classmethod
+    def from_records(cls, transactions: List[Dict]) -> 'TransactionBatch':
+        """
+        Build a batch from a list of transaction dicts (the JSON/RPC shape)
+        """
+        if not transactions:
+            return cls.empty()
+        first = transactions[0]
+        numeric = {
+            name: [tx[key] for tx in transactions] if key in first else None
+            for name, key in cls.NUMERIC_COLUMNS.items()
+        }
+        hashes = [tx.get('hash') for tx in transactions] if 'hash' in first else None
+        return cls._from_columns(
+            [tx['from'] for tx in transactions],
+            [tx['to'] for tx in transactions],
+            numeric,
+            hashes
+        )
+
+    @classmethod
+    def from_frame(cls, df: 'pd.DataFrame') -> 'TransactionBatch':
+        """
+        Build a batch from a DataFrame with from/to/value/gasPrice/gasUsed/timestamp columns
+        """
+        import pandas as pd
+        numeric = {
+            name: pd.to_numeric(df[key]).to_numpy(dtype=np.float64) if key in df.columns else None
+            for name, key in cls.NUMERIC_COLUMNS.items()
+        }
+        hashes = df['hash'].to_numpy(dtype=object) if 'hash' in df.columns else None
+        return cls._from_columns(df['from'].to_numpy(dtype=object), df['to'].to_numpy(dtype=object), numeric, hashes)
+
+    @classmethod
+    def from_json(cls, source: Union[str, bytes]) -> 'TransactionBatch':
+        """
+        Build a batch from a JSON array or newline-delimited JSON text
+        """
+        if isinstance(source, bytes):
+            source = source.decode('utf-8')
+        text = source.strip()
+        if text.startswith('['):
+            return cls.from_records(json.loads(text))
+        return cls.from_records([json.loads(line) for line in text.splitlines() if line.strip()])
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs) -> 'TransactionBatch':
+        """
+        Build a batch from a CSV file
+        """
+        import pandas as pd
+        return cls.from_frame(pd.read_csv(path, **kwargs))
+
+    @classmethod
+    def from_parquet(cls, path: str, **kwargs) -> 'TransactionBatch':
+        """
+        Build a batch from a Parquet file (requires pyarrow or fastparquet)
+        """
+        import pandas as pd
+        return cls.from_frame(pd.read_parquet(path, **kwargs))
+
+    @classmethod
+    def empty(cls) -> 'TransactionBatch':
+        return cls(
+            addresses=np.empty(0, dtype=object),
+            from_ids=np.empty(0, dtype=np.int64),
+            to_ids=np.empty(0, dtype=np.int64),
+            value=np.empty(0),
+            gas_price=np.empty(0),
+            gas_used=np.empty(0),
+            timestamp=np.empty(0)
+        )
+
+    @classmethod
+    def coerce(cls, transactions: Union['TransactionBatch', List[Dict]]) -> 'TransactionBatch':
+        """
+        Return `transactions` unchanged if it is already a batch, else build one from records
+        """
+        if isinstance(transactions, cls):
+            return transactions
+        return cls.from_records(transactions)
@@ -1,11 +1,89 @@
-import pandas as pd
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional, Union
+
+from src.features.address_profiles import AddressProfileStore
+from src.features.feature_cache import FeatureCache
+from src.features.temporal_features import StreamingTemporalFeatures
+from src.features.transaction_batch import TransactionBatch
+from src.features.transaction_graph import TransactionGraphIndex
+
+Transactions = Union[TransactionBatch, List[Dict]]
 
 class TransactionFeatureExtractor:
-    def __init__(self):
-        self.historical_transactions = pd.DataFrame()
-        self.address_profiles = {}
+    # Bump whenever the layout of address_features() changes so cached vectors are not reused
+    FEATURE_SET_VERSION = 1
+    
+    def __init__(self, profile_sketch_width: Optional[int] = None,
+                 temporal_window_seconds: Optional[float] = 3600.0,
+                 feature_cache: Optional[FeatureCache] = None,
+                 graph_max_edges: Optional[int] = None):
+        # Pass profile_sketch_width to bound profile memory with a count-min sketch
+        self.address_profiles = AddressProfileStore(sketch_width=profile_sketch_width)
+        self.temporal_stream = StreamingTemporalFeatures(window_seconds=temporal_window_seconds)
+        # Persistent multi-batch transaction graph (see extract_graph_index_features);
+        # graph_max_edges keeps only the most recently active edges
+        self.graph_index = TransactionGraphIndex(max_edges=graph_max_edges)
+        self.feature_cache = feature_cache if feature_cache is not None else FeatureCache()
+        
+    def ingest(self, transactions: Transactions) -> TransactionBatch:
+        """
+        Add transactions to every piece of persistent state (address profiles,
+        temporal windows, graph index) and invalidate the cached features
+        they change: those of the addresses they touch, and those of every
+        address whose two-hop fan-out runs through a sender that gained a
+        new recipient. A graph eviction clears the whole cache.
+        """
+        batch = TransactionBatch.coerce(transactions)
+        self._add_to_profiles(batch)
+        self._add_to_temporal_stream(batch)
+        self._invalidate(batch, self._add_to_graph_index(batch))
+        return batch
+
+    def _add_to_profiles(self, batch: TransactionBatch) -> None:
+        counts = (np.bincount(batch.from_ids, minlength=batch.n_addresses)
+                  + np.bincount(batch.to_ids, minlength=batch.n_addresses))
+        for addr, count in zip(batch.addresses.tolist(), counts.tolist()):
+            if count:
+                self.address_profiles.add(addr, count)
+
+    def _add_to_temporal_stream(self, batch: TransactionBatch) -> None:
+        self.temporal_stream.update_batch(batch)
+        timestamps = batch.timestamp[np.isfinite(batch.timestamp)]
+        if len(timestamps):
+            self.temporal_stream.prune_if_grown(float(timestamps.max()))
+
+    def _add_to_graph_index(self, batch: TransactionBatch) -> Optional[np.ndarray]:
+        # Nodes that gained a recipient, or None if the graph evicted edges
+        evictions = self.graph_index.evictions
+        grown = self.graph_index.update(batch)
+        return None if self.graph_index.evictions != evictions else grown
+
+    def _invalidate(self, batch: TransactionBatch, grown: Optional[np.ndarray] = ()) -> None:
+        """Drop cached features of the batch's addresses and of `grown`'s fan-out dependents (None: all)"""
+        if grown is None:
+            self.feature_cache.clear()
+            return
+        stale = set(batch.addresses.tolist())
+        stale.update(self.graph_index.fanout_dependents(grown))
+        for address in stale:
+            self.feature_cache.invalidate(address)
+        
+    def address_features(self, address: str, window_end: Optional[float] = None) -> np.ndarray:
+        """
+        Feature vector for an address from ingested state: temporal features
+        as a sender, graph index features and address frequency
+
+        The temporal and graph columns are served from the feature cache when
+        possible. Frequency is a share of all ingested transactions, so it
+        changes with every ingest and is always read fresh.
+        """
+        def compute():
+            return np.concatenate([
+                self.temporal_stream.get_features(address, now=window_end),
+                self.graph_index.features([address])[0]
+            ])
+        cached = self.feature_cache.get_or_compute(address, window_end, self.FEATURE_SET_VERSION, compute)
+        return np.append(cached, self._get_address_frequency(address))
         
     def extract_basic_features(self, transaction: Dict) -> np.ndarray:
         """
@@ -19,80 +97,138 @@ class TransactionFeatureExtractor:
             self._get_address_frequency(transaction['to'])
         ])
         
-    def extract_temporal_features(self, transactions: List[Dict]) -> np.ndarray:
+    def extract_basic_features_batch(self, transactions: Transactions) -> np.ndarray:
         """
-        Extract temporal features from a sequence of transactions
+        Extract basic features for every transaction in a batch (N x 5)
         """
-        df = pd.DataFrame(transactions)
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
+        batch = TransactionBatch.coerce(transactions)
+        # One profile lookup per distinct address, then gather per transaction
+        frequencies = np.array([self._get_address_frequency(addr) for addr in batch.addresses], dtype=np.float64)
+        return np.column_stack([
+            batch.value,
+            batch.gas_price,
+            batch.gas_used,
+            frequencies[batch.from_ids],
+            frequencies[batch.to_ids]
+        ])
         
-        # Time-based features
-        features = []
-        for _, group in df.groupby('from'):
-            group = group.sort_values('timestamp')
-            
-            # Transaction frequency
-            tx_frequency = len(group) / (
-                (group['timestamp'].max() - group['timestamp'].min()).total_seconds() / 3600
-            )
-            
-            # Value velocity
-            value_velocity = group['value'].astype(float).sum() / len(group)
-            
-            # Gas price volatility
-            gas_volatility = group['gasPrice'].astype(float).std()
-            
-            features.append([tx_frequency, value_velocity, gas_volatility])
+    def extract_temporal_features(self, transactions: Transactions) -> np.ndarray:
+        """
+        Extract temporal features from a sequence of transactions
+
+        Returns one row per sender, ordered by sender address.
+        """
+        batch = TransactionBatch.coerce(transactions)
+        if len(batch) == 0:
+            return np.empty((0, 3))
             
-        return np.array(features)
+        # Group transactions by sender with one stable sort
+        order = np.argsort(batch.from_ids, kind='stable')
+        sender_ids, starts, counts = np.unique(batch.from_ids[order], return_index=True, return_counts=True)
+        timestamps = batch.timestamp[order]
+        
+        # Transaction frequency (undefined for a single timestamp)
+        span_hours = (np.maximum.reduceat(timestamps, starts) - np.minimum.reduceat(timestamps, starts)) / 3600
+        tx_frequency = np.divide(counts, span_hours, out=np.zeros(len(counts)), where=span_hours > 0)
+        
+        # Value velocity
+        value_velocity = np.add.reduceat(batch.value[order], starts) / counts
         
-    def extract_network_features(self, transactions: List[Dict]) -> np.ndarray:
+        # Gas price volatility (undefined for a single transaction)
+        gas_prices = batch.gas_price[order]
+        gas_mean = np.add.reduceat(gas_prices, starts) / counts
+        squared_dev = (gas_prices - np.repeat(gas_mean, counts)) ** 2
+        gas_volatility = np.divide(
+            np.add.reduceat(squared_dev, starts), counts - 1,
+            out=np.zeros(len(counts)), where=counts > 1
+        )
+        np.sqrt(gas_volatility, out=gas_volatility)
+        
+        features = np.column_stack([tx_frequency, value_velocity, gas_volatility])
+        return features[np.argsort(batch.addresses[sender_ids], kind='stable')]
+        
+    def stream_temporal_features(self, transactions: Transactions) -> np.ndarray:
         """
-        Extract network-based features from transaction graph
+        Feed transactions into the sliding-window temporal engine and return
+        the updated feature rows for their senders, in order of first appearance
         """
-        # Create transaction graph
-        from_addresses = set()
-        to_addresses = set()
-        edges = set()
+        batch = TransactionBatch.coerce(transactions)
+        self._add_to_temporal_stream(batch)
+        self._invalidate(batch)
+        senders = list(batch.addresses[np.unique(batch.from_ids)])
+        return self.temporal_stream.feature_rows(senders)[1]
         
-        for tx in transactions:
-            from_addresses.add(tx['from'])
-            to_addresses.add(tx['to'])
-            edges.add((tx['from'], tx['to']))
+    def extract_network_features(self, transactions: Transactions, extended: bool = False) -> np.ndarray:
+        """
+        Extract network-based features from transaction graph
+
+        Returns one row per sending address, in order of first appearance:
+        out-degree, in-degree and graph density. With `extended`, two more
+        columns follow: out-degree weighted by value sent, and the ratio of
+        unique counterparties to transactions sent.
+        """
+        batch = TransactionBatch.coerce(transactions)
+        n_columns = 5 if extended else 3
+        if len(batch) == 0:
+            return np.empty((0, n_columns))
             
+        n_nodes = batch.n_addresses
+        src = batch.from_ids
+        dst = batch.to_ids
+        
+        # Unique (from, to) edges
+        edge_keys = np.unique(src * n_nodes + dst)
+        edge_src = edge_keys // n_nodes
+        edge_dst = edge_keys % n_nodes
+        
         # Calculate network metrics
-        out_degree = {addr: sum(1 for e in edges if e[0] == addr) for addr in from_addresses}
-        in_degree = {addr: sum(1 for e in edges if e[1] == addr) for addr in to_addresses}
-        
-        features = []
-        for addr in from_addresses:
-            features.append([
-                out_degree.get(addr, 0),
-                in_degree.get(addr, 0),
-                len(edges) / (len(from_addresses) * len(to_addresses))  # Graph density
-            ])
+        out_degree = np.bincount(edge_src, minlength=n_nodes)
+        in_degree = np.bincount(edge_dst, minlength=n_nodes)
+        
+        senders = np.unique(src)
+        n_recipients = len(np.unique(dst))
+        density = len(edge_keys) / (len(senders) * n_recipients) if n_recipients else 0.0
+        
+        features = [
+            out_degree[senders],
+            in_degree[senders],
+            np.full(len(senders), density)  # Graph density
+        ]
+        
+        if extended:
+            tx_count = np.bincount(src, minlength=n_nodes)[senders]
+            features.append(np.bincount(src, weights=batch.value, minlength=n_nodes)[senders])
+            features.append(out_degree[senders] / tx_count)
             
-        return np.array(features)
+        return np.column_stack(features).astype(float)
+        
+    def update_graph_index(self, transactions: Transactions) -> None:
+        """
+        Add transactions to the persistent graph index, invalidating the
+        cached features they change as `ingest` does
+        """
+        batch = TransactionBatch.coerce(transactions)
+        self._invalidate(batch, self._add_to_graph_index(batch))
+        
+    def extract_graph_index_features(self, addresses: List[str]) -> np.ndarray:
+        """
+        Extract multi-batch graph features for the given addresses from the
+        persistent graph index: out-degree, in-degree, value sent, value
+        received and 2-hop fan-out
+        """
+        return self.graph_index.features(addresses)
         
     def _get_address_frequency(self, address: str) -> float:
         """
         Get the frequency of an address in historical transactions
         """
-        return self.address_profiles.get(address, {}).get('frequency', 0.0)
+        return self.address_profiles.frequency(address)
         
-    def update_address_profiles(self, transactions: List[Dict]) -> None:
+    def update_address_profiles(self, transactions: Transactions) -> None:
         """
-        Update address profiles with new transactions
+        Update address profiles with new transactions, invalidating the
+        cached features of the addresses they touch
         """
-        for tx in transactions:
-            for addr in [tx['from'], tx['to']]:
-                if addr not in self.address_profiles:
-                    self.address_profiles[addr] = {'count': 0, 'frequency': 0.0}
-                self.address_profiles[addr]['count'] += 1
-                
-        # Update frequencies
-        total_tx = sum(profile['count'] for profile in self.address_profiles.values())
-        for addr in self.address_profiles:
-            self.address_profiles[addr]['frequency'] = (
-                self.address_profiles[addr]['count'] / total_tx
-            ) 
\ No newline at end of file
+        batch = TransactionBatch.coerce(transactions)
+        self._add_to_profiles(batch)
+        self._invalidate(batch)
@@ -0,0 +1,301 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from src.features.transaction_batch import TransactionBatch
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    """Return `array` with capacity for at least `size` entries (doubling)"""
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+class _Adjacency:
+    """
+    Append-only adjacency: a compacted CSR for older edges plus per-node lists
+    for edges added since the last compaction
+    """
+
+    def __init__(self):
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int64)
+        self.compacted_edges = 0
+        self.pending: Dict[int, List[int]] = {}
+        self.pending_count = 0
+
+    def append(self, node: int, neighbor: int) -> None:
+        self.pending.setdefault(node, []).append(neighbor)
+        self.pending_count += 1
+
+    def neighbors(self, node: int) -> np.ndarray:
+        if node + 1 < len(self.indptr):
+            base = self.indices[self.indptr[node]:self.indptr[node + 1]]
+        else:
+            base = self.indices[:0]
+        extra = self.pending.get(node)
+        if extra:
+            return np.concatenate([base, np.asarray(extra, dtype=np.int64)])
+        return base
+
+    def compact(self, sources: np.ndarray, targets: np.ndarray, n_nodes: int) -> None:
+        # Counting sort of all edges by source node: O(E + V)
+        order = np.argsort(sources, kind='stable')
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=n_nodes))])
+        self.indices = targets[order]
+        self.compacted_edges = len(sources)
+        self.pending = {}
+        self.pending_count = 0
+
+class TransactionGraphIndex:
+    """
+    Persistent, incrementally updated transaction graph.
+
+    Addresses get stable integer node ids. Each distinct (from, to) edge is
+    stored once in append-only arrays with its transaction count and total
+    value; per-node distinct in/out degrees and value totals are maintained
+    as batches arrive. Out- and in-adjacency are kept as a CSR that is
+    rebuilt only once the edges appended since the last rebuild exceed
+    `compact_fraction` of the graph, so ingest is amortized O(1) per edge and
+    neighbour queries cost O(degree).
+
+    With `max_edges`, the graph is a sliding window over recent activity:
+    once it holds more edges than that, the least recently used edges are
+    dropped down to `retain_fraction` of the cap and the index is rebuilt
+    from the rest, along with addresses left without edges. An evicted
+    edge that shows up again starts counting from zero. `evictions` counts
+    these rebuilds.
+    """
+    FEATURE_COLUMNS = ('out_degree', 'in_degree', 'out_value', 'in_value', 'two_hop_fanout')
+
+    def __init__(self, compact_fraction: float = 0.25, compact_min_edges: int = 1024,
+                 max_edges: Optional[int] = None, retain_fraction: float = 0.75):
+        self.compact_fraction = compact_fraction
+        self.compact_min_edges = compact_min_edges
+        self.max_edges = max_edges
+        self.retain_fraction = retain_fraction
+        self._node_ids: Dict[str, int] = {}
+        self._addresses: List[str] = []
+        self._edge_ids: Dict[int, int] = {}
+        self.n_nodes = 0
+        self.n_edges = 0
+        self.batches = 0
+        self.evictions = 0
+        self.edge_src = np.zeros(1024, dtype=np.int64)
+        self.edge_dst = np.zeros(1024, dtype=np.int64)
+        self.edge_count = np.zeros(1024, dtype=np.int64)
+        self.edge_value = np.zeros(1024, dtype=np.float64)
+        # Batch number of each edge's latest transaction, for eviction
+        self.edge_seen = np.zeros(1024, dtype=np.int64)
+        self.out_degree = np.zeros(1024, dtype=np.int64)
+        self.in_degree = np.zeros(1024, dtype=np.int64)
+        self.out_value = np.zeros(1024, dtype=np.float64)
+        self.in_value = np.zeros(1024, dtype=np.float64)
+        self._out = _Adjacency()
+        self._in = _Adjacency()
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._node_ids
+
+    def node_id(self, address: str) -> Optional[int]:
+        return self._node_ids.get(address)
+
+    def address(self, node: int) -> str:
+        return self._addresses[node]
+
+    def _ensure_nodes(self, addresses: Sequence[str]) -> np.ndarray:
+        ids = np.empty(len(addresses), dtype=np.int64)
+        for i, address in enumerate(addresses):
+            node = self._node_ids.get(address)
+            if node is None:
+                node = self._node_ids[address] = self.n_nodes
+                self._addresses.append(address)
+                self.n_nodes += 1
+            ids[i] = node
+        for name in ('out_degree', 'in_degree', 'out_value', 'in_value'):
+            setattr(self, name, _grow(getattr(self, name), self.n_nodes))
+        return ids
+
+    def update(self, transactions: Union[TransactionBatch, List[Dict]]) -> np.ndarray:
+        """
+        Add a batch of transactions to the graph
+
+        Returns the node ids that gained new recipients, whose in-neighbours'
+        two-hop fan-out may have changed (see `fanout_dependents`). Ids are
+        only valid until the next eviction.
+        """
+        batch = TransactionBatch.coerce(transactions)
+        if len(batch) == 0:
+            return np.empty(0, dtype=np.int64)
+        self.batches += 1
+        node_map = self._ensure_nodes(batch.addresses.tolist())
+        src = node_map[batch.from_ids]
+        dst = node_map[batch.to_ids]
+        values = np.nan_to_num(batch.value)
+
+        # Aggregate the batch per distinct edge before touching the index
+        keys, inverse = np.unique((src << 32) | dst, return_inverse=True)
+        counts = np.bincount(inverse)
+        totals = np.bincount(inverse, weights=values)
+
+        edge_ids = np.empty(len(keys), dtype=np.int64)
+        new_edges = []
+        for i, key in enumerate(keys.tolist()):
+            edge = self._edge_ids.get(key)
+            if edge is None:
+                edge = self._edge_ids[key] = self.n_edges + len(new_edges)
+                new_edges.append(key)
+            edge_ids[i] = edge
+
+        if new_edges:
+            new_keys = np.asarray(new_edges, dtype=np.int64)
+            new_src = new_keys >> 32
+            new_dst = new_keys & 0xFFFFFFFF
+            start, end = self.n_edges, self.n_edges + len(new_edges)
+            for name in ('edge_src', 'edge_dst', 'edge_count', 'edge_value', 'edge_seen'):
+                setattr(self, name, _grow(getattr(self, name), end))
+            self.edge_src[start:end] = new_src
+            self.edge_dst[start:end] = new_dst
+            self.n_edges = end
+            np.add.at(self.out_degree, new_src, 1)
+            np.add.at(self.in_degree, new_dst, 1)
+            for s, d in zip(new_src.tolist(), new_dst.tolist()):
+                self._out.append(s, d)
+                self._in.append(d, s)
+            self._maybe_compact()
+
+        self.edge_count[edge_ids] += counts
+        self.edge_value[edge_ids] += totals
+        self.edge_seen[edge_ids] = self.batches
+        np.add.at(self.out_value, src, values)
+        np.add.at(self.in_value, dst, values)
+
+        grown = np.unique(np.asarray(new_edges, dtype=np.int64) >> 32)
+        if self.max_edges is not None and self.n_edges > self.max_edges:
+            grown_addresses = [self._addresses[node] for node in grown.tolist()]
+            self._evict(int(self.max_edges * self.retain_fraction))
+            grown = np.array([self._node_ids[a] for a in grown_addresses if a in self._node_ids], dtype=np.int64)
+        return grown
+
+    def _evict(self, keep: int) -> None:
+        """
+        Rebuild the index from the `keep` most recently used edges
+        """
+        n = self.n_edges
+        kept = np.sort(np.argsort(self.edge_seen[:n], kind='stable')[n - keep:])
+        src, dst = self.edge_src[kept], self.edge_dst[kept]
+        count, value, seen = self.edge_count[kept], self.edge_value[kept], self.edge_seen[kept]
+
+        # Renumber the nodes that still have edges, in their old order
+        nodes = np.unique(np.concatenate([src, dst]))
+        src, dst = np.searchsorted(nodes, src), np.searchsorted(nodes, dst)
+        self._addresses = [self._addresses[node] for node in nodes.tolist()]
+        self._node_ids = {address: node for node, address in enumerate(self._addresses)}
+        self.n_nodes = len(nodes)
+        self._edge_ids = {key: edge for edge, key in enumerate(((src << 32) | dst).tolist())}
+        self.n_edges = keep
+
+        capacity = max(1024, keep)
+        for name, kept_values in (('edge_src', src), ('edge_dst', dst), ('edge_count', count),
+                                  ('edge_value', value), ('edge_seen', seen)):
+            array = np.zeros(capacity, dtype=kept_values.dtype)
+            array[:keep] = kept_values
+            setattr(self, name, array)
+        capacity = max(1024, self.n_nodes)
+        self.out_degree = _grow(np.bincount(src, minlength=self.n_nodes), capacity)
+        self.in_degree = _grow(np.bincount(dst, minlength=self.n_nodes), capacity)
+        self.out_value = _grow(np.bincount(src, weights=value, minlength=self.n_nodes), capacity)
+        self.in_value = _grow(np.bincount(dst, weights=value, minlength=self.n_nodes), capacity)
+        self._out.compact(src, dst, self.n_nodes)
+        self._in.compact(dst, src, self.n_nodes)
+        self.evictions += 1
+
+    def _maybe_compact(self) -> None:
+        pending = self._out.pending_count
+        if pending >= max(self.compact_min_edges, self.compact_fraction * self.n_edges):
+            src = self.edge_src[:self.n_edges]
+            dst = self.edge_dst[:self.n_edges]
+            self._out.compact(src, dst, self.n_nodes)
+            self._in.compact(dst, src, self.n_nodes)
+
+    def out_neighbors(self, address: str) -> np.ndarray:
+        """Node ids this address has sent to"""
+        node = self._node_ids.get(address)
+        return self._out.neighbors(node) if node is not None else np.empty(0, dtype=np.int64)
+
+    def in_neighbors(self, address: str) -> np.ndarray:
+        """Node ids this address has received from"""
+        node = self._node_ids.get(address)
+        return self._in.neighbors(node) if node is not None else np.empty(0, dtype=np.int64)
+
+    def degree(self, address: str) -> Tuple[int, int]:
+        """
+        Distinct (out, in) counterparties of an address
+        """
+        node = self._node_ids.get(address)
+        if node is None:
+            return 0, 0
+        return int(self.out_degree[node]), int(self.in_degree[node])
+
+    def edge(self, sender: str, recipient: str) -> Tuple[int, float]:
+        """
+        Transaction count and total value sent from `sender` to `recipient`
+        """
+        src, dst = self._node_ids.get(sender), self._node_ids.get(recipient)
+        if src is None or dst is None:
+            return 0, 0.0
+        edge = self._edge_ids.get((src << 32) | dst)
+        if edge is None:
+            return 0, 0.0
+        return int(self.edge_count[edge]), float(self.edge_value[edge])
+
+    def fanout_dependents(self, nodes: np.ndarray) -> List[str]:
+        """
+        Addresses whose two-hop fan-out can change when `nodes` gain
+        recipients: the nodes themselves and everyone who sends to them
+        """
+        dependents = set()
+        for node in np.asarray(nodes).tolist():
+            dependents.add(node)
+            dependents.update(self._in.neighbors(node).tolist())
+        return [self._addresses[node] for node in dependents]
+
+    def two_hop_fanout(self, address: str, max_neighbors: int = 1000) -> int:
+        """
+        Number of distinct addresses reachable in one or two outgoing hops
+
+        Only the first `max_neighbors` direct recipients are expanded, which
+        bounds the cost for hub addresses.
+        """
+        node = self._node_ids.get(address)
+        if node is None:
+            return 0
+        first_hop = self._out.neighbors(node)
+        second_hop = [self._out.neighbors(n) for n in first_hop[:max_neighbors].tolist()]
+        reached = np.unique(np.concatenate([first_hop] + second_hop))
+        return int(len(reached) - np.count_nonzero(reached == node))
+
+    def counterparty_overlap(self, first: str, second: str) -> float:
+        """
+        Jaccard similarity of the counterparties (senders and recipients) of two addresses
+        """
+        a = np.union1d(self.out_neighbors(first), self.in_neighbors(first))
+        b = np.union1d(self.out_neighbors(second), self.in_neighbors(second))
+        union = len(np.union1d(a, b))
+        return len(np.intersect1d(a, b, assume_unique=True)) / union if union else 0.0
+
+    def features(self, addresses: Sequence[str], max_neighbors: int = 1000) -> np.ndarray:
+        """
+        One row per address with the columns in `FEATURE_COLUMNS`; unknown addresses get zeros
+        """
+        rows = np.zeros((len(addresses), len(self.FEATURE_COLUMNS)))
+        for i, address in enumerate(addresses):
+            node = self._node_ids.get(address)
+            if node is None:
+                continue
+            rows[i, 0] = self.out_degree[node]
+            rows[i, 1] = self.in_degree[node]
+            rows[i, 2] = self.out_value[node]
+            rows[i, 3] = self.in_value[node]
+            rows[i, 4] = self.two_hop_fanout(address, max_neighbors)
+        return rows
@@ -1,58 +1,206 @@
+import hashlib
+import os
+import time
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
-import joblib
+from pathlib import Path
+
+from src.models.flat_forest import FlatIsolationForest
+
+def model_digest(path):
+    """Content hash of a saved model file, recorded in its flat forest export"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# sklearn and joblib are imported on first use, so a detector built from an
+# exported flat forest (see load_model) can be served without either
 
 class DeFiAnomalyDetector:
-    def __init__(self):
-        self.isolation_forest = IsolationForest(
-            contamination=0.1,
-            random_state=42
-        )
-        self.scaler = StandardScaler()
+    # Batches up to this many rows are scored with the flat forest, larger ones
+    # with sklearn when a fitted forest is loaded: the flat forest avoids
+    # sklearn's fixed per-call overhead, sklearn's per-tree traversal wins on
+    # large batches (crossover measured around 500 rows, see tests/test_flat_forest.py)
+    FLAT_FOREST_MAX_ROWS = 512
+    
+    def __init__(self, flat_forest=None):
+        # Compiled pure-NumPy copy of the fitted forest (see uses_flat_forest)
+        self.flat_forest = flat_forest
+        # Optional callable(n_rows, seconds) notified after every score_batch call
+        self.score_observer = None
+        # Optional callable(detector, rows, scores) given every scored matrix, e.g. to feed online updates
+        self.sample_observer = None
+        self.isolation_forest = None
+        self.scaler = None
+        if flat_forest is None:
+            from sklearn.ensemble import IsolationForest
+            from sklearn.preprocessing import StandardScaler
+            self.isolation_forest = IsolationForest(
+                contamination=0.1,
+                random_state=42
+            )
+            self.scaler = StandardScaler()
+
+    def uses_flat_forest(self, n_rows):
+        """Whether a batch of `n_rows` is scored with the flat forest"""
+        if self.flat_forest is None:
+            return False
+        # Flat-only detectors (lite profile, online updates) have no fitted sklearn forest
+        fitted = getattr(self.isolation_forest, 'estimators_', None) is not None
+        return n_rows <= self.FLAT_FOREST_MAX_ROWS or not fitted
+
+    @property
+    def n_features(self):
+        """Number of input features the model was trained on"""
+        if self.flat_forest is not None:
+            return self.flat_forest.n_features
+        return int(self.isolation_forest.n_features_in_)
         
-    def preprocess_features(self, features):
+    def preprocess_features(self, features, fit=False):
         """
         Preprocess transaction features for anomaly detection
         Features include: transaction value, gas price, address activity frequency
+
+        The scaler is only fitted when `fit` is set (during training); scoring
+        reuses the fitted statistics via `transform`.
         """
-        return self.scaler.fit_transform(features)
+        if fit:
+            return self.scaler.fit_transform(features)
+        return self.scaler.transform(features)
         
     def train(self, transaction_data):
         """
         Train the anomaly detection model on historical transaction data
         """
-        processed_features = self.preprocess_features(transaction_data)
+        processed_features = self.preprocess_features(transaction_data, fit=True)
         self.isolation_forest.fit(processed_features)
+        self.compile_flat_forest()
+        
+    def compile_flat_forest(self):
+        """
+        Compile the fitted forest and scaler into flat NumPy arrays for fast scoring
+        """
+        self.flat_forest = FlatIsolationForest.from_sklearn(self.isolation_forest, self.scaler)
+        return self.flat_forest
         
     def predict(self, transaction):
         """
         Predict if a transaction is anomalous
         Returns: -1 for anomaly, 1 for normal
         """
-        processed = self.preprocess_features(transaction.reshape(1, -1))
-        return self.isolation_forest.predict(processed)[0]
+        return self.predict_batch(transaction.reshape(1, -1))[0]
         
     def get_anomaly_score(self, transaction):
         """
         Get anomaly score for a transaction
         Higher negative values indicate stronger anomalies
         """
-        processed = self.preprocess_features(transaction.reshape(1, -1))
-        return -self.isolation_forest.score_samples(processed)[0]
+        return self.score_batch(transaction.reshape(1, -1))[0]
+
+    def predict_batch(self, transactions):
+        """
+        Predict anomalies for an N x F matrix of transactions
+        Returns: array of -1 for anomaly, 1 for normal
+        """
+        transactions = np.asarray(transactions, dtype=np.float64)
+        if self.uses_flat_forest(len(transactions)):
+            return self.flat_forest.predict(transactions)
+        return self.isolation_forest.predict(self.preprocess_features(transactions))
+
+    def score_batch(self, transactions):
+        """
+        Get anomaly scores for an N x F matrix of transactions in one pass
+        Higher values indicate stronger anomalies
+        """
+        observer = self.score_observer
+        started = time.perf_counter() if observer is not None else 0.0
+        transactions = np.asarray(transactions, dtype=np.float64)
+        if self.uses_flat_forest(len(transactions)):
+            scores = -self.flat_forest.score_samples(transactions)
+        else:
+            scores = -self.isolation_forest.score_samples(self.preprocess_features(transactions))
+        if observer is not None:
+            observer(len(transactions), time.perf_counter() - started)
+        if self.sample_observer is not None:
+            self.sample_observer(self, transactions, scores)
+        return scores
+        
+    @staticmethod
+    def flat_forest_path(path):
+        """Path of the exported flat forest that accompanies a saved model"""
+        path = Path(path)
+        return path.with_name(path.stem + '.flat.npz')
         
-    def save_model(self, path):
-        """Save the trained model"""
+    def save_model(self, path, export_flat=True):
+        """
+        Save the trained model
+
+        With `export_flat`, the compiled forest is also written next to the
+        model (see `flat_forest_path`) so it can be served without sklearn.
+        Files are written to a temporary name and renamed into place, so a
+        server watching `path` never loads a half-written model.
+        """
+        import joblib
+        if self.isolation_forest is None:
+            raise ValueError("A detector loaded from a flat forest export cannot be saved as a full model")
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
         joblib.dump({
             'isolation_forest': self.isolation_forest,
             'scaler': self.scaler
-        }, path)
+        }, tmp_path)
+        digest = model_digest(tmp_path)
+        os.replace(tmp_path, path)
+        if export_flat:
+            flat_forest = self.flat_forest or self.compile_flat_forest()
+            flat_forest.source_digest = digest
+            flat_path = self.flat_forest_path(path)
+            tmp_flat_path = flat_path.with_name(f".{os.getpid()}.{flat_path.name}")
+            flat_forest.save(tmp_flat_path)
+            os.replace(tmp_flat_path, flat_path)
         
     @classmethod
-    def load_model(cls, path):
-        """Load a trained model"""
+    def load_model(cls, path, mmap_mode=None, flat_only=False):
+        """
+        Load a trained model
+
+        `mmap_mode` (e.g. 'r') is passed to joblib and also used for the exported
+        flat forest, so workers can share the model's arrays through the page
+        cache. The flat forest is recompiled if its export is missing or stale.
+
+        A `.npz` path, or `flat_only`, loads just the exported flat forest: the
+        detector can score but not be retrained, and sklearn, scipy and joblib
+        are never imported. With `flat_only` a missing or stale export is an
+        error rather than a reason to fall back to the full model.
+
+        An export is up to date when the model digest it records matches the
+        model file's content; timestamps are not trusted, since copies and
+        deploys do not preserve them.
+        """
+        path = Path(path)
+        if path.suffix == '.npz':
+            return cls(flat_forest=FlatIsolationForest.load(path, mmap_mode=mmap_mode))
+
+        flat_path = cls.flat_forest_path(path)
+        flat_forest = None
+        if flat_path.exists():
+            flat_forest = FlatIsolationForest.load(flat_path, mmap_mode=mmap_mode)
+            if flat_forest.source_digest != model_digest(path):
+                flat_forest = None
+        if flat_only:
+            if flat_forest is None:
+                raise FileNotFoundError(f"No up-to-date flat forest export at {flat_path}")
+            return cls(flat_forest=flat_forest)
+
+        import joblib
         model = cls()
-        saved_model = joblib.load(path)
+        saved_model = joblib.load(path, mmap_mode=mmap_mode)
         model.isolation_forest = saved_model['isolation_forest']
         model.scaler = saved_model['scaler']
-        return model 
\ No newline at end of file
+        
+        if flat_forest is not None:
+            model.flat_forest = flat_forest
+        else:
+            model.compile_flat_forest()
+        return model
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Offline backfill: score a historical transaction dump on all cores
+
+Reads a CSV or Parquet dump (ordered by time) in bounded chunks and shards
+it by sender address across worker processes, so each sender's temporal
+state lives in exactly one worker. Address frequencies and graph features
+depend on every transaction, so the coordinating process keeps that state
+for the whole dump and sends the values each shard needs along with its
+rows. Like the server, it bounds that state (a count-min sketch for
+frequencies, an edge cap for the graph), so it does not grow with the dump.
+Scores are therefore the same for any number of workers. Every worker
+scores its rows with the model and appends the results to its own columnar
+part files. Progress and throughput are logged while the run is going.
+
+Every `--checkpoint-rows` input rows the workers close their part files and
+save their temporal state, the coordinator saves the shared state, then the
+position in the dump is recorded in `checkpoint.json`. An interrupted run
+continues from there with `--resume`.
+
+Usage:
+    python -m src.models.backfill history.parquet -o backfill/ --model models/anomaly_detector.joblib
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from src.features.temporal_features import StreamingTemporalFeatures
+from src.features.transaction_batch import TransactionBatch
+from src.features.transaction_features import TransactionFeatureExtractor
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.models.batch_scoring import (ADDRESS_FEATURE_COUNT, BASIC_FEATURE_COUNT, model_feature_count,
+                                      score_transactions)
+from src.serving.model_manager import file_version
+
+logger = logging.getLogger('ml-backfill')
+
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# Extractor attributes kept by the coordinator for the whole dump
+SHARED_STATE_ATTRIBUTES = ('address_profiles', 'graph_index')
+
+def iter_transaction_frames(source, chunk_size: int = 100_000, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Yield DataFrame chunks of a transaction dump, starting after `skip_rows` rows
+    """
+    path = Path(source)
+    suffix = path.suffix.lower()
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        frames = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size))
+    elif suffix == '.csv':
+        # Skipped rows are not parsed at all
+        frames = pd.read_csv(path, chunksize=chunk_size, skiprows=range(1, skip_rows + 1))
+        skip_rows = 0
+    else:
+        raise ValueError(f"Unsupported transaction dump format: {path}")
+
+    for frame in frames:
+        if skip_rows >= len(frame):
+            skip_rows -= len(frame)
+            continue
+        if skip_rows:
+            frame = frame.iloc[skip_rows:]
+            skip_rows = 0
+        yield frame
+
+def shard_of(senders: np.ndarray, n_shards: int) -> np.ndarray:
+    """Stable shard index for each sender address (the same in every process and run)"""
+    return (pd.util.hash_array(np.asarray(senders, dtype=object)) % np.uint64(n_shards)).astype(np.int64)
+
+class _ShardWriter:
+    """Appends score columns to one part file per shard and checkpoint interval"""
+
+    def __init__(self, output_dir: Path, shard: int, part: int, output_format: str):
+        self.path = output_dir / f"shard-{shard:03d}-part-{part:05d}.{output_format}"
+        self.output_format = output_format
+        self._writer = None
+
+    def write(self, columns: Dict[str, np.ndarray]):
+        if self.output_format == 'csv':
+            pd.DataFrame(columns).to_csv(self.path, mode='a', header=self._writer is None, index=False)
+            self._writer = True
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({
+            name: pa.array(values, type=pa.string() if values.dtype == object else None)
+            for name, values in columns.items()
+        })
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self.output_format == 'parquet' and self._writer is not None:
+            self._writer.close()
+        self._writer = None
+
+def _state_path(output_dir: Path, shard: int, part: int) -> Path:
+    # Temporal state as of the start of `part`
+    return output_dir / f"shard-{shard:03d}-state-{part:05d}.pkl"
+
+def _shared_state_path(output_dir: Path, part: int) -> Path:
+    # Coordinator state as of the start of `part`
+    return output_dir / f"shared-state-{part:05d}.pkl"
+
+def _part_index(path: Path) -> int:
+    return int(path.name.split('-')[-1].split('.')[0])
+
+def _save_state(path: Path, state: Dict, pattern: str, part: int):
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    # Keep only the state the last two checkpoints can resume from
+    for old in path.parent.glob(pattern):
+        if _part_index(old) < part - 1:
+            old.unlink()
+
+class _ShardFeatures:
+    """
+    Feature source for one worker, used in place of a TransactionFeatureExtractor
+
+    Keeps the temporal windows of the shard's senders; frequencies and graph
+    features come from the coordinator with each chunk (see `use`).
+    """
+
+    def __init__(self, window_seconds: float):
+        self.temporal_stream = StreamingTemporalFeatures(window_seconds=window_seconds)
+        self._frequencies = None
+        self._senders = {}
+
+    def use(self, shared: Dict):
+        self._frequencies = shared['frequencies']
+        self._senders = shared['senders']
+
+    def ingest(self, batch: TransactionBatch) -> TransactionBatch:
+        self.temporal_stream.update_batch(batch)
+        timestamps = batch.timestamp[np.isfinite(batch.timestamp)]
+        if len(timestamps):
+            self.temporal_stream.prune_if_grown(float(timestamps.max()))
+        return batch
+
+    def extract_basic_features_batch(self, batch: TransactionBatch) -> np.ndarray:
+        return np.column_stack([batch.value, batch.gas_price, batch.gas_used, self._frequencies])
+
+    def address_features(self, address: str, window_end: Optional[float] = None) -> np.ndarray:
+        return np.concatenate([self.temporal_stream.get_features(address, now=window_end),
+                               self._senders[address]])
+
+class _SharedFeatures:
+    """Coordinator state: address frequencies and graph over the whole dump"""
+
+    def __init__(self, n_features: Optional[int], profile_sketch_width: Optional[int] = None,
+                 graph_max_edges: Optional[int] = None):
+        self.n_features = n_features
+        self.extractor = TransactionFeatureExtractor(profile_sketch_width=profile_sketch_width,
+                                                     graph_max_edges=graph_max_edges)
+
+    def update(self, batch: TransactionBatch, shards: np.ndarray, n_shards: int) -> list:
+        """Ingest a frame and return the shared features each shard needs to score its part"""
+        self.extractor.update_address_profiles(batch)
+        self.extractor.update_graph_index(batch)
+        window_end = float(batch.timestamp.max()) if len(batch) else np.nan
+        shared = [{'frequencies': None, 'senders': {}, 'window_end': window_end} for _ in range(n_shards)]
+        if self.n_features == BASIC_FEATURE_COUNT:
+            # Columns 3 and 4 of the basic features: sender and recipient frequency
+            frequencies = self.extractor.extract_basic_features_batch(batch)[:, 3:]
+            for shard in range(n_shards):
+                shared[shard]['frequencies'] = frequencies[shards == shard]
+        elif self.n_features == ADDRESS_FEATURE_COUNT:
+            addresses = batch.addresses[np.unique(batch.from_ids)]
+            rows = np.column_stack([
+                self.extractor.extract_graph_index_features(list(addresses)),
+                [self.extractor.address_profiles.frequency(a) for a in addresses]
+            ])
+            for address, shard, row in zip(addresses, shard_of(addresses, n_shards), rows):
+                shared[shard]['senders'][address] = row
+        return shared
+
+    def state(self) -> Dict:
+        return {name: getattr(self.extractor, name) for name in SHARED_STATE_ATTRIBUTES}
+
+    def restore(self, state: Dict):
+        for name, value in state.items():
+            setattr(self.extractor, name, value)
+
+def _run_shard(shard: int, config: Dict, inbox, outbox):
+    # Worker process: owns the feature state of every sender in its shard
+    try:
+        output_dir = Path(config['output_dir'])
+        part = config['part']
+        detector = DeFiAnomalyDetector.load_model(config['model'], mmap_mode='r')
+        features = _ShardFeatures(config['window_seconds'])
+        if part > 0:
+            with open(_state_path(output_dir, shard, part), 'rb') as f:
+                features.temporal_stream = pickle.load(f)['temporal_stream']
+        # Anything written or saved after the last checkpoint is redone
+        for stale in output_dir.glob(f"shard-{shard:03d}-*"):
+            if _part_index(stale) > part or (_part_index(stale) == part and '-part-' in stale.name):
+                stale.unlink()
+
+        writer = _ShardWriter(output_dir, shard, part, config['output_format'])
+        while True:
+            message = inbox.get()
+            if message[0] == 'chunk':
+                frame, shared = message[1], message[2]
+                features.use(shared)
+                writer.write(score_transactions(TransactionBatch.from_frame(frame), features, detector,
+                                                window_end=shared['window_end']))
+                outbox.put(('scored', shard, len(frame)))
+                continue
+
+            writer.close()
+            part += 1
+            _save_state(_state_path(output_dir, shard, part), {'temporal_stream': features.temporal_stream},
+                        f"shard-{shard:03d}-state-*.pkl", part)
+            if message[0] == 'stop':
+                outbox.put(('stopped', shard))
+                return
+            writer = _ShardWriter(output_dir, shard, part, config['output_format'])
+            outbox.put(('checkpointed', shard))
+    except Exception:
+        outbox.put(('error', shard, traceback.format_exc()))
+
+class _Progress:
+    """Tracks worker acknowledgements and logs throughput"""
+
+    def __init__(self, outbox, workers, rows_done: int, log_interval: float):
+        self.outbox = outbox
+        self.workers = workers
+        self.started = time.perf_counter()
+        self.resumed_at = rows_done
+        self.read = rows_done
+        self.scored = rows_done
+        self.log_interval = log_interval
+        self._last_log = self.started
+        self._acks = set()
+
+    def rate(self) -> float:
+        return (self.scored - self.resumed_at) / max(time.perf_counter() - self.started, 1e-9)
+
+    def drain(self, block: bool = False):
+        while True:
+            try:
+                message = self.outbox.get(timeout=1.0) if block else self.outbox.get_nowait()
+            except queue.Empty:
+                if block and not all(worker.is_alive() for worker in self.workers):
+                    raise RuntimeError("A backfill worker exited unexpectedly")
+                break
+            block = False
+            if message[0] == 'error':
+                raise RuntimeError(f"Backfill worker {message[1]} failed:\n{message[2]}")
+            if message[0] == 'scored':
+                self.scored += message[2]
+            else:
+                self._acks.add(message[1])
+        now = time.perf_counter()
+        if now - self._last_log >= self.log_interval:
+            self._last_log = now
+            logger.info(f"Scored {self.scored}/{self.read} rows ({self.rate():.0f} rows/s)")
+
+    def wait_for(self, n_shards: int):
+        while len(self._acks) < n_shards:
+            self.drain(block=True)
+        self._acks.clear()
+
+def _send(inbox, message, progress: _Progress):
+    # Bounded queues apply backpressure; keep draining so a failed worker surfaces
+    while True:
+        try:
+            inbox.put(message, timeout=1.0)
+            return
+        except queue.Full:
+            progress.drain()
+
+def _write_checkpoint(output_dir: Path, checkpoint: Dict):
+    tmp_path = output_dir / (CHECKPOINT_FILE + '.tmp')
+    tmp_path.write_text(json.dumps(checkpoint, indent=2))
+    os.replace(tmp_path, output_dir / CHECKPOINT_FILE)
+
+def run_backfill(source, output_dir, model_path: str = 'models/anomaly_detector.joblib',
+                 n_workers: Optional[int] = None, chunk_size: int = 100_000,
+                 checkpoint_rows: int = 1_000_000, output_format: str = 'parquet',
+                 window_seconds: float = 3600.0, resume: bool = False,
+                 log_interval: float = 10.0, profile_sketch_width: Optional[int] = 262144,
+                 graph_max_edges: Optional[int] = 1_000_000) -> Dict:
+    """
+    Score a transaction dump into per-shard part files under `output_dir`
+
+    `profile_sketch_width` and `graph_max_edges` bound the coordinator's
+    state as in the server (None or 0 keeps it exact and unbounded).
+    Returns the final checkpoint record.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    n_workers = n_workers or os.cpu_count()
+    checkpoint = {
+        "source": str(Path(source).resolve()),
+        "model_version": file_version(model_path),
+        "shards": n_workers,
+        "profile_sketch_width": profile_sketch_width or None,
+        "graph_max_edges": graph_max_edges or None,
+        "rows_done": 0,
+        "part": 0,
+        "complete": False,
+    }
+
+    checkpoint_path = output_dir / CHECKPOINT_FILE
+    if checkpoint_path.exists():
+        if not resume:
+            raise ValueError(f"{checkpoint_path} exists: pass resume=True (--resume) or use a new output directory")
+        previous = json.loads(checkpoint_path.read_text())
+        for key in ('source', 'model_version', 'shards', 'profile_sketch_width', 'graph_max_edges'):
+            if previous.get(key) != checkpoint[key]:
+                raise ValueError(f"Cannot resume: {key} changed from {previous[key]} to {checkpoint[key]}")
+        if previous['complete']:
+            logger.info(f"Backfill of {source} already complete ({previous['rows_done']} rows)")
+            return previous
+        checkpoint = previous
+        logger.info(f"Resuming backfill at row {checkpoint['rows_done']}")
+
+    shared_features = _SharedFeatures(
+        model_feature_count(DeFiAnomalyDetector.load_model(model_path, mmap_mode='r')),
+        profile_sketch_width=checkpoint['profile_sketch_width'],
+        graph_max_edges=checkpoint['graph_max_edges'])
+    if checkpoint['part'] > 0:
+        with open(_shared_state_path(output_dir, checkpoint['part']), 'rb') as f:
+            shared_features.restore(pickle.load(f))
+
+    context = multiprocessing.get_context()
+    outbox = context.Queue()
+    inboxes = [context.Queue(maxsize=4) for _ in range(n_workers)]
+    config = {
+        'output_dir': str(output_dir),
+        'model': model_path,
+        'part': checkpoint['part'],
+        'output_format': output_format,
+        'window_seconds': window_seconds,
+    }
+    workers = [
+        context.Process(target=_run_shard, args=(shard, config, inboxes[shard], outbox),
+                        name=f'backfill-shard-{shard}', daemon=True)
+        for shard in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    progress = _Progress(outbox, workers, checkpoint['rows_done'], log_interval)
+    try:
+        since_checkpoint = 0
+        for frame in iter_transaction_frames(source, chunk_size, skip_rows=checkpoint['rows_done']):
+            shards = shard_of(frame['from'].to_numpy(dtype=object), n_workers)
+            shared = shared_features.update(TransactionBatch.from_frame(frame), shards, n_workers)
+            for shard, shard_frame in frame.groupby(shards, sort=False):
+                _send(inboxes[shard], ('chunk', shard_frame, shared[shard]), progress)
+            progress.read += len(frame)
+            since_checkpoint += len(frame)
+            progress.drain()
+
+            if since_checkpoint >= checkpoint_rows:
+                for inbox in inboxes:
+                    _send(inbox, ('checkpoint',), progress)
+                progress.wait_for(n_workers)
+                part = checkpoint['part'] + 1
+                _save_state(_shared_state_path(output_dir, part), shared_features.state(),
+                            "shared-state-*.pkl", part)
+                checkpoint.update(rows_done=progress.read, part=part)
+                _write_checkpoint(output_dir, checkpoint)
+                since_checkpoint = 0
+
+        for inbox in inboxes:
+            _send(inbox, ('stop',), progress)
+        progress.wait_for(n_workers)
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+    checkpoint.update(rows_done=progress.read, complete=True)
+    _write_checkpoint(output_dir, checkpoint)
+    elapsed = time.perf_counter() - progress.started
+    logger.info(f"Backfilled {progress.scored - progress.resumed_at} rows with {n_workers} workers "
+                f"in {elapsed:.1f}s ({progress.rate():.0f} rows/s)")
+    return checkpoint
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a historical transaction dump offline")
+    parser.add_argument('source', help="Transaction dump (.csv or .parquet), ordered by time")
+    parser.add_argument('-o', '--output', required=True, help="Output directory for score part files")
+    parser.add_argument('--model', default='models/anomaly_detector.joblib')
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--checkpoint-rows', type=int, default=1_000_000)
+    parser.add_argument('--format', choices=('parquet', 'csv'), default='parquet')
+    parser.add_argument('--window-seconds', type=float, default=3600.0)
+    parser.add_argument('--profile-sketch-width', type=int, default=262144,
+                        help="Width of the address frequency sketch (0: exact counts)")
+    parser.add_argument('--graph-max-edges', type=int, default=1_000_000,
+                        help="Most recent graph edges to keep (0: all)")
+    parser.add_argument('--resume', action='store_true', help="Continue from the checkpoint in the output directory")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    run_backfill(
+        args.source,
+        args.output,
+        model_path=args.model,
+        n_workers=args.workers,
+        chunk_size=args.chunk_size,
+        checkpoint_rows=args.checkpoint_rows,
+        output_format=args.format,
+        window_seconds=args.window_seconds,
+        resume=args.resume,
+        profile_sketch_width=args.profile_sketch_width,
+        graph_max_edges=args.graph_max_edges
+    )
+
+if __name__ == '__main__':
+    main()
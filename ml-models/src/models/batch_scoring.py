@@ -0,0 +1,104 @@
+import contextlib
+import math
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+
+from src.features.transaction_batch import TransactionBatch
+
+# Width of TransactionFeatureExtractor.extract_basic_features
+BASIC_FEATURE_COUNT = 5
+
+# Width of TransactionFeatureExtractor.address_features
+ADDRESS_FEATURE_COUNT = 9
+
+# Score above which a transaction or address window is reported as anomalous
+ANOMALY_THRESHOLD = 0.7
+
+def model_feature_count(detector) -> Optional[int]:
+    """Number of input features the detector was trained on"""
+    if detector is None:
+        return None
+    return detector.n_features
+
+def stack_feature_dicts(feature_dicts: Sequence, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stack client-supplied feature dicts into one matrix for a model call
+
+    Columns follow the key order of the first usable dict. A dict is usable
+    when it has `n_features` finite numeric values under the same keys as
+    that first one. Returns the matrix of usable rows and a boolean mask of
+    which inputs they came from, so callers can handle the others separately
+    instead of failing the whole call.
+    """
+    names = None
+    rows = []
+    usable = np.zeros(len(feature_dicts), dtype=bool)
+    for i, features in enumerate(feature_dicts):
+        if not isinstance(features, dict) or len(features) != n_features:
+            continue
+        if names is not None and features.keys() != names.keys():
+            continue
+        try:
+            row = [float(features[name]) for name in (names or features)]
+        except (TypeError, ValueError):
+            continue
+        if not all(math.isfinite(value) for value in row):
+            continue
+        if names is None:
+            names = dict.fromkeys(features)
+        rows.append(row)
+        usable[i] = True
+    return np.array(rows, dtype=np.float64).reshape(len(rows), n_features), usable
+
+def score_transactions(batch: TransactionBatch, feature_extractor, detector=None, lock=None,
+                       threshold: float = ANOMALY_THRESHOLD,
+                       window_end: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Ingest a batch into the extractor state and score it in one detector call
+
+    The detector input decides the granularity: a model trained on basic
+    transaction features (5 columns) gets one row per transaction (hash,
+    from, to, timestamp), a model trained on address features gets one row
+    per sender (address, window_end, transactions), scored on its window
+    ending at `window_end` (default: the batch's latest timestamp). Without a detector, or with one
+    that takes neither input width, the rows are per sender and
+    `anomaly_score` is NaN.
+
+    `lock` guards the extractor state; scoring runs outside it.
+    """
+    n_features = model_feature_count(detector)
+    per_transaction = n_features == BASIC_FEATURE_COUNT
+    features = None
+    with lock if lock is not None else contextlib.nullcontext():
+        feature_extractor.ingest(batch)
+        if per_transaction:
+            features = feature_extractor.extract_basic_features_batch(batch)
+        else:
+            senders = np.unique(batch.from_ids)
+            addresses = batch.addresses[senders]
+            if window_end is None:
+                window_end = float(batch.timestamp.max()) if len(batch) else np.nan
+            if n_features == ADDRESS_FEATURE_COUNT:
+                features = np.array([feature_extractor.address_features(a, window_end) for a in addresses])
+
+    if per_transaction:
+        columns = {
+            "hash": batch.hashes if batch.hashes is not None else np.full(len(batch), None, dtype=object),
+            "from": batch.senders,
+            "to": batch.recipients,
+            "timestamp": batch.timestamp,
+        }
+    else:
+        columns = {
+            "address": addresses,
+            "window_end": np.full(len(addresses), window_end),
+            "transactions": np.bincount(batch.from_ids, minlength=batch.n_addresses)[senders],
+        }
+
+    if features is not None and len(features):
+        scores = np.asarray(detector.score_batch(features), dtype=np.float64)
+    else:
+        scores = np.full(len(batch) if per_transaction else len(addresses), np.nan)
+    columns["anomaly_score"] = scores
+    columns["anomaly_detected"] = scores > threshold
+    return columns
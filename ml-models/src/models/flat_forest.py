@@ -0,0 +1,236 @@
+import struct
+import zipfile
+import numpy as np
+
+def average_path_length(n_samples):
+    """
+    Average path length of an unsuccessful BST search over n samples,
+    the normalisation constant c(n) used by isolation forests
+    """
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    result[n_samples == 2] = 1.0
+    mask = n_samples > 2
+    result[mask] = (
+        2.0 * (np.log(n_samples[mask] - 1.0) + np.euler_gamma)
+        - 2.0 * (n_samples[mask] - 1.0) / n_samples[mask]
+    )
+    return result
+
+def _mmap_npz(path):
+    """
+    Memory-map every array of an uncompressed .npz archive (as written by np.savez)
+    """
+    arrays = {}
+    with open(path, 'rb') as f, zipfile.ZipFile(f) as archive:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {info.filename} is compressed and cannot be memory-mapped")
+            # Skip the local file header to reach the .npy payload
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if shape == ():
+                arrays[name] = np.frombuffer(f.read(dtype.itemsize), dtype=dtype).reshape(())
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+class FlatIsolationForest:
+    """
+    Pure-NumPy scorer for a fitted sklearn IsolationForest.
+
+    All trees are packed into flat node arrays (feature, threshold, left and
+    right child, leaf path length) with the fitted StandardScaler folded into
+    the thresholds, so raw, unscaled feature rows can be scored directly.
+    Leaves point to themselves, which lets every tree be walked for every row
+    at once in `max_depth` vectorized steps.
+
+    `score_samples` matches `IsolationForest.score_samples` on scaled input to
+    float tolerance. Loading a saved forest only needs NumPy.
+
+    `source_digest` optionally records the content hash of the model file the
+    forest was compiled from, so an export can be matched to its source.
+    """
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'leaf_value', 'roots')
+
+    def __init__(self, feature, threshold, left, right, leaf_value, roots,
+                 max_depth, normalizer, offset, n_features, source_digest=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.normalizer = float(normalizer)
+        self.offset = float(offset)
+        self.n_features = int(n_features)
+        self.source_digest = source_digest
+
+    @classmethod
+    def from_sklearn(cls, isolation_forest, scaler=None):
+        """
+        Compile a fitted IsolationForest (and optionally its StandardScaler)
+        """
+        n_features = isolation_forest.n_features_in_
+        mean = np.zeros(n_features)
+        scale = np.ones(n_features)
+        if scaler is not None:
+            if getattr(scaler, 'mean_', None) is not None:
+                mean = scaler.mean_
+            if getattr(scaler, 'scale_', None) is not None:
+                scale = scaler.scale_
+
+        features, thresholds, lefts, rights, leaf_values, roots = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for estimator, tree_features in zip(isolation_forest.estimators_, isolation_forest.estimators_features_):
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(n_nodes)
+
+            # Depth of every node (children always have larger ids than parents)
+            depth = np.zeros(n_nodes, dtype=np.int64)
+            for node in range(n_nodes):
+                if not is_leaf[node]:
+                    depth[tree.children_left[node]] = depth[node] + 1
+                    depth[tree.children_right[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+
+            # Map tree-local features to global columns and fold the scaler in
+            feature = np.where(is_leaf, 0, np.asarray(tree_features)[np.maximum(tree.feature, 0)])
+            threshold = np.where(is_leaf, 0.0, tree.threshold * scale[feature] + mean[feature])
+
+            features.append(feature)
+            thresholds.append(threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            leaf_values.append(np.where(
+                is_leaf, depth + average_path_length(tree.n_node_samples), 0.0
+            ))
+            roots.append(offset)
+            offset += n_nodes
+
+        normalizer = len(isolation_forest.estimators_) * float(
+            average_path_length([isolation_forest.max_samples_])[0]
+        )
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            leaf_value=np.concatenate(leaf_values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            normalizer=normalizer,
+            offset=isolation_forest.offset_,
+            n_features=n_features
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def replace_trees(self, new_trees):
+        """
+        Forest with the oldest `new_trees.n_trees` trees dropped and `new_trees` appended
+
+        Trees are stored oldest first. The new trees' path lengths are rescaled
+        to this forest's normalisation, so they may be grown on a different
+        subsample size. The offset is kept; callers refit it if needed.
+        """
+        n_drop = min(new_trees.n_trees, self.n_trees)
+        start = int(self.roots[n_drop]) if n_drop < self.n_trees else len(self.feature)
+        n_kept = len(self.feature) - start
+        own_length = self.normalizer / self.n_trees
+        new_length = new_trees.normalizer / new_trees.n_trees
+        ratio = own_length / new_length if new_length else 1.0
+        return FlatIsolationForest(
+            feature=np.concatenate([self.feature[start:], new_trees.feature]),
+            threshold=np.concatenate([self.threshold[start:], new_trees.threshold]),
+            left=np.concatenate([self.left[start:] - start, new_trees.left + n_kept]).astype(np.int32),
+            right=np.concatenate([self.right[start:] - start, new_trees.right + n_kept]).astype(np.int32),
+            leaf_value=np.concatenate([self.leaf_value[start:], new_trees.leaf_value * ratio]),
+            roots=np.concatenate([self.roots[n_drop:] - start, new_trees.roots + n_kept]).astype(np.int32),
+            max_depth=max(self.max_depth, new_trees.max_depth),
+            normalizer=own_length * (self.n_trees - n_drop + new_trees.n_trees),
+            offset=self.offset,
+            n_features=self.n_features
+        )
+
+    def _path_lengths(self, X):
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.leaf_value[nodes].sum(axis=1)
+
+    def score_samples(self, X, chunk_size=4096):
+        """
+        Same semantics as IsolationForest.score_samples, on raw (unscaled) rows
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the model expects {self.n_features}")
+
+        depths = np.concatenate([
+            self._path_lengths(X[start:start + chunk_size])
+            for start in range(0, max(X.shape[0], 1), chunk_size)
+        ]) if X.shape[0] else np.empty(0)
+        if self.normalizer == 0:
+            return -np.ones_like(depths)
+        return -(2 ** (-depths / self.normalizer))
+
+    def predict(self, X):
+        """
+        Same semantics as IsolationForest.predict: -1 for anomaly, 1 for normal
+        """
+        return np.where(self.score_samples(X) - self.offset < 0, -1, 1)
+
+    def save(self, path):
+        """Save the flat arrays to an uncompressed .npz file"""
+        extra = {} if self.source_digest is None else {'source_digest': self.source_digest}
+        np.savez(
+            path,
+            max_depth=self.max_depth,
+            normalizer=self.normalizer,
+            offset=self.offset,
+            n_features=self.n_features,
+            **extra,
+            **{name: getattr(self, name) for name in self.ARRAYS}
+        )
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        Load flat arrays saved by `save` (NumPy only, no sklearn import)
+
+        With `mmap_mode='r'` the node arrays are memory-mapped read-only, so
+        forked or co-located workers share the same pages.
+        """
+        if mmap_mode:
+            data = _mmap_npz(path)
+        else:
+            with np.load(path) as archive:
+                data = {name: archive[name] for name in archive.files}
+        return cls(
+            max_depth=int(data['max_depth']),
+            normalizer=float(data['normalizer']),
+            offset=float(data['offset']),
+            n_features=int(data['n_features']),
+            source_digest=str(data['source_digest']) if 'source_digest' in data else None,
+            **{name: data[name] for name in cls.ARRAYS}
+        )
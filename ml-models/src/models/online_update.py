@@ -0,0 +1,259 @@
+import logging
+import threading
+import time
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.models.batch_scoring import ANOMALY_THRESHOLD
+from src.models.flat_forest import FlatIsolationForest
+
+logger = logging.getLogger('ml-server')
+
+def _moments(rows: np.ndarray) -> Tuple[int, np.ndarray, np.ndarray]:
+    """(count, mean, sum of squared deviations) of a row block"""
+    mean = rows.mean(axis=0)
+    return len(rows), mean, ((rows - mean) ** 2).sum(axis=0)
+
+def _merge_moments(a, b):
+    """Combine two (count, mean, M2) summaries (Chan et al.)"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return a
+    delta = mean_b - mean_a
+    return n, mean_a + delta * (n_b / n), m2_a + m2_b + delta ** 2 * (n_a * n_b / n)
+
+class ReservoirSample:
+    """
+    Fixed-size sample of a row stream, biased towards recent rows.
+
+    Rows are kept until the reservoir is full; after that every new row
+    overwrites a uniformly random slot. A row therefore survives n later
+    rows with probability (1 - 1/capacity)^n, an exponential bias with a mean
+    lifetime of `capacity` rows (Aggarwal's biased reservoir). Thread-safe.
+    """
+
+    def __init__(self, capacity: int, n_features: int, seed: Optional[int] = None):
+        self.capacity = capacity
+        self.n_features = n_features
+        self._rows = np.empty((capacity, n_features))
+        self.size = 0
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def add(self, rows: np.ndarray) -> None:
+        with self._lock:
+            free = min(self.capacity - self.size, len(rows))
+            self._rows[self.size:self.size + free] = rows[:free]
+            self.size += free
+            if free < len(rows):
+                slots = self._rng.integers(0, self.capacity, size=len(rows) - free)
+                self._rows[slots] = rows[free:]
+            self.seen += len(rows)
+
+    def snapshot(self) -> np.ndarray:
+        """Copy of the rows currently held"""
+        with self._lock:
+            return self._rows[:self.size].copy()
+
+class OnlineForestUpdater:
+    """
+    Keeps the active anomaly detector current without full retraining.
+
+    Rows scored by the active detector are passed to `observe`, which only
+    queues a copy (at most `reservoir_size` rows between updates; the rest
+    are dropped). Rows scored above `max_score` are never queued, so a burst
+    of anomalous traffic cannot teach the model that it is normal; they are
+    counted in `excluded_rows`. Every update, run off the request path by `start`, moves
+    the queued rows into a biased reservoir and the scaler statistics, grows
+    `replace_fraction` of the forest's trees on subsamples of the reservoir,
+    swaps them in for the oldest trees of the flat forest and refits the
+    contamination threshold on the reservoir. The result is installed through
+    `install(detector, expected)`, which must refuse the swap if `expected`
+    is no longer active.
+
+    The cost of an update is fixed by `replace_fraction`, `max_samples` and
+    `offset_sample_size`, not by traffic. Scaler statistics older than the
+    new rows count as at most `scaler_memory` rows, so they follow drift.
+    Updates import sklearn to grow trees.
+
+    State is per process: with several server workers each one updates its
+    own copy of the model from the traffic it happens to serve, so their
+    models drift apart.
+    """
+
+    def __init__(self, get_detector: Callable[[], Optional[DeFiAnomalyDetector]],
+                 install: Callable[[DeFiAnomalyDetector, DeFiAnomalyDetector], bool],
+                 reservoir_size: int = 10_000, replace_fraction: float = 0.1, max_samples: int = 256,
+                 min_rows: int = 1000, contamination: float = 0.1, offset_sample_size: int = 4096,
+                 scaler_memory: int = 100_000, max_score: Optional[float] = ANOMALY_THRESHOLD,
+                 random_state: Optional[int] = None):
+        self.get_detector = get_detector
+        self.install = install
+        self.reservoir_size = reservoir_size
+        self.replace_fraction = replace_fraction
+        self.max_samples = max_samples
+        self.min_rows = min_rows
+        self.contamination = contamination
+        self.offset_sample_size = offset_sample_size
+        self.scaler_memory = scaler_memory
+        self.max_score = max_score
+        self._rng = np.random.default_rng(random_state)
+        self._lock = threading.Lock()
+        self._queued: List[np.ndarray] = []
+        self._queued_rows = 0
+        self.dropped_rows = 0
+        self.excluded_rows = 0
+        self.reservoir: Optional[ReservoirSample] = None
+        self._pending = None  # (count, mean, M2) of rows drained since the last installed update
+        self.updates = 0
+        self.skipped = 0
+        self.trees_replaced = 0
+        self.last_update_seconds = None
+        self.last_error = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def observe(self, detector, rows, scores=None) -> None:
+        """
+        Queue rows scored by `detector` at or below `max_score`; rows scored
+        by other models are ignored
+        """
+        if detector is not self.get_detector():
+            return
+        if self.max_score is not None and scores is not None:
+            # NaN scores fail the comparison and are excluded too
+            normal = np.asarray(scores) <= self.max_score
+            if not normal.all():
+                with self._lock:
+                    self.excluded_rows += int(len(normal) - normal.sum())
+                rows = np.asarray(rows)[normal]
+                if not len(rows):
+                    return
+        with self._lock:
+            room = self.reservoir_size - self._queued_rows
+            if room < len(rows):
+                self.dropped_rows += len(rows) - max(room, 0)
+            if room <= 0:
+                return
+            rows = np.array(rows[:room], dtype=np.float64)
+            self._queued.append(rows)
+            self._queued_rows += len(rows)
+
+    def _drain(self) -> None:
+        # Runs on the update thread: move queued rows into the reservoir and moments
+        with self._lock:
+            queued, self._queued, self._queued_rows = self._queued, [], 0
+        for rows in queued:
+            if rows.ndim != 2 or not len(rows) or not np.all(np.isfinite(rows)):
+                continue
+            if self.reservoir is None or self.reservoir.n_features != rows.shape[1]:
+                self.reservoir = ReservoirSample(self.reservoir_size, rows.shape[1],
+                                                 seed=int(self._rng.integers(2 ** 31)))
+                self._pending = None
+            self.reservoir.add(rows)
+            moments = _moments(rows)
+            self._pending = moments if self._pending is None else _merge_moments(self._pending, moments)
+
+    def _updated_scaler(self, base: DeFiAnomalyDetector, pending):
+        from sklearn.preprocessing import StandardScaler
+        scaler = base.scaler
+        if scaler is not None and getattr(scaler, 'mean_', None) is not None:
+            n_seen = min(int(np.max(scaler.n_samples_seen_)), self.scaler_memory)
+            previous = (n_seen, scaler.mean_, scaler.var_ * n_seen)
+            count, mean, m2 = _merge_moments(previous, pending)
+        else:
+            count, mean, m2 = pending
+        updated = StandardScaler()
+        updated.mean_ = np.asarray(mean, dtype=np.float64)
+        updated.var_ = np.asarray(m2, dtype=np.float64) / max(count, 1)
+        updated.scale_ = np.where(updated.var_ > 0, np.sqrt(updated.var_), 1.0)
+        updated.n_samples_seen_ = count
+        updated.n_features_in_ = len(updated.mean_)
+        return updated
+
+    def _build(self, base, reservoir, pending) -> Tuple[Optional[DeFiAnomalyDetector], int]:
+        from sklearn.ensemble import IsolationForest
+        if base is None or base.flat_forest is None or reservoir is None or pending is None:
+            return None, 0
+        rows = reservoir.snapshot()
+        if len(rows) < self.min_rows or rows.shape[1] != base.n_features:
+            return None, 0
+
+        scaler = self._updated_scaler(base, pending)
+        forest = base.flat_forest
+        n_trees = max(1, int(round(forest.n_trees * self.replace_fraction)))
+        grown = IsolationForest(
+            n_estimators=n_trees,
+            max_samples=min(self.max_samples, len(rows)),
+            random_state=int(self._rng.integers(2 ** 31))
+        ).fit(scaler.transform(rows))
+        updated = forest.replace_trees(FlatIsolationForest.from_sklearn(grown, scaler))
+
+        sample = rows[self._rng.choice(len(rows), size=min(self.offset_sample_size, len(rows)), replace=False)]
+        updated.offset = float(np.percentile(updated.score_samples(sample), 100.0 * self.contamination))
+
+        detector = DeFiAnomalyDetector(flat_forest=updated)
+        detector.scaler = scaler
+        return detector, n_trees
+
+    def update(self) -> bool:
+        """
+        Build and install one update; returns whether a new model was installed
+
+        Does nothing until at least `min_rows` rows have been observed and new
+        rows arrived since the last update.
+        """
+        started = time.perf_counter()
+        self._drain()
+        base = self.get_detector()
+        detector, n_trees = self._build(base, self.reservoir, self._pending)
+        if detector is None or not self.install(detector, base):
+            # Unused statistics stay pending for the next attempt
+            self.skipped += 1
+            return False
+        self._pending = None
+        self.updates += 1
+        self.trees_replaced += n_trees
+        self.last_update_seconds = time.perf_counter() - started
+        logger.info("Online update replaced %d of %d trees from %d reservoir rows in %.3fs",
+                    n_trees, detector.flat_forest.n_trees, self.reservoir.size, self.last_update_seconds)
+        return True
+
+    def start(self, interval: float) -> None:
+        """
+        Run `update` every `interval` seconds on a background thread
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='online-update', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.update()
+                self.last_error = None
+            except Exception as e:
+                # Keep serving the active model
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error("Online model update failed: %s", self.last_error)
+
+    def stats(self) -> Dict:
+        reservoir = self.reservoir
+        return {
+            "updates": self.updates,
+            "skipped": self.skipped,
+            "trees_replaced": self.trees_replaced,
+            "reservoir_rows": reservoir.size if reservoir else 0,
+            "rows_seen": reservoir.seen if reservoir else 0,
+            "dropped_rows": self.dropped_rows,
+            "excluded_rows": self.excluded_rows,
+            "last_update_seconds": self.last_update_seconds,
+            "last_error": self.last_error,
+        }
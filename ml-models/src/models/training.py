@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Out-of-core, parallel training for DeFiAnomalyDetector
+
+Streams a feature matrix from disk in chunks (.npy, .parquet or .csv), fits
+the scaler incrementally, grows isolation trees on independent subsamples in
+worker processes and merges them into a single IsolationForest. Memory use is
+bounded by the chunk size plus the tree subsamples, not by the dataset size.
+
+Usage:
+    python -m src.models.training history.parquet -o models/anomaly_detector.joblib
+"""
+import argparse
+import copy
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from src.models.anomaly_detector import DeFiAnomalyDetector
+
+logger = logging.getLogger('ml-training')
+
+# Per-tree attributes of a fitted IsolationForest that must be concatenated on merge
+PER_TREE_ATTRIBUTES = ('estimators_', 'estimators_features_', '_decision_path_lengths',
+                       '_average_path_length_per_tree')
+
+def iter_feature_chunks(source, chunk_size: int = 100_000,
+                        columns: Optional[Sequence[str]] = None) -> Iterator[np.ndarray]:
+    """
+    Yield float64 row chunks of a feature matrix stored on disk
+
+    `.npy` files are memory-mapped; `.parquet` (via pyarrow) and `.csv` are
+    read in batches. For tabular files, `columns` selects the feature columns
+    (default: all numeric columns).
+    """
+    path = Path(source)
+    suffix = path.suffix.lower()
+    if suffix == '.npy':
+        matrix = np.load(path, mmap_mode='r')
+        for start in range(0, matrix.shape[0], chunk_size):
+            yield np.asarray(matrix[start:start + chunk_size], dtype=np.float64)
+        return
+
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        frames = (batch.to_pandas() for batch in
+                  pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns))
+    elif suffix == '.csv':
+        frames = pd.read_csv(path, chunksize=chunk_size, usecols=columns)
+    else:
+        raise ValueError(f"Unsupported training data format: {path}")
+
+    for frame in frames:
+        if columns is None:
+            frame = frame.select_dtypes('number')
+        yield frame.to_numpy(dtype=np.float64)
+
+def _fit_trees(samples: List[np.ndarray], seeds: List[int], contamination) -> List[IsolationForest]:
+    # Each tree is a one-estimator forest grown on exactly its own subsample
+    return [
+        IsolationForest(n_estimators=1, max_samples=len(sample),
+                        contamination=contamination, random_state=seed).fit(sample)
+        for sample, seed in zip(samples, seeds)
+    ]
+
+def merge_forests(forests: List[IsolationForest]) -> IsolationForest:
+    """
+    Combine fitted forests (grown on same-sized subsamples) into one IsolationForest
+    """
+    merged = copy.copy(forests[0])
+    for attribute in PER_TREE_ATTRIBUTES:
+        if hasattr(merged, attribute):
+            values = [tree for forest in forests for tree in getattr(forest, attribute)]
+            setattr(merged, attribute, type(getattr(merged, attribute))(values))
+    if hasattr(merged, '_seeds'):
+        merged._seeds = np.concatenate([forest._seeds for forest in forests])
+    merged.n_estimators = len(merged.estimators_)
+    return merged
+
+def train_out_of_core(source, n_estimators: int = 100, max_samples: int = 256,
+                      contamination=0.1, chunk_size: int = 100_000,
+                      columns: Optional[Sequence[str]] = None, n_jobs: Optional[int] = None,
+                      offset_sample_size: int = 100_000, random_state: int = 42) -> DeFiAnomalyDetector:
+    """
+    Train a DeFiAnomalyDetector on a dataset that does not fit in memory
+
+    Pass 1 fits the StandardScaler with `partial_fit` and counts rows. Pass 2
+    gathers one random subsample of `max_samples` rows per tree, plus a
+    sample of up to `offset_sample_size` rows used to set the contamination
+    threshold. Trees are then grown in `n_jobs` processes (all cores by
+    default) and merged.
+    """
+    started = time.perf_counter()
+    n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+    rng = np.random.default_rng(random_state)
+
+    # Pass 1: incremental scaler statistics
+    scaler = StandardScaler()
+    n_rows = 0
+    for chunk in iter_feature_chunks(source, chunk_size, columns):
+        scaler.partial_fit(chunk)
+        n_rows += len(chunk)
+    if n_rows == 0:
+        raise ValueError(f"No training rows found in {source}")
+    logger.info(f"Fitted scaler on {n_rows} rows in {time.perf_counter() - started:.1f}s")
+
+    # Pass 2: gather the rows every tree (and the threshold sample) needs
+    tree_size = min(max_samples, n_rows)
+    tree_rows = [rng.choice(n_rows, size=tree_size, replace=False) for _ in range(n_estimators)]
+    offset_rows = rng.choice(n_rows, size=min(offset_sample_size, n_rows), replace=False)
+    wanted = np.unique(np.concatenate(tree_rows + [offset_rows]))
+
+    gathered = []
+    start = 0
+    for chunk in iter_feature_chunks(source, chunk_size, columns):
+        lo, hi = np.searchsorted(wanted, [start, start + len(chunk)])
+        gathered.append(chunk[wanted[lo:hi] - start])
+        start += len(chunk)
+    gathered = scaler.transform(np.vstack(gathered))
+
+    def rows(indices):
+        return gathered[np.searchsorted(wanted, indices)]
+
+    # Grow trees in parallel on independent subsamples
+    seeds = rng.integers(np.iinfo(np.int32).max, size=n_estimators).tolist()
+    n_jobs = max(1, min(n_jobs, n_estimators))
+    shards = [list(range(worker, n_estimators, n_jobs)) for worker in range(n_jobs)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [
+            executor.submit(_fit_trees, [rows(tree_rows[t]) for t in shard], [seeds[t] for t in shard], contamination)
+            for shard in shards
+        ]
+        forests = [forest for future in futures for forest in future.result()]
+
+    forest = merge_forests(forests)
+    if contamination == 'auto':
+        forest.offset_ = -0.5
+    else:
+        forest.offset_ = np.percentile(forest.score_samples(rows(offset_rows)), 100.0 * contamination)
+
+    detector = DeFiAnomalyDetector()
+    detector.scaler = scaler
+    detector.isolation_forest = forest
+    detector.compile_flat_forest()
+    logger.info(f"Trained {n_estimators} trees on {n_rows} rows with {n_jobs} workers "
+                f"in {time.perf_counter() - started:.1f}s")
+    return detector
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the anomaly detector out of core")
+    parser.add_argument('source', help="Feature matrix (.npy, .parquet or .csv)")
+    parser.add_argument('-o', '--output', default='models/anomaly_detector.joblib')
+    parser.add_argument('--columns', help="Comma-separated feature columns for tabular input")
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--max-samples', type=int, default=256)
+    parser.add_argument('--contamination', default='0.1')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--random-state', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    detector = train_out_of_core(
+        args.source,
+        n_estimators=args.n_estimators,
+        max_samples=args.max_samples,
+        contamination=args.contamination if args.contamination == 'auto' else float(args.contamination),
+        chunk_size=args.chunk_size,
+        columns=args.columns.split(',') if args.columns else None,
+        n_jobs=args.n_jobs,
+        random_state=args.random_state
+    )
+    detector.save_model(args.output)
+    logger.info(f"Saved model to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import asyncio
+import contextvars
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Request bodies up to this size are read on the event loop before dispatch;
+# larger or chunked bodies are pulled lazily by the worker thread
+BUFFERED_BODY_LIMIT = 1024 * 1024
+
+class _StreamingBody(io.RawIOBase):
+    """
+    WSGI input that pulls ASGI body messages from the event loop on demand
+
+    Used unbuffered: `read(n)` returns as soon as some body has arrived
+    rather than waiting for `n` bytes, so a streaming handler sees the body
+    as the client sends it.
+    """
+
+    def __init__(self, receive, loop: asyncio.AbstractEventLoop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self) -> bool:
+        if self._done:
+            return False
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            self._done = True
+            return False
+        self._buffer += message.get('body', b'')
+        self._done = not message.get('more_body', False)
+        return True
+
+    def readinto(self, target) -> int:
+        while not self._buffer and self._fill():
+            pass
+        n = min(len(target), len(self._buffer))
+        target[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+class AsgiBridge:
+    """
+    Serve a WSGI (Flask) application from an ASGI server without blocking the
+    event loop.
+
+    Each request's WSGI call runs on a bounded thread pool, so CPU-bound
+    feature extraction and model scoring never run on the event loop and the
+    number of in-flight connections is not tied to the number of threads.
+    Responses without a Content-Length are streamed chunk by chunk.
+
+    A request's WSGI call, every pull of its response body and the final
+    `close()` may each land on a different pool thread, so they all run in
+    one `contextvars` context copied per request: Flask keeps its app and
+    request contexts in context variables, and a streamed response
+    (`stream_with_context`) pops them in `close()`.
+
+    Handlers can ask for an artificial delay by setting
+    `environ['sentinel.simulated_latency']` (seconds); the bridge awaits it
+    with `asyncio.sleep` before sending the response instead of holding a
+    worker thread.
+    """
+
+    def __init__(self, wsgi_app, max_workers: Optional[int] = None):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asgi-worker')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        # Kept as a list: a header may be sent more than once
+        headers = [(key.decode('latin-1').lower(), value.decode('latin-1')) for key, value in scope['headers']]
+
+        content_length = next((value for key, value in headers if key == 'content-length'), None)
+        if content_length is not None and int(content_length) <= BUFFERED_BODY_LIMIT:
+            chunks = []
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunks.append(message.get('body', b''))
+                more_body = message.get('more_body', False)
+            body = io.BytesIO(b''.join(chunks))
+        else:
+            body = _StreamingBody(receive, loop)
+
+        environ = self._build_environ(scope, headers, body)
+        response: Dict = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.encode('latin-1'), v.encode('latin-1')) for k, v in response_headers]
+            response['streaming'] = not any(k.lower() == 'content-length' for k, _ in response_headers)
+
+        def call_app():
+            iterable = self.wsgi_app(environ, start_response)
+            if response['streaming']:
+                return iterable
+            try:
+                return [b''.join(iterable)]
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+        context = contextvars.copy_context()
+
+        def run_in_context(function, *args):
+            return loop.run_in_executor(self.executor, context.run, function, *args)
+
+        try:
+            chunks = await run_in_context(call_app)
+        except Exception:
+            await send({'type': 'http.response.start', 'status': 500,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+            raise
+
+        latency = environ.get('sentinel.simulated_latency')
+        if latency:
+            await asyncio.sleep(latency)
+
+        await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+        if not response['streaming']:
+            await send({'type': 'http.response.body', 'body': chunks[0]})
+            return
+
+        iterator = iter(chunks)
+        try:
+            while True:
+                chunk = await run_in_context(next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(chunks, 'close'):
+                await run_in_context(chunks.close)
+
+    @staticmethod
+    def _build_environ(scope, headers: List[Tuple[str, str]], body) -> Dict:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': not any(key == 'content-length' for key, _ in headers),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'sentinel.async': True,
+        }
+        for key, value in headers:
+            if key == 'content-type':
+                environ['CONTENT_TYPE'] = value
+            elif key == 'content-length':
+                environ['CONTENT_LENGTH'] = value
+            else:
+                # Repeated headers are joined as in CGI; cookies use their own separator
+                name = 'HTTP_' + key.upper().replace('-', '_')
+                if name in environ:
+                    value = environ[name] + ('; ' if key == 'cookie' else ',') + value
+                environ[name] = value
+        return environ
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+class _PendingRequest:
+    __slots__ = ('features', 'model', 'future', 'enqueued_at')
+
+    def __init__(self, features: np.ndarray, model=None):
+        self.features = features
+        self.model = model
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+class InferenceScheduler:
+    """
+    Micro-batching front for an anomaly model.
+
+    Single feature vectors submitted from concurrent request threads are
+    queued and flushed into one `score_batch` call as soon as either
+    `max_batch_size` vectors are waiting or the oldest one has waited
+    `max_latency_ms`, whichever comes first. Each caller gets its own score
+    back through a future. Requests may name their own model (anything with
+    a `score_batch` method); vectors for different models or of different
+    widths in the same flush are scored as separate batches.
+    """
+
+    def __init__(self, score_batch: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = 64, max_latency_ms: float = 5.0):
+        self._score_batch = score_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._last_batch_size = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._thread = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, features, model=None) -> Future:
+        """
+        Queue one feature vector; the future resolves to its anomaly score
+
+        Without `model` the vector is scored by the scheduler's default
+        `score_batch`.
+        """
+        request = _PendingRequest(np.asarray(features, dtype=np.float64).ravel(), model)
+        self._queue.put(request)
+        return request.future
+
+    def score(self, features, model=None, timeout: float = None) -> float:
+        """
+        Queue one feature vector and wait for its anomaly score
+        """
+        return self.submit(features, model).result(timeout=timeout)
+
+    def close(self) -> None:
+        """
+        Stop the worker thread after flushing anything already queued
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict:
+        """
+        Effective batch size and queue wait statistics since startup
+        """
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "mean_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "last_batch_size": self._last_batch_size,
+                "mean_queue_wait_ms": 1000 * self._total_wait / self._requests if self._requests else 0.0,
+                "max_queue_wait_ms": 1000 * self._max_wait,
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_latency_ms": 1000 * self.max_latency,
+            }
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first.enqueued_at + self.max_latency
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: List[_PendingRequest]) -> None:
+        flushed_at = time.perf_counter()
+        waits = [flushed_at - request.enqueued_at for request in batch]
+
+        groups: Dict[Tuple[int, int], List[_PendingRequest]] = {}
+        for request in batch:
+            groups.setdefault((id(request.model), request.features.shape[0]), []).append(request)
+
+        for requests in groups.values():
+            model = requests[0].model
+            score_batch = self._score_batch if model is None else model.score_batch
+            try:
+                scores = score_batch(np.vstack([r.features for r in requests]))
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+            for request, score in zip(requests, scores):
+                request.future.set_result(float(score))
+
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._last_batch_size = len(batch)
+            self._total_wait += sum(waits)
+            self._max_wait = max(self._max_wait, max(waits))
@@ -0,0 +1,230 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+class RouteSampler(logging.Filter):
+    """
+    Keep only a fraction of INFO-and-below records per route
+
+    `rates` maps a route (as returned by `route_getter`, e.g. a Flask URL rule)
+    to the fraction of its records to keep; routes not listed keep
+    `default_rate`. Warnings and errors are never sampled out. The route is
+    also attached to each record as `route` so it appears in structured output.
+    """
+
+    def __init__(self, route_getter: Callable[[], Optional[str]], rates: Optional[Dict[str, float]] = None,
+                 default_rate: float = 1.0):
+        super().__init__()
+        self.route_getter = route_getter
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self.sampled_out = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        route = self.route_getter()
+        if route is None:
+            return True
+        record.route = route
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(route, self.default_rate)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        with self._lock:
+            self.sampled_out += 1
+        return False
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never formats on the caller's thread and never blocks
+    for longer than `block_seconds`; records that do not fit are dropped and
+    counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue, block_seconds: float = 0.0):
+        super().__init__(log_queue)
+        self.block_seconds = block_seconds
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats here; the writer thread does it instead
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.block_seconds > 0:
+                self.queue.put(record, timeout=self.block_seconds)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+
+class _WriterListener(logging.handlers.QueueListener):
+    """
+    Writer thread of a LogPipeline; also reports records the queue handler
+    dropped, with a warning at most every `warning_interval` seconds
+    """
+
+    def __init__(self, queue_handler: _BoundedQueueHandler, handlers: Sequence[logging.Handler],
+                 warning_interval: float):
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.warning_interval = warning_interval
+        self.reported = queue_handler.dropped
+        self._last_warning = float('-inf')
+
+    def enqueue_sentinel(self):
+        # Wait for room instead of failing on a full queue, so stop() always drains it
+        self.queue.put(self._sentinel)
+
+    def handle(self, record: logging.LogRecord) -> None:
+        self.report_dropped()
+        super().handle(record)
+
+    def report_dropped(self, force: bool = False) -> None:
+        dropped = self.queue_handler.dropped
+        now = time.monotonic()
+        if dropped == self.reported or (not force and now - self._last_warning < self.warning_interval):
+            return
+        warning = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                    "Dropped %d log records because the log queue was full (%d in total)",
+                                    (dropped - self.reported, dropped), None)
+        warning.dropped = dropped
+        self.reported = dropped
+        self._last_warning = now
+        super().handle(warning)
+
+class LogPipeline:
+    """
+    Asynchronous logging: records are queued by the logging call and written
+    by a background thread, so formatting and I/O stay off the request path.
+
+    The queue is bounded by `queue_size`. A full queue makes the logging call
+    wait up to `block_seconds` (backpressure) and then drops the record,
+    counted in `dropped`; the writer thread logs a warning with the number
+    of new drops at most every `drop_warning_seconds`. Records are formatted by the writer thread, so
+    arguments should be passed %-style (`logger.info("x=%s", x)`) and not be
+    mutated after the call.
+    """
+
+    def __init__(self, handlers: Sequence[logging.Handler], queue_size: int = 10000,
+                 block_seconds: float = 0.0, drop_warning_seconds: float = 60.0):
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.handlers = list(handlers)
+        self.drop_warning_seconds = drop_warning_seconds
+        self.queue_handler = _BoundedQueueHandler(self.queue, block_seconds)
+        self.listener = _WriterListener(self.queue_handler, self.handlers, drop_warning_seconds)
+        self.sampler: Optional[RouteSampler] = None
+        self._started = False
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def dropped(self) -> int:
+        return self.queue_handler.dropped
+
+    @property
+    def sampled_out(self) -> int:
+        return self.sampler.sampled_out if self.sampler else 0
+
+    def add_sampler(self, sampler: RouteSampler) -> None:
+        if self.sampler is not None:
+            self.queue_handler.removeFilter(self.sampler)
+        self.sampler = sampler
+        self.queue_handler.addFilter(sampler)
+
+    def start(self) -> None:
+        if not self._started:
+            self.listener.start()
+            self._started = True
+            atexit.register(self.stop)
+
+    def _after_fork(self) -> None:
+        # The writer thread does not survive fork (e.g. gunicorn --preload), and
+        # the queue's lock may have been held mid-fork: give the child its own
+        if self._started:
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self.queue_handler.queue = self.queue
+            self.listener = _WriterListener(self.queue_handler, self.handlers, self.drop_warning_seconds)
+            self.listener.start()
+
+    def stop(self) -> None:
+        """Write out everything still queued and stop the writer thread"""
+        if self._started:
+            self._started = False
+            self.listener.stop()
+            self.listener.report_dropped(force=True)
+            for handler in self.handlers:
+                handler.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+        }
+
+def parse_sample_rates(text: str) -> Dict[str, float]:
+    """'/api/risk/score/<address>=0.01,/api/anomaly/detect=0.1' -> {route: rate}"""
+    rates = {}
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        route, _, rate = part.rpartition('=')
+        if not route:
+            raise ValueError(f"Expected ROUTE=RATE, got {part!r}")
+        rates[route] = float(rate)
+    return rates
+
+def configure_logging(level: int, handlers: List[logging.Handler], json_format: bool = False,
+                      queue_size: int = 10000, block_seconds: float = 0.0,
+                      text_format: str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s') -> LogPipeline:
+    """
+    Route all logging through a started LogPipeline writing to `handlers`
+
+    Replaces any handlers already on the root logger, like
+    `logging.basicConfig(force=True)`.
+    """
+    formatter = JsonFormatter() if json_format else logging.Formatter(text_format)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    pipeline = LogPipeline(handlers, queue_size=queue_size, block_seconds=block_seconds)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(pipeline.queue_handler)
+    root.setLevel(level)
+    pipeline.start()
+    return pipeline
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger('ml-server')
+
+class ModelValidationError(Exception):
+    """Raised when a candidate model fails validation against the probe set"""
+
+def file_version(path) -> str:
+    """
+    Short content hash identifying a model file
+    """
+    digest = hashlib.blake2b(digest_size=6)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ModelManager:
+    """
+    Holds the active anomaly detector and hot-swaps retrained models.
+
+    `reload` loads a model from disk (memory-mapped when `mmap_mode` is set),
+    validates it against a probe set and swaps it in with a single reference
+    assignment, so requests already holding the previous detector finish with
+    it and new requests see the new one. Reloads are serialized on one
+    background thread; an optional watcher triggers them when the model file
+    changes. `swap` installs a model built in memory (e.g. by online updates).
+    Observers set with `set_observers` are attached to every model made active.
+    """
+
+    def __init__(self, path, loader: Callable, mmap_mode: Optional[str] = 'r',
+                 probe_path=None):
+        self.path = Path(path)
+        self.loader = loader
+        self.mmap_mode = mmap_mode
+        self.probe_path = Path(probe_path) if probe_path else None
+        self._active = (None, None)  # (detector, version)
+        self._swap_lock = threading.Lock()
+        self.swaps = 0
+        self._identity = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.last_error = None
+        self.score_observer = None
+        self.sample_observer = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-reload')
+        self._watcher = None
+        self._stop = threading.Event()
+
+    @property
+    def detector(self):
+        return self._active[0]
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._active[1]
+
+    def _probe_set(self, detector) -> np.ndarray:
+        if self.probe_path and self.probe_path.exists():
+            return np.load(self.probe_path)
+        if detector.scaler is None:
+            return self._flat_probe_set(detector.flat_forest)
+        # Without a probe file, check the scaler's centre and one sigma around it
+        mean = detector.scaler.mean_
+        scale = detector.scaler.scale_
+        return np.vstack([mean, mean + scale, mean - scale])
+
+    @staticmethod
+    def _flat_probe_set(forest) -> np.ndarray:
+        # Flat-only models carry no scaler; probe the mean split threshold per feature instead
+        split = forest.left != np.arange(len(forest.left))
+        counts = np.bincount(forest.feature[split], minlength=forest.n_features)
+        sums = np.bincount(forest.feature[split], forest.threshold[split], minlength=forest.n_features)
+        centre = sums / np.maximum(counts, 1)
+        return np.vstack([centre, np.zeros(forest.n_features)])
+
+    def set_observers(self, score_observer: Optional[Callable] = None,
+                      sample_observer: Optional[Callable] = None) -> None:
+        """
+        Attach observers (see DeFiAnomalyDetector) to the active model and every model activated later
+        """
+        self.score_observer = score_observer
+        self.sample_observer = sample_observer
+        if self.detector is not None:
+            self._attach_observers(self.detector)
+
+    def _attach_observers(self, detector) -> None:
+        # After validation, so probe scoring is never observed
+        detector.score_observer = self.score_observer
+        detector.sample_observer = self.sample_observer
+
+    def validate(self, detector) -> None:
+        """
+        Score the probe set with a candidate model; raise ModelValidationError if unusable
+        """
+        current = self.detector
+        n_features = detector.n_features
+        if current is not None and current.n_features != n_features:
+            raise ModelValidationError(
+                f"model expects {n_features} features, active model expects {current.n_features}"
+            )
+        probe = self._probe_set(detector)
+        scores = np.asarray(detector.score_batch(probe))
+        if scores.shape != (probe.shape[0],) or not np.all(np.isfinite(scores)):
+            raise ModelValidationError("model produced invalid scores on the probe set")
+
+    def reload(self) -> Dict:
+        """
+        Load, validate and swap in the model at `path`; runs on the calling thread
+        """
+        started = time.perf_counter()
+        stat = self.path.stat()
+        version = file_version(self.path)
+        try:
+            detector = self.loader(str(self.path), mmap_mode=self.mmap_mode)
+            self.validate(detector)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.error("Rejected anomaly detector model %s from %s: %s", version, self.path, self.last_error)
+            raise
+
+        self._attach_observers(detector)
+        with self._swap_lock:
+            self._active = (detector, version)
+        self._identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = int(time.time())
+        self.last_error = None
+        logger.info("Activated anomaly detector model %s from %s in %.3fs", version, self.path, self.load_seconds)
+        return self.status()
+
+    def swap(self, detector, expected=None, version: Optional[str] = None) -> bool:
+        """
+        Validate and install an in-memory model
+
+        With `expected`, the swap only happens if that detector is still
+        active, so a model derived from it never overwrites one reloaded from
+        disk meanwhile. Returns whether the model was installed. The version
+        defaults to the file version with a `+<n>` suffix.
+        """
+        self.validate(detector)
+        self._attach_observers(detector)
+        with self._swap_lock:
+            current, current_version = self._active
+            if expected is not None and current is not expected:
+                return False
+            self.swaps += 1
+            if version is None:
+                version = f"{(current_version or 'memory').split('+')[0]}+{self.swaps}"
+            self._active = (detector, version)
+        self.loaded_at = int(time.time())
+        return True
+
+    def reload_async(self) -> Future:
+        """
+        Queue a reload on the background thread
+        """
+        return self._executor.submit(self.reload)
+
+    def changed_on_disk(self) -> bool:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) != self._identity
+
+    def start_watching(self, interval: float) -> None:
+        """
+        Poll the model file every `interval` seconds and reload it when it changes
+        """
+        if self._watcher is None:
+            self._watcher = threading.Thread(
+                target=self._watch, args=(interval,), name='model-watcher', daemon=True
+            )
+            self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                if self.changed_on_disk():
+                    # Through the reload thread, so it never overlaps an admin-triggered reload
+                    self.reload_async().result()
+            except FileNotFoundError as e:
+                # The file vanished mid-replace; pick it up again on the next poll
+                logger.warning("Model file disappeared during reload, retrying: %s", e)
+            except Exception as e:
+                # Keep serving the active model; remember this file so it is not retried
+                logger.error("Model watcher kept the active model after a failed reload: %s", e)
+                try:
+                    stat = self.path.stat()
+                    self._identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    pass
+
+    def status(self) -> Dict:
+        return {
+            "loaded": self.detector is not None,
+            "version": self.version,
+            "path": str(self.path),
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger('ml-server')
+
+class ModelRegistry:
+    """
+    Per-protocol anomaly detectors, loaded on first use.
+
+    A model for a protocol lives at `<models_dir>/<address>.joblib` (address
+    lowercased); a model shared by all protocols of a chain lives at
+    `<models_dir>/chains/<chain>.joblib`. A `.flat.npz` export on its own is
+    also accepted. Lookups try the protocol, then its
+    chain, then fall back to the global model returned by `fallback`.
+
+    Loaded models are kept in an LRU bounded by `max_models` and by
+    `max_bytes`, estimated from the size of their files on disk. The
+    directory is rescanned when it changes, and models whose file was
+    replaced are dropped and reloaded on next use. All operations are
+    thread-safe; loads happen outside the lock, and concurrent misses on the
+    same model wait for a single load. `score_observer`, if set, is attached
+    to every model loaded afterwards (see DeFiAnomalyDetector).
+    """
+
+    def __init__(self, models_dir, loader: Callable, fallback: Callable[[], object],
+                 mmap_mode: Optional[str] = 'r', max_models: int = 64,
+                 max_bytes: int = 1024 * 1024 * 1024):
+        self.models_dir = Path(models_dir)
+        self.loader = loader
+        self.fallback = fallback
+        self.mmap_mode = mmap_mode
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.score_observer = None
+        self._lock = threading.Lock()
+        self._models: 'OrderedDict[str, Tuple[object, int, int]]' = OrderedDict()
+        self._available: Dict[str, Path] = {}
+        self._failed = set()
+        self._loading: Dict[str, Future] = {}
+        self._scanned = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.load_waits = 0
+        self.fallbacks = 0
+        self.evictions = 0
+        self.load_errors = 0
+        self.load_seconds = 0.0
+
+    @staticmethod
+    def _mtime(path: Path) -> Optional[int]:
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self) -> None:
+        # Called with the lock held; cheap unless the directory changed
+        chains_dir = self.models_dir / 'chains'
+        scanned = (self._mtime(self.models_dir), self._mtime(chains_dir))
+        if scanned == self._scanned:
+            return
+        available = {}
+        for key_prefix, directory in (('', self.models_dir), ('chain:', chains_dir)):
+            if directory.is_dir():
+                # Bare flat forest exports are served when no full model exists
+                for path in directory.glob('*.flat.npz'):
+                    available[key_prefix + path.name[:-len('.flat.npz')].lower()] = path
+                for path in directory.glob('*.joblib'):
+                    available[key_prefix + path.stem.lower()] = path
+        for key, (_, _, mtime) in list(self._models.items()):
+            path = available.get(key)
+            if path is None or self._mtime(path) != mtime:
+                self._remove(key)
+        self._failed.clear()
+        self._available = available
+        self._scanned = scanned
+
+    def _remove(self, key: str) -> None:
+        _, nbytes, _ = self._models.pop(key)
+        self.nbytes -= nbytes
+
+    def resolve(self, address: Optional[str], chain: Optional[str] = None) -> Optional[str]:
+        """
+        Registry key of the most specific model for a protocol, or None for the global model
+        """
+        with self._lock:
+            self._scan()
+            for key in (address and address.lower(), chain and f"chain:{chain.lower()}"):
+                if key and key in self._available and key not in self._failed:
+                    return key
+        return None
+
+    def get(self, address: Optional[str], chain: Optional[str] = None) -> Tuple[Optional[str], object]:
+        """
+        (key, detector) for a protocol; key is None when the global model is used
+        """
+        key = self.resolve(address, chain)
+        if key is None:
+            with self._lock:
+                self.fallbacks += 1
+            return None, self.fallback()
+
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return key, entry[0]
+            loading = self._loading.get(key)
+            if loading is None:
+                self.misses += 1
+                loading = self._loading[key] = Future()
+                path = self._available[key]
+            else:
+                self.load_waits += 1
+                path = None
+
+        if path is not None:
+            detector = None
+            try:
+                detector = self._load(key, path)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+                loading.set_result(detector)
+        else:
+            detector = loading.result()
+        if detector is None:
+            with self._lock:
+                self.fallbacks += 1
+            return None, self.fallback()
+        return key, detector
+
+    def _load(self, key: str, path: Path) -> Optional[object]:
+        # Load and cache one model; None if it failed to load
+        mtime = self._mtime(path)
+        started = time.perf_counter()
+        try:
+            detector = self.loader(path, mmap_mode=self.mmap_mode)
+        except Exception as e:
+            logger.error("Error loading model %s: %s", path, e)
+            with self._lock:
+                self.load_errors += 1
+                self._failed.add(key)
+            return None
+        elapsed = time.perf_counter() - started
+        detector.score_observer = self.score_observer
+
+        nbytes = sum(p.stat().st_size for p in {path, path.with_name(path.name.split('.')[0] + '.flat.npz')}
+                     if p.exists())
+        with self._lock:
+            self.load_seconds += elapsed
+            if key in self._models:
+                self._remove(key)
+            self._models[key] = (detector, nbytes, mtime)
+            self.nbytes += nbytes
+            # Evict least recently used models, but always keep the one just loaded
+            while len(self._models) > 1 and (len(self._models) > self.max_models or self.nbytes > self.max_bytes):
+                self._remove(next(iter(self._models)))
+                self.evictions += 1
+        logger.info("Loaded model for %s from %s in %.1fms", key, path, elapsed * 1000)
+        return detector
+
+    def stats(self) -> Dict:
+        """
+        Loaded models, memory estimate and hit/miss counters
+        """
+        with self._lock:
+            self._scan()
+            return {
+                "models_dir": str(self.models_dir),
+                "available": len(self._available),
+                "loaded": len(self._models),
+                "loaded_keys": list(self._models),
+                "bytes": self.nbytes,
+                "max_models": self.max_models,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "load_waits": self.load_waits,
+                "fallbacks": self.fallbacks,
+                "evictions": self.evictions,
+                "load_errors": self.load_errors,
+                "load_seconds": self.load_seconds,
+            }
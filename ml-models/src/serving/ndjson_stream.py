@@ -0,0 +1,87 @@
+import json
+import math
+import threading
+import numpy as np
+from typing import Dict, Iterator, List, Optional
+
+from src.features.transaction_batch import TransactionBatch
+from src.models.batch_scoring import ANOMALY_THRESHOLD, score_transactions
+
+# A single NDJSON line may not grow the read buffer beyond this
+MAX_LINE_BYTES = 1024 * 1024
+
+def iter_ndjson_chunks(stream, chunk_size: int = 256, read_size: int = 64 * 1024,
+                       max_line_bytes: int = MAX_LINE_BYTES) -> Iterator[List[Dict]]:
+    """
+    Parse an NDJSON byte stream incrementally into chunks of records
+
+    A chunk is emitted as soon as it holds `chunk_size` records, or when the
+    bytes received so far contain no further complete line, so a slow feed
+    gets its records scored as they arrive instead of waiting for a full
+    chunk. Only one read buffer and one chunk are held at a time. Raises
+    ValueError on a malformed or oversized line.
+    """
+    buffer = b''
+    line_number = 0
+    chunk = []
+    while True:
+        data = stream.read(read_size)
+        if data:
+            buffer += data
+            lines = buffer.split(b'\n')
+            buffer = lines.pop()
+        else:
+            # End of stream: the last line needs no trailing newline
+            lines, buffer = [buffer], b''
+
+        for line in lines:
+            line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"line {line_number}: {e}")
+            if not isinstance(record, dict):
+                raise ValueError(f"line {line_number}: expected a JSON object")
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"line {line_number + 1}: longer than {max_line_bytes} bytes")
+        if chunk:
+            yield chunk
+            chunk = []
+        if not data:
+            return
+
+def _json_value(value):
+    # NaN and infinity are not valid JSON
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def score_transaction_stream(chunks: Iterator[List[Dict]], feature_extractor, detector=None,
+                             lock: Optional[threading.Lock] = None,
+                             threshold: float = ANOMALY_THRESHOLD) -> Iterator[Dict]:
+    """
+    Ingest chunks of transactions and yield score records as each chunk is done
+
+    Records are per transaction or per sender window depending on the model
+    (see `score_transactions`); scores are None without a usable detector.
+    Non-finite numbers (e.g. the window end of a chunk without valid
+    timestamps) are None as well, so every record serializes as strict JSON.
+    """
+    for chunk in chunks:
+        columns = score_transactions(TransactionBatch.from_records(chunk), feature_extractor,
+                                     detector, lock, threshold)
+        scored = ~np.isnan(columns["anomaly_score"])
+        names = list(columns)
+        for row, is_scored in zip(zip(*(np.asarray(columns[name]).tolist() for name in names)), scored.tolist()):
+            record = {name: _json_value(value) for name, value in zip(names, row)}
+            if not is_scored:
+                record.update(anomaly_score=None, anomaly_detected=None)
+            yield record
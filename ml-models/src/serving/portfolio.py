@@ -0,0 +1,46 @@
+import numpy as np
+from typing import Dict, List
+
+DEFAULT_RISK_SCORE = 50
+HIGH_RISK_THRESHOLD = 70
+
+def portfolio_risk(users: List[Dict], risk_table) -> Dict[str, np.ndarray]:
+    """
+    Value-weighted portfolio risk for many users at once
+
+    Every exposure of every user is flattened into one array, protocol
+    addresses are lowercased and deduplicated in a single pass, scored with
+    one vectorized table lookup, and the per-user sums are computed as
+    segment reductions with `np.bincount`.
+
+    Exposures count towards the weighted score when they have a protocol
+    address and a positive amount; protocols without a score weigh in at
+    DEFAULT_RISK_SCORE. Returns per-user `risk_score`, `exposure_count` and
+    `high_risk_exposure_count` arrays.
+    """
+    exposure_lists = [user.get('exposures') or [] for user in users]
+    counts = np.array([len(exposures) for exposures in exposure_lists], dtype=np.int64)
+    flat = [exposure for exposures in exposure_lists for exposure in exposures]
+
+    addresses = np.array([exposure.get('protocol_address') or '' for exposure in flat], dtype=str)
+    amounts = np.array([exposure.get('amount', 0) for exposure in flat], dtype=np.float64)
+
+    # One score lookup per distinct protocol
+    protocols, protocol_index = np.unique(np.char.lower(addresses), return_inverse=True)
+    protocol_scores = risk_table.get_many(protocols.tolist())
+    scores = protocol_scores[protocol_index]
+
+    segments = np.repeat(np.arange(len(users)), counts)
+    weights = np.where((addresses != '') & (amounts > 0), amounts, 0.0)
+    weighted_scores = np.where(np.isnan(scores), DEFAULT_RISK_SCORE, scores)
+    high_risk = np.nan_to_num(scores, nan=0.0) >= HIGH_RISK_THRESHOLD
+
+    total_value = np.bincount(segments, weights=weights, minlength=len(users))
+    weighted_risk = np.bincount(segments, weights=weights * weighted_scores, minlength=len(users))
+    risk_score = np.divide(weighted_risk, total_value, out=np.zeros(len(users)), where=total_value > 0)
+
+    return {
+        "risk_score": risk_score,
+        "exposure_count": counts,
+        "high_risk_exposure_count": np.bincount(segments, weights=high_risk, minlength=len(users)).astype(np.int64),
+    }
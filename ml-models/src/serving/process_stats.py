@@ -0,0 +1,33 @@
+import os
+import sys
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Dependencies whose import dominates worker startup time and memory
+HEAVY_MODULES = ('sklearn', 'scipy', 'pandas', 'joblib', 'tensorflow', 'torch')
+
+def resident_set_bytes() -> Optional[int]:
+    """
+    Current resident set size of this process in bytes
+
+    Reads /proc on Linux; elsewhere falls back to the peak RSS reported by
+    getrusage, or None when neither is available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def loaded_heavy_modules() -> List[str]:
+    """Which of HEAVY_MODULES have been imported so far"""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
@@ -0,0 +1,173 @@
+import cProfile
+import hmac
+import io
+import logging
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger('ml-server')
+
+# WSGI environ key set on requests being profiled. cProfile only sees the
+# request's own thread, so handlers should do their work inline for these
+# requests rather than hand it to another thread (e.g. the inference scheduler).
+PROFILED_ENVIRON_KEY = 'sentinel.profiled'
+
+class _ProfiledBody:
+    """Response iterable that keeps profiling while streaming handlers produce the body"""
+
+    def __init__(self, result, profiler: cProfile.Profile, on_close):
+        self._result = result
+        self._iterator = None
+        self._profiler = profiler
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._profiler.enable()
+        try:
+            if self._iterator is None:
+                self._iterator = iter(self._result)
+            return next(self._iterator)
+        finally:
+            self._profiler.disable()
+
+    def close(self):
+        on_close, self._on_close = self._on_close, None
+        if on_close is None:
+            return
+        try:
+            if hasattr(self._result, 'close'):
+                self._result.close()
+        finally:
+            on_close()
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware that runs cProfile around selected requests.
+
+    A request is profiled when it carries an `X-Profile` header (if
+    `header_enabled`) or is picked by `sample_rate`. The header is only
+    honoured together with an `X-Admin-Token` matching `admin_token`, and is
+    ignored altogether when no token is configured, as the admin endpoints are.
+    `X-Profile: summary` replaces the response body with the top functions by
+    cumulative time; otherwise the profile is written to `output_dir` as
+    `<timestamp>-<route>-<request id>.prof` (readable with `pstats` or
+    snakeviz) and the request id is returned in `X-Profile-Id`.
+
+    Only one request is profiled at a time; others that would be profiled
+    meanwhile run normally. Profiled requests carry `PROFILED_ENVIRON_KEY`
+    in their environ. The middleware is meant to be installed only
+    when profiling is enabled, so unprofiled deployments pay nothing.
+    """
+
+    def __init__(self, wsgi_app, output_dir, sample_rate: float = 0.0, header_enabled: bool = True,
+                 admin_token: Optional[str] = None, summary_lines: int = 40):
+        self.wsgi_app = wsgi_app
+        self.output_dir = Path(output_dir)
+        self.sample_rate = sample_rate
+        self.header_enabled = header_enabled
+        self.admin_token = admin_token
+        self.summary_lines = summary_lines
+        self._lock = threading.Lock()
+        self.profiled = 0
+
+    def _token_matches(self, provided: str) -> bool:
+        # Constant-time comparison so response timing does not leak the token
+        return hmac.compare_digest(provided.encode(), self.admin_token.encode())
+
+    def _mode(self, environ) -> Optional[str]:
+        requested = environ.get('HTTP_X_PROFILE') if self.header_enabled else None
+        if requested and self.admin_token and self._token_matches(environ.get('HTTP_X_ADMIN_TOKEN', '')):
+            return 'summary' if requested.lower() == 'summary' else 'file'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'file'
+        return None
+
+    def __call__(self, environ, start_response):
+        mode = self._mode(environ)
+        if mode is None or not self._lock.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+
+        environ[PROFILED_ENVIRON_KEY] = True
+        request_id = re.sub(r'[^A-Za-z0-9_.-]', '_', environ.get('HTTP_X_REQUEST_ID') or uuid.uuid4().hex[:16])[:64]
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        if mode == 'summary':
+            return self._summary(environ, start_response, profiler, request_id, started)
+
+        try:
+            def profiled_start_response(status, headers, exc_info=None):
+                return start_response(status, list(headers) + [('X-Profile-Id', request_id)], exc_info)
+
+            profiler.enable()
+            try:
+                result = self.wsgi_app(environ, profiled_start_response)
+            finally:
+                profiler.disable()
+        except BaseException:
+            self._lock.release()
+            raise
+        return _ProfiledBody(result, profiler, lambda: self._finish(environ, profiler, request_id, started))
+
+    def _finish(self, environ, profiler: cProfile.Profile, request_id: str, started: float) -> None:
+        try:
+            self._write(environ, profiler, request_id, started)
+        finally:
+            self._lock.release()
+
+    def _summary(self, environ, start_response, profiler: cProfile.Profile, request_id: str, started: float):
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            return lambda data: None
+
+        try:
+            profiler.enable()
+            try:
+                result = self.wsgi_app(environ, capture_start_response)
+                for _ in result:
+                    pass
+                if hasattr(result, 'close'):
+                    result.close()
+            finally:
+                profiler.disable()
+        finally:
+            self._lock.release()
+        self.profiled += 1
+
+        output = io.StringIO()
+        elapsed = time.perf_counter() - started
+        output.write(f"{environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} -> {captured.get('status')} "
+                     f"in {elapsed * 1000:.1f}ms (request {request_id})\n\n")
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(self.summary_lines)
+        body = output.getvalue().encode()
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+            ('X-Profile-Id', request_id),
+            ('X-Profile-Status', captured.get('status', '')),
+        ])
+        return [body]
+
+    def _write(self, environ, profiler: cProfile.Profile, request_id: str, started: float) -> None:
+        route = environ.get('sentinel.route') or environ.get('PATH_INFO', '')
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = self.output_dir / f"{int(time.time())}-{slug}-{request_id}.prof"
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(str(path))
+        except OSError as e:
+            logger.error("Could not write profile %s: %s", path, e)
+            return
+        self.profiled += 1
+        logger.info("Profiled %s request %s (%.1fms) to %s",
+                    route, request_id, (time.perf_counter() - started) * 1000, path)
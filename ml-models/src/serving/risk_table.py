@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; every process then rebuilds
+    fcntl = None
+
+logger = logging.getLogger('ml-server')
+
+MAGIC = b'SNTLRSK1'
+HEADER_SIZE = 16
+KEY_SIZE = 20
+
+def encode_address(address: str) -> Optional[bytes]:
+    """
+    Encode a 0x-prefixed hex address as its 20 raw bytes, or None if it is not one
+    """
+    if address.startswith(('0x', '0X')):
+        address = address[2:]
+    if len(address) != 2 * KEY_SIZE:
+        return None
+    try:
+        return bytes.fromhex(address)
+    except ValueError:
+        return None
+
+def fallback_risk_score(address: str) -> int:
+    """
+    Deterministic placeholder score in [20, 80] for addresses without a precomputed score
+    """
+    digest = hashlib.blake2b(address.lower().encode(), digest_size=4).digest()
+    return 20 + int.from_bytes(digest, 'big') % 61
+
+def write_risk_table(scores: Dict[str, float], path) -> int:
+    """
+    Write an address -> score table and atomically swap it into place
+
+    Layout: 8-byte magic, little-endian uint64 count, `count` sorted 20-byte
+    addresses, then `count` little-endian float32 scores. Returns the number
+    of entries written; addresses that are not 20-byte hex are skipped.
+    """
+    encoded = {}
+    for address, score in scores.items():
+        key = encode_address(address)
+        if key is not None:
+            encoded[key] = score
+    keys = sorted(encoded)
+
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.array([len(keys)], dtype='<u8').tobytes())
+        f.write(b''.join(keys))
+        f.write(np.array([encoded[k] for k in keys], dtype='<f4').tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(keys)
+
+class RiskScoreTable:
+    """
+    Read-only, memory-mapped address -> risk score table.
+
+    Every worker maps the same file, so the OS page cache holds one copy no
+    matter how many processes serve requests. Lookups are a binary search
+    over the sorted 20-byte keys. The file is re-checked at most every
+    `check_interval` seconds and remapped when a rebuilt table has been
+    swapped in.
+    """
+
+    def __init__(self, path, check_interval: float = 5.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._identity = None
+        self._next_check = 0.0
+        self._tables = (np.empty(0, dtype=f'S{KEY_SIZE}'), np.empty(0, dtype='<f4'))
+        self.refresh(force=True)
+
+    def __len__(self) -> int:
+        return len(self._tables[0])
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Remap the file if it changed since it was last mapped; returns True on remap
+        """
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return False
+
+        data = np.memmap(self.path, dtype=np.uint8, mode='r')
+        if data[:len(MAGIC)].tobytes() != MAGIC:
+            logger.error("Ignoring risk score table with bad header: %s", self.path)
+            return False
+        count = int(data[len(MAGIC):HEADER_SIZE].view('<u8')[0])
+        keys_end = HEADER_SIZE + count * KEY_SIZE
+        keys = data[HEADER_SIZE:keys_end].view(f'S{KEY_SIZE}')
+        scores = data[keys_end:keys_end + 4 * count].view('<f4')
+
+        # Single attribute swap so concurrent readers see either table whole
+        self._tables = (keys, scores)
+        self._identity = identity
+        return True
+
+    def get(self, address: str, default=None):
+        """
+        Look up the score for an address in O(log n)
+        """
+        self.refresh()
+        key = encode_address(address)
+        if key is None:
+            return default
+        keys, scores = self._tables
+        query = np.array([key], dtype=keys.dtype)
+        i = int(np.searchsorted(keys, query[0]))
+        # Compare as arrays: fixed-width bytes scalars drop trailing NUL bytes
+        if i < len(keys) and keys[i:i + 1] == query:
+            return float(scores[i])
+        return default
+
+    def get_many(self, addresses, default: float = np.nan) -> np.ndarray:
+        """
+        Look up scores for many addresses with one vectorized binary search
+        """
+        self.refresh()
+        keys, scores = self._tables
+        encoded = [encode_address(address) for address in addresses]
+        valid = np.array([key is not None for key in encoded], dtype=bool)
+        query = np.array([key or b'' for key in encoded], dtype=keys.dtype)
+        result = np.full(len(query), default, dtype=np.float64)
+        if len(keys) == 0 or len(query) == 0:
+            return result
+        positions = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        found = valid & (keys[positions] == query)
+        result[found] = scores[positions[found]]
+        return result
+
+class RiskTableRefresher:
+    """
+    Background job that periodically rebuilds the risk score table from
+    `source` and swaps it in atomically.
+
+    When several workers run a refresher against the same path, a
+    non-blocking file lock keeps them from rebuilding at the same time, and
+    a worker skips its rebuild if another one wrote the table less than half
+    an interval ago. The table is then rebuilt at most about twice per
+    interval, however many workers there are, and is never older than one
+    interval.
+    """
+
+    def __init__(self, source: Callable[[], Dict[str, float]], path, interval: float = 300.0):
+        self.source = source
+        self.path = Path(path)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh_now(self, force: bool = False) -> bool:
+        """
+        Rebuild the table unless another process is already doing so or,
+        without `force`, rebuilt it less than half an interval ago
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(self.path.name + '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return False
+            if not force and self._table_age() < self.interval / 2:
+                return False
+            count = write_risk_table(self.source(), self.path)
+        logger.info("Rebuilt risk score table with %d entries at %s", count, self.path)
+        return True
+
+    def _table_age(self) -> float:
+        try:
+            return time.time() - self.path.stat().st_mtime
+        except FileNotFoundError:
+            return float('inf')
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='risk-table-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh_now()
+            except Exception as e:
+                logger.error("Error rebuilding risk score table: %s", e)
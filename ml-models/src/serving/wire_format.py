@@ -0,0 +1,59 @@
+import struct
+import numpy as np
+from typing import Union
+
+# Media type of a dense matrix in the binary wire format
+MATRIX_MEDIA_TYPE = 'application/x-sentinel-matrix'
+
+MAGIC = b'SNTM'
+
+# magic, dtype code, 3 padding bytes, rows, cols (24 bytes, so the payload stays 8-byte aligned)
+HEADER = struct.Struct('<4sB3xQQ')
+HEADER_SIZE = HEADER.size
+
+DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f8')}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+class WireFormatError(ValueError):
+    """Raised when a binary payload is malformed"""
+
+def encode_matrix(matrix, dtype: str = '<f8') -> bytes:
+    """
+    Serialize a 1-D or 2-D array as header + little-endian row-major values
+
+    A 1-D array is sent as a single column.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in DTYPE_CODES:
+        raise WireFormatError(f"Unsupported dtype {dtype}; expected float32 or float64")
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(-1, 1)
+    if matrix.ndim != 2:
+        raise WireFormatError(f"Expected a 1-D or 2-D array, got {matrix.ndim} dimensions")
+    payload = np.ascontiguousarray(matrix, dtype=dtype)
+    return HEADER.pack(MAGIC, DTYPE_CODES[dtype], payload.shape[0], payload.shape[1]) + payload.tobytes()
+
+def decode_matrix(buffer: Union[bytes, bytearray, memoryview], allow_non_finite: bool = False) -> np.ndarray:
+    """
+    Wrap a binary payload in a rows x cols array without copying
+
+    The array is a read-only view of `buffer`; float64 payloads reach the
+    detector as-is, float32 ones are widened by it. NaN and infinite values
+    are rejected unless `allow_non_finite` is set.
+    """
+    if len(buffer) < HEADER_SIZE:
+        raise WireFormatError(f"Payload of {len(buffer)} bytes is shorter than the {HEADER_SIZE}-byte header")
+    magic, code, rows, cols = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise WireFormatError(f"Bad magic {magic!r}")
+    dtype = DTYPES.get(code)
+    if dtype is None:
+        raise WireFormatError(f"Unknown dtype code {code}")
+    expected = HEADER_SIZE + rows * cols * dtype.itemsize
+    if len(buffer) != expected:
+        raise WireFormatError(f"Payload is {len(buffer)} bytes, header describes {expected}")
+    matrix = np.frombuffer(buffer, dtype=dtype, count=rows * cols, offset=HEADER_SIZE).reshape(rows, cols)
+    if not allow_non_finite and not np.isfinite(matrix).all():
+        raise WireFormatError("Matrix contains NaN or infinite values")
+    return matrix
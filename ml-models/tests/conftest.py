@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Modules import each other as `src.…`, relative to ml-models/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+@pytest.fixture(scope='session')
+def training_rows():
+    """Seeded 5-feature training matrix with unequal feature scales"""
+    rng = np.random.default_rng(7)
+    return rng.normal(loc=[1.0, 50.0, -3.0, 0.0, 10.0], scale=[1.0, 20.0, 0.5, 2.0, 5.0], size=(2000, 5))
+
+@pytest.fixture(scope='session')
+def trained_detector(training_rows):
+    """DeFiAnomalyDetector fitted on `training_rows`; treat as read-only"""
+    from src.models.anomaly_detector import DeFiAnomalyDetector
+    detector = DeFiAnomalyDetector()
+    detector.train(training_rows)
+    return detector
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The server's `app` module, imported without its log file"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('LOG_FILE', '')
+        import app
+    yield app
+    # Flush the log writer while pytest's captured stderr is still open
+    app.log_pipeline.stop()
+
+@pytest.fixture
+def make_app(app_module, tmp_path, monkeypatch):
+    """
+    Build the Flask app with its files under `tmp_path`; keyword arguments
+    set environment variables, and `model=` saves a detector as the global model
+    """
+    def make(model=None, **env):
+        settings = {
+            'ANOMALY_MODEL_PATH': str(tmp_path / 'anomaly_detector.joblib'),
+            'PROTOCOL_MODELS_DIR': str(tmp_path / 'protocols'),
+            'RISK_TABLE_PATH': str(tmp_path / 'risk_scores.bin'),
+            'RISK_SCORES_PATH': str(tmp_path / 'risk_scores.json'),
+            'MODEL_WATCH_INTERVAL': '0',
+            'ENABLE_CORS': 'False',
+        }
+        settings.update(env)
+        for key, value in settings.items():
+            monkeypatch.setenv(key, str(value))
+        if model is not None:
+            model.save_model(settings['ANOMALY_MODEL_PATH'])
+        return app_module.create_app()
+    return make
@@ -0,0 +1,73 @@
+import json
+import os
+import pickle
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from src.features.address_profiles import AddressProfileStore
+
+def _addresses(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # Zipf-like: a few very frequent addresses and a long tail
+    return [f"0x{rank:040x}" for rank in np.minimum(rng.zipf(1.5, size=n), 5000).tolist()]
+
+def test_exact_counts_match_counter():
+    addresses = _addresses(5000)
+    store = AddressProfileStore()
+    store.update(addresses[:2000])
+    for address in addresses[2000:]:
+        store.add(address)
+    expected = Counter(addresses)
+    assert not store.bounded
+    assert store.total == len(addresses)
+    for address, count in expected.items():
+        assert store.count(address) == count
+        assert store.frequency(address) == count / len(addresses)
+    assert store.count('0xmissing') == 0
+    assert '0xmissing' not in store
+
+def test_add_with_count():
+    store = AddressProfileStore()
+    store.add('0xa', 3)
+    store.add('0xa', 2)
+    store.add('0xb')
+    assert store.count('0xa') == 5
+    assert store.frequency('0xb') == 1 / 6
+
+def test_empty_store_frequency_is_zero():
+    assert AddressProfileStore().frequency('0xa') == 0.0
+    assert AddressProfileStore(sketch_width=64).frequency('0xa') == 0.0
+
+def test_sketch_never_underestimates_and_has_fixed_size():
+    addresses = _addresses(20000, seed=1)
+    store = AddressProfileStore(sketch_width=512, sketch_depth=4)
+    nbytes = store.nbytes
+    store.update(addresses)
+    expected = Counter(addresses)
+    assert store.bounded
+    assert store.nbytes == nbytes == 512 * 4 * 8
+    errors = np.array([store.count(address) - count for address, count in expected.items()])
+    assert errors.min() >= 0
+    # Count-min bound: error <= e/width * total with probability 1 - exp(-depth)
+    bound = np.e / 512 * len(addresses)
+    assert np.mean(errors <= bound) > 0.95
+    # Heavy hitters are essentially exact
+    top, top_count = expected.most_common(1)[0]
+    assert store.count(top) - top_count <= bound
+
+def test_pickled_sketch_reads_the_same_in_another_process(tmp_path):
+    # Backfill checkpoints restore the sketch in a new process, whose str hashes are salted differently
+    store = AddressProfileStore(sketch_width=64)
+    store.update(_addresses(500, seed=3))
+    path = tmp_path / 'store.pkl'
+    path.write_bytes(pickle.dumps(store))
+    script = (f"import pickle; store = pickle.load(open({str(path)!r}, 'rb')); "
+              f"print([store.count(a) for a in {sorted(set(_addresses(500, seed=3)))!r}])")
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).resolve().parent.parent,
+                            env=dict(os.environ, PYTHONHASHSEED='12345')).stdout
+    assert json.loads(output) == [store.count(a) for a in sorted(set(_addresses(500, seed=3)))]
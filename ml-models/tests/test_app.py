@@ -0,0 +1,300 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.models.batch_scoring import ADDRESS_FEATURE_COUNT
+from src.serving.asgi_bridge import AsgiBridge
+from src.serving.wire_format import MATRIX_MEDIA_TYPE, decode_matrix, encode_matrix
+from test_asgi_bridge import _call, _scope
+from test_metrics import _samples
+
+def _transaction(i):
+    return {'hash': f"0x{i:064x}", 'from': f"0x{i % 9:040x}", 'to': f"0x{i % 5:040x}",
+            'value': float(i + 1), 'gasPrice': 20.0, 'gasUsed': 21000.0, 'timestamp': 1_700_000_000.0 + i}
+
+def _ndjson(records):
+    return b''.join(json.dumps(record).encode() + b'\n' for record in records)
+
+@pytest.fixture
+def stream_app(make_app, trained_detector):
+    # A transaction-level model, so the stream returns one line per transaction
+    return make_app(trained_detector, MOCK_DATA=False, STREAM_CHUNK_SIZE=50, MAX_REQUEST_MB=0.01)
+
+def test_transaction_stream_scores_every_chunk(stream_app):
+    records = [_transaction(i) for i in range(300)]
+    payload = _ndjson(records)
+    # The stream is exempt from MAX_REQUEST_MB
+    assert len(payload) > 0.01 * 1024 * 1024
+    response = stream_app.test_client().post('/api/transactions/stream', data=payload,
+                                             content_type='application/x-ndjson')
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data().splitlines()]
+    assert [line['hash'] for line in lines[:-1]] == [record['hash'] for record in records]
+    assert all(0 <= line['anomaly_score'] <= 1 for line in lines[:-1])
+    assert lines[-1]['done'] and lines[-1]['results'] == 300
+
+def test_transaction_stream_reports_bad_lines_in_band(stream_app):
+    payload = _ndjson([_transaction(i) for i in range(60)]) + b'{"hash": \n'
+    response = stream_app.test_client().post('/api/transactions/stream', data=payload,
+                                             content_type='application/x-ndjson')
+    lines = [json.loads(line) for line in response.get_data().splitlines()]
+    # Complete chunks are scored; the chunk holding the bad line is not
+    assert response.status_code == 200 and len(lines) == 51
+    assert lines[-1]['error'].startswith('Invalid transaction data: line 61')
+
+def test_transaction_stream_through_the_asgi_bridge(stream_app):
+    records = [_transaction(i) for i in range(500)]
+    payload = _ndjson(records)
+    # Chunked upload without a Content-Length, in pieces that split lines
+    pieces = [payload[i:i + 1000] for i in range(0, len(payload), 1000)]
+    status, _, body, _ = _call(AsgiBridge(stream_app, max_workers=4), _scope(
+        '/api/transactions/stream', 'POST', [('Content-Type', 'application/x-ndjson')]), pieces)
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert status == 200
+    assert [line['hash'] for line in lines[:-1]] == [record['hash'] for record in records]
+    assert lines[-1]['done'] and lines[-1]['results'] == 500
+
+@pytest.fixture(scope='module')
+def address_detector():
+    """Detector trained on server-side address feature vectors"""
+    detector = DeFiAnomalyDetector()
+    detector.train(np.random.default_rng(3).normal(size=(500, ADDRESS_FEATURE_COUNT)))
+    return detector
+
+@pytest.fixture
+def scored_features(monkeypatch):
+    """Feature rows the model was asked to score; the model reports every one as anomalous"""
+    rows = []
+
+    def get_anomaly_score(self, features):
+        rows.append(np.array(features[0]))
+        return 0.9
+    monkeypatch.setattr(DeFiAnomalyDetector, 'get_anomaly_score', get_anomaly_score)
+    return rows
+
+def test_window_end_bounds_server_features_without_changing_them(make_app, address_detector, scored_features):
+    client = make_app(address_detector, MOCK_DATA=False).test_client()
+    sender = '0x' + 'a' * 40
+    # One transaction every 10 minutes; the sender's window covers the last hour
+    transactions = [dict(_transaction(i), **{'from': sender, 'value': float(i), 'timestamp': 600.0 * i})
+                    for i in range(10)]
+    assert client.post('/api/transactions/ingest', json={'transactions': transactions}).status_code == 200
+
+    def temporal(window_end=None):
+        body = {'address': sender} if window_end is None else {'address': sender, 'window_end': window_end}
+        response = client.post('/api/anomaly/detect', json=body)
+        assert response.status_code == 200 and response.get_json()['model'] == 'global'
+        return scored_features[-1][:3]
+
+    latest = temporal()
+    # The window holds transactions 3..9 (1800s to 5400s)
+    assert latest[1] == pytest.approx(6.0)
+    # A past window end counts only the events up to it
+    assert temporal(4200)[1] == pytest.approx(np.mean([3, 4, 5, 6, 7]))
+    # A window end past the data sees nothing, and later queries are unaffected
+    np.testing.assert_array_equal(temporal(1e9), np.zeros(3))
+    np.testing.assert_array_equal(temporal(), latest)
+    np.testing.assert_array_equal(temporal(5400), latest)
+
+@pytest.mark.parametrize('window_end', ['abc', True, [1], 1e400])
+def test_invalid_window_end_is_rejected(make_app, address_detector, scored_features, window_end):
+    client = make_app(address_detector, MOCK_DATA=False).test_client()
+    response = client.post('/api/anomaly/detect', json={'address': '0x' + 'a' * 40, 'window_end': window_end})
+    assert response.status_code == 400 and 'window_end' in response.get_json()['error']
+    assert not scored_features
+
+def test_non_finite_window_end_is_rejected(make_app):
+    client = make_app().test_client()
+    response = client.post('/api/anomaly/detect', data='{"address": "0xa", "window_end": NaN}',
+                           content_type='application/json')
+    assert response.status_code == 400
+
+@pytest.mark.parametrize('admin_token, profiled', [('', False), ('secret', True)])
+def test_profile_header_needs_the_admin_token(make_app, tmp_path, admin_token, profiled):
+    client = make_app(PROFILING_ENABLED=True, ADMIN_TOKEN=admin_token, PROFILE_DIR=str(tmp_path / 'profiles')).test_client()
+    response = client.get('/health', headers={'X-Profile': 'summary', 'X-Admin-Token': admin_token})
+    assert response.status_code == 200
+    assert ('X-Profile-Status' in response.headers) is profiled
+
+AAVE = '0x7fc66500c84a76ad7e9c93437bfc5ac33e2ddae9'  # risk score 25 in the seed table
+CHAINLINK = '0x514910771af9ca656af840dff83e8264ecf986ca'  # risk score 72
+
+def test_user_risk(make_app):
+    client = make_app().test_client()
+    exposures = [{'protocol_address': AAVE, 'amount': 100}, {'protocol_address': CHAINLINK.upper()[2:], 'amount': 0},
+                 {'protocol_address': CHAINLINK, 'amount': 300}]
+    body = client.post('/api/user/risk', json={'user_address': '0xu', 'exposures': exposures}).get_json()
+    assert body['user_address'] == '0xu' and body['risk_score'] == (25 * 100 + 72 * 300) / 400
+    # An exposure without an amount adds no weight but still counts as a high-risk exposure
+    assert body['exposure_count'] == 3 and body['high_risk_exposure_count'] == 2
+
+    users = [{'user_address': '0xu', 'exposures': exposures}, {'user_address': '0xv'}]
+    body = client.post('/api/user/risk/batch', json={'users': users}).get_json()
+    assert body['count'] == 2
+    assert [result['risk_score'] for result in body['results']] == [(25 * 100 + 72 * 300) / 400, 0.0]
+
+@pytest.mark.parametrize('route, body', [
+    ('/api/user/risk', {'exposures': []}),
+    ('/api/user/risk', [1, 2]),
+    ('/api/user/risk', {'user_address': '0xu', 'exposures': [{'protocol_address': AAVE, 'amount': 'abc'}]}),
+    ('/api/user/risk', {'user_address': '0xu', 'exposures': ['not an exposure']}),
+    ('/api/user/risk/batch', {'users': {'user_address': '0xu'}}),
+    ('/api/user/risk/batch', {'users': [{'exposures': []}]}),
+    ('/api/user/risk/batch', {'users': [{'user_address': '0xu', 'exposures': [{'amount': 'abc'}]}]}),
+])
+def test_user_risk_rejects_bad_input(make_app, route, body):
+    response = make_app().test_client().post(route, json=body)
+    assert response.status_code == 400 and 'error' in response.get_json()
+
+def _features(row):
+    return {f"f{i}": float(value) for i, value in enumerate(row)}
+
+def test_batch_anomaly_detection_scores_with_one_model_call(make_app, trained_detector, training_rows):
+    client = make_app(trained_detector, MOCK_DATA=False).test_client()
+    protocols = [{'address': f"0x{i:040x}", 'features': _features(training_rows[i])} for i in range(20)]
+    # Malformed features and protocols without features fall back to mock responses on their own
+    protocols[3]['features'] = {'f0': 'abc'}
+    protocols.append({'address': AAVE})
+    response = client.post('/api/anomaly/detect/batch', json={'protocols': protocols})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == 21 and [r['address'] for r in body['results']] == [p['address'] for p in protocols]
+    scored = [i for i in range(20) if i != 3]
+    expected = trained_detector.score_batch(training_rows[scored])
+    np.testing.assert_allclose([body['results'][i]['anomaly_score'] for i in scored], expected)
+    assert all(body['results'][i]['model'] == 'global' for i in scored)
+    assert 'model' not in body['results'][3] and 'model' not in body['results'][20]
+
+@pytest.mark.parametrize('body', [
+    [1, 2], {'protocols': {'address': '0xa'}}, {'protocols': [{'features': {}}]}, {'protocols': ['0xa']},
+])
+def test_batch_anomaly_detection_rejects_bad_requests(make_app, body):
+    response = make_app().test_client().post('/api/anomaly/detect/batch', json=body)
+    assert response.status_code == 400 and 'error' in response.get_json()
+
+def test_model_reload_swaps_in_a_new_model(make_app, tmp_path, trained_detector, training_rows, address_detector):
+    client = make_app(trained_detector, MOCK_DATA=False, ADMIN_TOKEN='secret').test_client()
+    admin = {'X-Admin-Token': 'secret'}
+    before = client.get('/').get_json()['model_version']
+    assert client.post('/admin/model/reload').status_code == 403
+    assert client.post('/admin/model/reload', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+    retrained = DeFiAnomalyDetector()
+    retrained.train(training_rows[::-1][:1000] * 2)
+    retrained.save_model(tmp_path / 'anomaly_detector.joblib')
+    response = client.post('/admin/model/reload?wait=true', headers=admin)
+    assert response.status_code == 200 and response.get_json()['status'] == 'reloaded'
+    after = response.get_json()['model']['version']
+    assert after != before and client.get('/').get_json()['model_version'] == after
+    protocols = [{'address': f"0x{i:040x}", 'features': _features(training_rows[i])} for i in range(5)]
+    results = client.post('/api/anomaly/detect/batch', json={'protocols': protocols}).get_json()['results']
+    np.testing.assert_allclose([r['anomaly_score'] for r in results], retrained.score_batch(training_rows[:5]))
+
+    # A model of another width is rejected and the active one stays
+    address_detector.save_model(tmp_path / 'anomaly_detector.joblib')
+    response = client.post('/admin/model/reload?wait=true', headers=admin)
+    assert response.status_code == 422 and response.get_json()['status'] == 'rejected'
+    assert 'features' in response.get_json()['error']
+    assert client.get('/').get_json()['model_version'] == after
+    assert client.post('/admin/model/reload', headers=admin).status_code == 202
+
+def test_model_reload_is_disabled_without_an_admin_token(make_app, trained_detector):
+    client = make_app(trained_detector, ADMIN_TOKEN='').test_client()
+    assert client.post('/admin/model/reload', headers={'X-Admin-Token': ''}).status_code == 403
+
+def test_ingest_adds_transactions_to_the_feature_state(make_app, address_detector, scored_features):
+    client = make_app(address_detector, MOCK_DATA=False).test_client()
+    transactions = [_transaction(i) for i in range(30)]
+    response = client.post('/api/transactions/ingest', json={'transactions': transactions})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['ingested'] == 30 and body['addresses'] == 9
+    # Ingested senders are scored from server-side features
+    assert client.post('/api/anomaly/detect', json={'address': transactions[0]['from']}).get_json()['model'] == 'global'
+    assert scored_features[-1].shape == (ADDRESS_FEATURE_COUNT,)
+
+@pytest.mark.parametrize('body', [
+    [1], {'transactions': {'from': '0xa'}},
+    {'transactions': [{'to': '0xb', 'value': 1, 'gasPrice': 1, 'gasUsed': 1, 'timestamp': 0}]},
+    {'transactions': [dict(_transaction(0), value='abc')]},
+])
+def test_ingest_rejects_bad_requests(make_app, body):
+    response = make_app().test_client().post('/api/transactions/ingest', json=body)
+    assert response.status_code == 400 and 'error' in response.get_json()
+
+def test_metrics_endpoint(make_app, trained_detector, training_rows):
+    client = make_app(trained_detector, MOCK_DATA=False).test_client()
+    for _ in range(3):
+        client.get('/health')
+    for method in ('FOO', 'BAR'):
+        client.open('/health', method=method)
+    client.get('/no/such/route')
+    protocols = [{'address': f"0x{i:040x}", 'features': _features(training_rows[i])} for i in range(7)]
+    client.post('/api/anomaly/detect/batch', json={'protocols': protocols + [{'address': AAVE}]})
+
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.content_type.startswith('text/plain; version=0.0.4')
+    samples = _samples(response.get_data(as_text=True))
+    duration = 'sentinel_request_duration_seconds_count{{route="{}",method="{}",status="{}"}}'
+    assert samples[duration.format('/health', 'GET', 200)] == 3
+    # Unknown verbs share one series
+    assert samples[duration.format('unmatched', 'other', 405)] == 2
+    assert not any('FOO' in name or 'BAR' in name for name in samples)
+    assert samples[duration.format('unmatched', 'GET', 404)] == 1
+    assert samples[duration.format('/api/anomaly/detect/batch', 'POST', 200)] == 1
+    assert samples['sentinel_model_batch_size_sum'] == 7 and samples['sentinel_model_batch_size_count'] == 1
+    assert samples['sentinel_phase_duration_seconds_count{phase="scoring"}'] == 1
+    assert samples['sentinel_mock_fallbacks_total{endpoint="detect_anomaly_batch"}'] == 1
+    assert samples['sentinel_risk_table_entries'] == 8
+
+def test_binary_matrix_scoring(make_app, trained_detector, training_rows):
+    client = make_app(trained_detector, MOCK_DATA=False).test_client()
+    expected = trained_detector.score_batch(training_rows[:50])
+    payload = encode_matrix(training_rows[:50], dtype='<f4')
+    response = client.post('/api/anomaly/detect/batch', data=payload, content_type=MATRIX_MEDIA_TYPE,
+                           headers={'Accept': MATRIX_MEDIA_TYPE})
+    assert response.status_code == 200 and response.mimetype == MATRIX_MEDIA_TYPE
+    assert response.headers['X-Model'] == 'global'
+    scores = decode_matrix(response.get_data())[:, 0]
+    np.testing.assert_allclose(scores, trained_detector.score_batch(training_rows[:50].astype('<f4')))
+    np.testing.assert_allclose(scores, expected, atol=1e-3)
+
+    body = client.post('/api/anomaly/detect/batch', data=encode_matrix(training_rows[:5]),
+                       content_type=MATRIX_MEDIA_TYPE).get_json()
+    assert body['count'] == 5 and body['model'] == 'global'
+    np.testing.assert_allclose(body['anomaly_scores'], expected[:5])
+
+@pytest.mark.parametrize('matrix', ['truncated', 'nan', 'width'])
+def test_binary_matrix_rejects_bad_payloads(make_app, trained_detector, training_rows, matrix):
+    client = make_app(trained_detector, MOCK_DATA=False).test_client()
+    rows = training_rows[:4].copy()
+    if matrix == 'truncated':
+        payload = encode_matrix(rows)[:-3]
+    elif matrix == 'nan':
+        rows[1, 2] = np.nan
+        payload = encode_matrix(rows)
+    else:
+        payload = encode_matrix(rows[:, :3])
+    response = client.post('/api/anomaly/detect/batch', data=payload, content_type=MATRIX_MEDIA_TYPE)
+    assert response.status_code == 400 and 'error' in response.get_json()
+
+def test_binary_matrix_needs_a_model(make_app, training_rows):
+    response = make_app().test_client().post('/api/anomaly/detect/batch', data=encode_matrix(training_rows[:4]),
+                                             content_type=MATRIX_MEDIA_TYPE)
+    assert response.status_code == 503
+
+@pytest.mark.parametrize('route, content_type', [
+    ('/api/anomaly/detect/batch', MATRIX_MEDIA_TYPE),
+    ('/api/anomaly/detect/batch', 'application/json'),
+    ('/api/transactions/ingest', 'application/json'),
+    ('/api/user/risk', 'application/json'),
+])
+def test_bodies_over_max_request_mb_are_rejected(make_app, trained_detector, route, content_type):
+    client = make_app(trained_detector, MOCK_DATA=False, MAX_REQUEST_MB=0.01).test_client()
+    payload = b' ' * (11 * 1024) + b'{}'
+    response = client.post(route, data=payload, content_type=content_type)
+    assert response.status_code == 413
+    # The same body under the limit is read normally
+    assert client.post(route, data=payload[-100:], content_type=content_type).status_code == 400
@@ -0,0 +1,208 @@
+import asyncio
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.serving import asgi_bridge
+from src.serving.asgi_bridge import AsgiBridge
+
+def _scope(path='/', method='GET', headers=(), query=b''):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query,
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+    }
+
+def _call(bridge, scope, body_chunks=(b'',)):
+    """Run one request through the bridge; returns (status, headers, body, sent messages)"""
+    async def run():
+        incoming = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(body_chunks) - 1}
+                    for i, chunk in enumerate(body_chunks)]
+        sent = []
+
+        async def receive():
+            if incoming:
+                return incoming.pop(0)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await bridge(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    start = sent[0]
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    return start['status'], dict(start['headers']), body, sent
+
+def _echo_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+    return [body]
+
+def test_buffered_body_and_environ():
+    seen = {}
+
+    def app(environ, start_response):
+        seen.update(environ)
+        return _echo_app(environ, start_response)
+
+    bridge = AsgiBridge(app, max_workers=2)
+    status, headers, body, _ = _call(bridge, _scope('/api/x', 'POST', [
+        ('Content-Type', 'application/json'), ('Content-Length', '7'), ('X-Token', 'abc')
+    ], query=b'a=1'), [b'{"a"', b':1}'])
+    assert status == 200 and body == b'{"a":1}'
+    assert headers[b'Content-Length'] == b'7'
+    assert seen['PATH_INFO'] == '/api/x' and seen['QUERY_STRING'] == 'a=1'
+    assert seen['CONTENT_TYPE'] == 'application/json' and seen['CONTENT_LENGTH'] == '7'
+    assert seen['HTTP_X_TOKEN'] == 'abc' and seen['sentinel.async'] is True
+    assert seen['wsgi.input_terminated'] is False
+
+def test_repeated_headers_are_joined():
+    seen = {}
+
+    def app(environ, start_response):
+        seen.update(environ)
+        return _echo_app(environ, start_response)
+
+    _call(AsgiBridge(app), _scope(headers=[
+        ('Accept', 'application/json'), ('Accept', 'text/plain'),
+        ('Cookie', 'a=1'), ('Cookie', 'b=2'),
+        ('X-Forwarded-For', '10.0.0.1'), ('x-forwarded-for', '10.0.0.2'),
+    ]))
+    assert seen['HTTP_ACCEPT'] == 'application/json,text/plain'
+    assert seen['HTTP_COOKIE'] == 'a=1; b=2'
+    assert seen['HTTP_X_FORWARDED_FOR'] == '10.0.0.1,10.0.0.2'
+
+def test_large_and_chunked_bodies_are_streamed(monkeypatch):
+    monkeypatch.setattr(asgi_bridge, 'BUFFERED_BODY_LIMIT', 4)
+    chunks = [b'abc', b'defgh', b'', b'ij']
+    status, _, body, _ = _call(AsgiBridge(_echo_app), _scope(method='POST'), chunks)
+    assert status == 200 and body == b''.join(chunks)
+    status, _, body, _ = _call(AsgiBridge(_echo_app), _scope(method='POST', headers=[('Content-Length', '10')]),
+                               chunks)
+    assert body == b''.join(chunks)
+
+def test_streamed_body_reads_return_what_has_arrived(monkeypatch):
+    monkeypatch.setattr(asgi_bridge, 'BUFFERED_BODY_LIMIT', 4)
+    reads = []
+
+    def app(environ, start_response):
+        # Each read returns once some body is there instead of waiting for 1024 bytes
+        while True:
+            data = environ['wsgi.input'].read(1024)
+            if not data:
+                break
+            reads.append(data)
+        start_response('200 OK', [('Content-Length', '0')])
+        return [b'']
+
+    _call(AsgiBridge(app), _scope(method='POST'), [b'abc', b'defgh', b'', b'ij'])
+    assert reads == [b'abc', b'defgh', b'ij']
+
+def test_streaming_response_is_sent_chunk_by_chunk():
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+        return iter([b'{"a": 1}\n', b'', b'{"a": 2}\n'])
+
+    status, _, body, sent = _call(AsgiBridge(app), _scope())
+    assert status == 200 and body == b'{"a": 1}\n{"a": 2}\n'
+    assert [m.get('more_body', False) for m in sent[1:]] == [True, True, False]
+
+def test_simulated_latency_does_not_hold_a_thread():
+    def app(environ, start_response):
+        environ['sentinel.simulated_latency'] = 0.2
+        return _echo_app(environ, start_response)
+
+    bridge = AsgiBridge(app, max_workers=1)
+
+    async def run_many():
+        async def one():
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                pass
+
+            await bridge(_scope(headers=[('Content-Length', '0')]), receive, send)
+        await asyncio.gather(*(one() for _ in range(5)))
+
+    started = time.perf_counter()
+    asyncio.run(run_many())
+    # Five delayed requests on one worker thread overlap their delays
+    assert time.perf_counter() - started < 0.6
+
+def test_application_error_returns_500():
+    def app(environ, start_response):
+        raise RuntimeError("boom")
+
+    sent = []
+
+    async def run():
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await AsgiBridge(app)(_scope(headers=[('Content-Length', '0')]), receive, send)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert sent[0]['status'] == 500
+
+def test_lifespan_shuts_down_executor():
+    bridge = AsgiBridge(_echo_app)
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def run():
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await bridge({'type': 'lifespan'}, receive, send)
+
+    asyncio.run(run())
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert bridge.executor._shutdown
+
+class _RoundRobinExecutor:
+    """Runs each call on the next of several threads, as a busy pool may"""
+
+    def __init__(self, n_threads):
+        self.pools = [ThreadPoolExecutor(max_workers=1) for _ in range(n_threads)]
+        self.calls = itertools.count()
+
+    def submit(self, function, *args):
+        return self.pools[next(self.calls) % len(self.pools)].submit(function, *args)
+
+    def shutdown(self, wait=True):
+        for pool in self.pools:
+            pool.shutdown(wait=wait)
+
+def test_streams_the_transaction_route_of_the_real_app(make_app, trained_detector, monkeypatch):
+    monkeypatch.setattr(asgi_bridge, 'BUFFERED_BODY_LIMIT', 0)
+    bridge = AsgiBridge(make_app(trained_detector, MOCK_DATA=False, STREAM_CHUNK_SIZE=16))
+    # The app call, each pull of the streamed body and its close() run on different threads
+    bridge.executor = _RoundRobinExecutor(3)
+    records = [{'hash': f"0x{i:064x}", 'from': f"0x{i % 9:040x}", 'to': f"0x{i % 5:040x}",
+                'value': float(i + 1), 'gasPrice': 20.0, 'gasUsed': 21000.0, 'timestamp': 1_700_000_000.0 + i}
+               for i in range(600)]
+    payload = b''.join(json.dumps(record).encode() + b'\n' for record in records)
+    pieces = [payload[i:i + 4096] for i in range(0, len(payload), 4096)]
+    status, headers, body, sent = _call(bridge, _scope('/api/transactions/stream', 'POST', [
+        ('Content-Type', 'application/x-ndjson'), ('Content-Length', str(len(payload)))
+    ]), pieces)
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert status == 200 and headers[b'Content-Type'] == b'application/x-ndjson'
+    assert [line['hash'] for line in lines[:-1]] == [record['hash'] for record in records]
+    assert all(line['anomaly_score'] is not None for line in lines[:-1])
+    assert lines[-1]['done'] and lines[-1]['results'] == 600
+    assert len(sent) > 3  # streamed, not buffered
@@ -0,0 +1,84 @@
+import json
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.models.backfill import run_backfill
+
+@pytest.fixture(scope='module')
+def dump(tmp_path_factory):
+    rng = np.random.default_rng(11)
+    n = 1200
+    addresses = [f"0x{i:040x}" for i in range(40)]
+    frame = pd.DataFrame({
+        'hash': [f"0x{i:064x}" for i in range(n)],
+        'from': rng.choice(addresses, size=n),
+        'to': rng.choice(addresses, size=n),
+        'value': rng.uniform(1, 100, size=n),
+        'gasPrice': rng.uniform(10, 50, size=n),
+        'gasUsed': np.full(n, 21000.0),
+        'timestamp': np.sort(rng.uniform(0, 20000, size=n)),
+    })
+    path = tmp_path_factory.mktemp('dump') / 'history.csv'
+    frame.to_csv(path, index=False)
+    return path
+
+@pytest.fixture(scope='module', params=[5, 9], ids=['per-transaction', 'per-sender'])
+def model_path(request, tmp_path_factory):
+    detector = DeFiAnomalyDetector()
+    detector.train(np.random.default_rng(2).normal(size=(500, request.param)))
+    path = tmp_path_factory.mktemp('model') / 'model.joblib'
+    detector.save_model(str(path))
+    return str(path)
+
+def _scores(output_dir):
+    frame = pd.concat([pd.read_csv(path) for path in sorted(output_dir.glob('*-part-*.csv'))])
+    keys = ['hash'] if 'hash' in frame else ['window_end', 'address']
+    return frame.sort_values(keys).reset_index(drop=True)
+
+def _backfill(dump, output_dir, model_path, **kwargs):
+    options = dict(model_path=model_path, chunk_size=100, output_format='csv', log_interval=3600)
+    options.update(kwargs)
+    return run_backfill(dump, output_dir, **options)
+
+def test_scores_do_not_depend_on_worker_count(dump, model_path, tmp_path):
+    _backfill(dump, tmp_path / 'one', model_path, n_workers=1)
+    _backfill(dump, tmp_path / 'three', model_path, n_workers=3, checkpoint_rows=300)
+    one, three = _scores(tmp_path / 'one'), _scores(tmp_path / 'three')
+    assert len(one) and one['anomaly_score'].notna().all()
+    pd.testing.assert_frame_equal(one, three)
+
+def test_resume_from_checkpoint_matches_a_full_run(dump, model_path, tmp_path):
+    full = _backfill(dump, tmp_path, model_path, n_workers=2, checkpoint_rows=500)
+    assert full['complete'] and full['rows_done'] == 1200 and full['part'] == 2
+    expected = _scores(tmp_path)
+
+    # Pretend the run stopped right after the checkpoint at row 1000
+    (tmp_path / 'checkpoint.json').write_text(json.dumps(dict(full, rows_done=1000, complete=False)))
+    resumed = _backfill(dump, tmp_path, model_path, n_workers=2, checkpoint_rows=500, resume=True)
+    assert resumed['complete'] and resumed['rows_done'] == 1200
+    pd.testing.assert_frame_equal(_scores(tmp_path), expected)
+
+    with pytest.raises(ValueError, match='shards changed'):
+        _backfill(dump, tmp_path, model_path, n_workers=3, resume=True)
+
+def test_shared_state_is_bounded_across_checkpoints(dump, model_path, tmp_path):
+    options = dict(n_workers=2, checkpoint_rows=500, profile_sketch_width=64, graph_max_edges=200)
+    full = _backfill(dump, tmp_path, model_path, **options)
+    expected = _scores(tmp_path)
+    # The last two checkpoints are kept; each holds the capped state only
+    for path in sorted(tmp_path.glob('shared-state-*.pkl')):
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        assert state['address_profiles'].bounded and state['address_profiles'].nbytes == 64 * 4 * 8
+        assert state['graph_index'].n_edges <= 200 and state['graph_index'].evictions > 0
+
+    (tmp_path / 'checkpoint.json').write_text(json.dumps(dict(full, rows_done=1000, part=2, complete=False)))
+    _backfill(dump, tmp_path, model_path, resume=True, **options)
+    pd.testing.assert_frame_equal(_scores(tmp_path), expected)
+
+    with pytest.raises(ValueError, match='graph_max_edges changed'):
+        _backfill(dump, tmp_path, model_path, **dict(options, graph_max_edges=None), resume=True)
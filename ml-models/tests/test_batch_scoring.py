@@ -0,0 +1,87 @@
+import numpy as np
+
+from src.features.transaction_batch import TransactionBatch
+from src.features.transaction_features import TransactionFeatureExtractor
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.models.batch_scoring import (
+    ADDRESS_FEATURE_COUNT, ANOMALY_THRESHOLD, model_feature_count, score_transactions, stack_feature_dicts
+)
+
+def test_stack_feature_dicts_uses_first_row_key_order():
+    matrix, usable = stack_feature_dicts([{'a': 1, 'b': '2'}, {'b': 4, 'a': 3.5}], 2)
+    np.testing.assert_array_equal(matrix, [[1.0, 2.0], [3.5, 4.0]])
+    assert usable.tolist() == [True, True]
+
+def test_stack_feature_dicts_isolates_bad_rows():
+    rows = [
+        {'a': 1, 'b': 2},
+        {'a': 'x', 'b': 2},          # not numeric
+        {'a': 1, 'c': 2},            # different keys
+        {'a': 1},                    # wrong width
+        {'a': float('nan'), 'b': 2},  # not finite
+        None,
+        {'a': 5, 'b': 6},
+    ]
+    matrix, usable = stack_feature_dicts(rows, 2)
+    assert usable.tolist() == [True, False, False, False, False, False, True]
+    np.testing.assert_array_equal(matrix, [[1.0, 2.0], [5.0, 6.0]])
+
+def test_stack_feature_dicts_reference_is_first_usable_row():
+    # A malformed first row must not decide the column names for the rest
+    matrix, usable = stack_feature_dicts([{'x': 'bad', 'y': 1}, {'a': 1, 'b': 2}, {'b': 3, 'a': 4}], 2)
+    assert usable.tolist() == [False, True, True]
+    np.testing.assert_array_equal(matrix, [[1.0, 2.0], [4.0, 3.0]])
+
+def test_stack_feature_dicts_empty():
+    matrix, usable = stack_feature_dicts([{'a': 'x'}], 1)
+    assert matrix.shape == (0, 1)
+    assert not usable.any()
+
+def _transactions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    senders = [f"0x{i:040x}" for i in range(5)]
+    return TransactionBatch.from_records([
+        {'hash': f"0x{i:064x}", 'from': senders[i % 5], 'to': senders[(i * 3 + 1) % 5],
+         'value': float(rng.uniform(1, 100)), 'gasPrice': float(rng.uniform(10, 50)),
+         'gasUsed': 21000.0, 'timestamp': 1_700_000_000.0 + 12 * i}
+        for i in range(n)
+    ])
+
+def test_score_transactions_per_transaction_matches_detector(trained_detector):
+    extractor = TransactionFeatureExtractor()
+    transactions = _transactions(40)
+    columns = score_transactions(transactions, extractor, trained_detector)
+    assert model_feature_count(trained_detector) == 5
+    assert len(columns['anomaly_score']) == 40
+    expected = trained_detector.score_batch(extractor.extract_basic_features_batch(transactions))
+    np.testing.assert_allclose(columns['anomaly_score'], expected)
+    np.testing.assert_array_equal(columns['anomaly_detected'], expected > ANOMALY_THRESHOLD)
+
+def test_score_transactions_without_detector_is_per_sender_and_unscored():
+    columns = score_transactions(_transactions(20), TransactionFeatureExtractor())
+    assert sorted(columns['address'].tolist()) == [f"0x{i:040x}" for i in range(5)]
+    assert columns['transactions'].sum() == 20
+    assert np.isnan(columns['anomaly_score']).all()
+    assert not columns['anomaly_detected'].any()
+
+def _detector(n_features):
+    detector = DeFiAnomalyDetector()
+    detector.isolation_forest.set_params(n_estimators=10, random_state=0)
+    detector.train(np.random.default_rng(n_features).normal(size=(200, n_features)))
+    return detector
+
+def test_score_transactions_per_sender_uses_address_features():
+    detector = _detector(ADDRESS_FEATURE_COUNT)
+    transactions = _transactions(30)
+    columns = score_transactions(transactions, TransactionFeatureExtractor(), detector)
+
+    reference = TransactionFeatureExtractor()
+    reference.ingest(transactions)
+    window_end = float(transactions.timestamp.max())
+    expected = detector.score_batch(np.array([reference.address_features(a, window_end) for a in columns['address']]))
+    np.testing.assert_allclose(columns['anomaly_score'], expected)
+    assert (columns['window_end'] == window_end).all()
+
+def test_score_transactions_with_unsupported_width_is_unscored():
+    columns = score_transactions(_transactions(10), TransactionFeatureExtractor(), _detector(4))
+    assert len(columns['address']) == 5 and np.isnan(columns['anomaly_score']).all()
@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from src.features.feature_cache import FeatureCache
+from src.features.temporal_features import StreamingTemporalFeatures
+from src.features.transaction_features import TransactionFeatureExtractor
+from src.models.batch_scoring import ADDRESS_FEATURE_COUNT
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_hits_misses_and_versions():
+    cache = FeatureCache()
+    vector = np.arange(3.0)
+    assert cache.get('a', 10, 1) is None
+    cache.put('a', 10, 1, vector)
+    assert cache.get('a', 10, 1) is vector
+    # Window end and feature-set version are part of the key
+    assert cache.get('a', 11, 1) is None and cache.get('a', 10, 2) is None
+    assert cache.stats() == {"entries": 1, "bytes": 24, "hits": 1, "misses": 3, "hit_rate": 0.25,
+                             "evictions": 0, "invalidations": 0}
+
+def test_entries_expire_after_ttl():
+    clock = _Clock()
+    cache = FeatureCache(ttl_seconds=5, clock=clock)
+    cache.put('a', None, 1, np.zeros(2))
+    clock.now = 4.9
+    assert cache.get('a', None, 1) is not None
+    clock.now = 5.0
+    assert cache.get('a', None, 1) is None
+    assert len(cache) == 0 and cache.nbytes == 0
+
+def test_lru_eviction_by_count_and_bytes():
+    cache = FeatureCache(max_entries=3, max_bytes=10_000)
+    for name in 'abc':
+        cache.put(name, None, 1, np.zeros(4))
+    cache.get('a', None, 1)
+    cache.put('d', None, 1, np.zeros(4))
+    assert cache.get('b', None, 1) is None
+    assert all(cache.get(name, None, 1) is not None for name in 'acd')
+
+    cache = FeatureCache(max_entries=100, max_bytes=100)
+    for name in 'abcd':
+        cache.put(name, None, 1, np.zeros(4))  # 32 bytes each
+    assert len(cache) == 3 and cache.nbytes == 96 and cache.stats()['evictions'] == 1
+    # A vector larger than the byte cap is not kept at all
+    cache.put('big', None, 1, np.zeros(20))
+    assert len(cache) == 0 and cache.nbytes == 0
+
+def test_invalidate_and_get_or_compute():
+    cache = FeatureCache()
+    for window_end in (1, 2, 3):
+        cache.put('a', window_end, 1, np.zeros(1))
+    cache.put('b', 1, 1, np.zeros(1))
+    assert cache.invalidate('a') == 3 and cache.invalidate('a') == 0
+    assert len(cache) == 1
+
+    calls = []
+    compute = lambda: calls.append(1) or np.ones(2)
+    first = cache.get_or_compute('c', 5, 1, compute)
+    second = cache.get_or_compute('c', 5, 1, compute)
+    assert first is second and len(calls) == 1
+    # Re-putting a key replaces it without double-counting bytes
+    cache.put('c', 5, 1, np.ones(2))
+    assert cache.nbytes == 8 + 16
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+def _transactions(rng, n, addresses, start):
+    senders = rng.integers(0, len(addresses), size=n)
+    recipients = rng.integers(0, len(addresses), size=n)
+    return [{'hash': f"0x{start + i:064x}", 'from': addresses[s], 'to': addresses[r],
+             'value': float(rng.uniform(1, 100)), 'gasPrice': float(rng.uniform(10, 50)),
+             'gasUsed': 21000.0, 'timestamp': float(start + i)}
+            for i, (s, r) in enumerate(zip(senders, recipients))]
+
+@pytest.mark.parametrize('graph_max_edges', [None, 40])
+def test_cached_features_match_an_uncached_extractor(graph_max_edges):
+    """Every feature served after an ingest must equal a fresh computation"""
+    rng = np.random.default_rng(5)
+    addresses = [f"0x{i:040x}" for i in range(25)]
+    cached = TransactionFeatureExtractor(graph_max_edges=graph_max_edges)
+    # max_entries=0 evicts every vector as soon as it is stored
+    uncached = TransactionFeatureExtractor(graph_max_edges=graph_max_edges,
+                                           feature_cache=FeatureCache(max_entries=0))
+    start = 0
+    for _ in range(12):
+        batch = _transactions(rng, int(rng.integers(1, 8)), addresses, start)
+        start += len(batch)
+        cached.ingest(batch)
+        uncached.ingest(batch)
+        for address in addresses:
+            expected = uncached.address_features(address)
+            np.testing.assert_array_equal(cached.address_features(address), expected)
+            assert expected.shape == (ADDRESS_FEATURE_COUNT,)
+    assert cached.feature_cache.stats()['hits'] > 0
+    if graph_max_edges:
+        assert cached.graph_index.evictions > 0
+
+@pytest.mark.parametrize('graph_max_edges', [None, 40])
+def test_every_mutator_invalidates_cached_features(graph_max_edges):
+    """stream_temporal_features, update_graph_index and update_address_profiles keep the cache fresh too"""
+    rng = np.random.default_rng(9)
+    addresses = [f"0x{i:040x}" for i in range(25)]
+    cached = TransactionFeatureExtractor(graph_max_edges=graph_max_edges)
+    uncached = TransactionFeatureExtractor(graph_max_edges=graph_max_edges,
+                                           feature_cache=FeatureCache(max_entries=0))
+    mutators = ['stream_temporal_features', 'update_graph_index', 'update_address_profiles', 'ingest']
+    start = 0
+    for step in range(16):
+        batch = _transactions(rng, int(rng.integers(1, 8)), addresses, start)
+        start += len(batch)
+        for extractor in (cached, uncached):
+            getattr(extractor, mutators[step % len(mutators)])(batch)
+        for address in addresses:
+            for window_end in (None, float(start - 3)):
+                np.testing.assert_array_equal(cached.address_features(address, window_end),
+                                              uncached.address_features(address, window_end))
+    assert cached.feature_cache.stats()['invalidations'] > 0
+
+def test_new_recipient_invalidates_upstream_senders():
+    extractor = TransactionFeatureExtractor()
+    extractor.ingest([{'from': 'a', 'to': 'b', 'value': 1.0, 'gasPrice': 1.0, 'gasUsed': 1.0, 'timestamp': 0.0}])
+    before = extractor.address_features('a')
+    assert before[7] == 1  # two-hop fan-out of a: {b}
+    # b gains a recipient; a is not part of this batch but its fan-out grows
+    extractor.ingest([{'from': 'b', 'to': 'c', 'value': 1.0, 'gasPrice': 1.0, 'gasUsed': 1.0, 'timestamp': 1.0}])
+    assert extractor.address_features('a')[7] == 2
+
+def test_frequency_is_never_stale():
+    extractor = TransactionFeatureExtractor()
+    tx = {'from': 'a', 'to': 'b', 'value': 1.0, 'gasPrice': 1.0, 'gasUsed': 1.0, 'timestamp': 0.0}
+    extractor.ingest([tx])
+    assert extractor.address_features('a')[-1] == 0.5
+    extractor.ingest([dict(tx, **{'from': 'c', 'to': 'd'})])
+    assert extractor.address_features('a')[-1] == 0.25
+
+def test_idle_temporal_windows_are_pruned(monkeypatch):
+    monkeypatch.setattr(StreamingTemporalFeatures, 'PRUNE_MIN_SENDERS', 8)
+    extractor = TransactionFeatureExtractor(temporal_window_seconds=10)
+    for i in range(200):
+        extractor.ingest([{'from': f"s{i}", 'to': 'r', 'value': 1.0, 'gasPrice': 1.0, 'gasUsed': 1.0,
+                           'timestamp': float(100 * i)}])
+        # Every earlier sender is idle, so each prune leaves only the latest one
+        assert len(extractor.temporal_stream) <= 8
@@ -0,0 +1,132 @@
+import time
+
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.ensemble._iforest import _average_path_length
+from sklearn.preprocessing import StandardScaler
+
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.models.flat_forest import FlatIsolationForest, average_path_length
+
+def _fitted(rows, **params):
+    scaler = StandardScaler().fit(rows)
+    forest = IsolationForest(random_state=3, **params).fit(scaler.transform(rows))
+    return forest, scaler
+
+def _probe_rows(training_rows, n=500, seed=11):
+    rng = np.random.default_rng(seed)
+    rows = training_rows[rng.integers(0, len(training_rows), size=n)] + rng.normal(scale=0.5, size=(n, 5))
+    # Include far outliers and rows exactly on training values
+    rows[:10] *= 50
+    rows[10:20] = training_rows[:10]
+    return rows
+
+def test_average_path_length_matches_sklearn():
+    sizes = np.array([0, 1, 2, 3, 4, 10, 255, 256, 10_000])
+    np.testing.assert_allclose(average_path_length(sizes), _average_path_length(sizes))
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'max_samples': 64, 'n_estimators': 30},
+    {'max_features': 0.6, 'n_estimators': 40},
+    {'bootstrap': True, 'max_samples': 0.5, 'n_estimators': 25},
+])
+def test_scores_match_sklearn(training_rows, params):
+    forest, scaler = _fitted(training_rows, **params)
+    flat = FlatIsolationForest.from_sklearn(forest, scaler)
+    rows = _probe_rows(training_rows)
+    expected = forest.score_samples(scaler.transform(rows))
+    np.testing.assert_allclose(flat.score_samples(rows), expected, rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(flat.predict(rows), forest.predict(scaler.transform(rows)))
+    assert flat.n_trees == len(forest.estimators_)
+
+def test_chunked_scoring_and_single_row(training_rows):
+    forest, scaler = _fitted(training_rows, n_estimators=20)
+    flat = FlatIsolationForest.from_sklearn(forest, scaler)
+    rows = _probe_rows(training_rows, n=300)
+    full = flat.score_samples(rows)
+    np.testing.assert_array_equal(flat.score_samples(rows, chunk_size=7), full)
+    assert flat.score_samples(rows[0]).shape == (1,)
+    assert flat.score_samples(np.empty((0, 5))).shape == (0,)
+    with pytest.raises(ValueError, match="expects 5"):
+        flat.score_samples(rows[:, :4])
+
+@pytest.mark.parametrize('mmap_mode', [None, 'r'])
+def test_save_and_load_round_trip(tmp_path, training_rows, mmap_mode):
+    forest, scaler = _fitted(training_rows, n_estimators=20)
+    flat = FlatIsolationForest.from_sklearn(forest, scaler)
+    path = tmp_path / 'model.flat.npz'
+    flat.save(path)
+    loaded = FlatIsolationForest.load(path, mmap_mode=mmap_mode)
+    for name in FlatIsolationForest.ARRAYS:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(flat, name))
+    assert (loaded.max_depth, loaded.normalizer, loaded.offset, loaded.n_features) == \
+        (flat.max_depth, flat.normalizer, flat.offset, flat.n_features)
+    rows = _probe_rows(training_rows, n=50)
+    np.testing.assert_array_equal(loaded.score_samples(rows), flat.score_samples(rows))
+    if mmap_mode:
+        assert isinstance(loaded.threshold, np.memmap)
+        assert not loaded.threshold.flags.writeable
+
+class _Spy:
+    """Wraps a scorer and records the batch sizes it was called with"""
+
+    def __init__(self, target):
+        self.target = target
+        self.calls = []
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    def score_samples(self, rows):
+        self.calls.append(len(rows))
+        return self.target.score_samples(rows)
+
+def test_detector_uses_flat_forest_up_to_the_cutoff(trained_detector, training_rows):
+    detector = DeFiAnomalyDetector()
+    detector.isolation_forest = trained_detector.isolation_forest
+    detector.scaler = trained_detector.scaler
+    detector.flat_forest = _Spy(trained_detector.flat_forest)
+    cutoff = DeFiAnomalyDetector.FLAT_FOREST_MAX_ROWS
+    rows = np.resize(_probe_rows(training_rows), (cutoff + 1, 5))
+
+    small = detector.score_batch(rows[:cutoff])
+    large = detector.score_batch(rows)
+    assert detector.flat_forest.calls == [cutoff]
+    # Both paths give the same scores
+    np.testing.assert_allclose(large[:cutoff], small, rtol=0, atol=1e-12)
+
+def test_flat_only_detector_always_uses_flat_forest(trained_detector, training_rows, tmp_path):
+    trained_detector.flat_forest.save(tmp_path / 'model.flat.npz')
+    detector = DeFiAnomalyDetector.load_model(tmp_path / 'model.flat.npz')
+    assert detector.isolation_forest is None
+    rows = np.resize(_probe_rows(training_rows), (4 * DeFiAnomalyDetector.FLAT_FOREST_MAX_ROWS, 5))
+    assert detector.uses_flat_forest(len(rows))
+    np.testing.assert_allclose(detector.score_batch(rows), trained_detector.score_batch(rows), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(detector.predict_batch(rows), trained_detector.predict_batch(rows))
+
+def _best_seconds(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def test_cutoff_sits_between_the_flat_and_sklearn_regimes(trained_detector, training_rows):
+    """
+    Benchmark: the flat forest must win well below FLAT_FOREST_MAX_ROWS and
+    sklearn well above it; if either assertion fails the cutoff needs re-measuring
+    """
+    forest, scaler, flat = trained_detector.isolation_forest, trained_detector.scaler, trained_detector.flat_forest
+    cutoff = DeFiAnomalyDetector.FLAT_FOREST_MAX_ROWS
+    rng = np.random.default_rng(0)
+    small = training_rows[rng.integers(0, len(training_rows), size=cutoff // 8)]
+    large = training_rows[rng.integers(0, len(training_rows), size=cutoff * 8)]
+
+    def sklearn_scores(rows):
+        return lambda: forest.score_samples(scaler.transform(rows))
+
+    assert _best_seconds(lambda: flat.score_samples(small), 7) < _best_seconds(sklearn_scores(small), 7)
+    assert _best_seconds(sklearn_scores(large), 5) < _best_seconds(lambda: flat.score_samples(large), 5)
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.serving.inference_scheduler import InferenceScheduler
+
+class _RecordingModel:
+    """score_batch returns the row sums and remembers every batch it was given"""
+
+    def __init__(self, delay: float = 0.0):
+        self.batches = []
+        self.delay = delay
+
+    def score_batch(self, matrix):
+        self.batches.append(np.array(matrix))
+        time.sleep(self.delay)
+        return matrix.sum(axis=1)
+
+def test_concurrent_requests_are_coalesced():
+    model = _RecordingModel()
+    scheduler = InferenceScheduler(model.score_batch, max_batch_size=8, max_latency_ms=200)
+    futures = [scheduler.submit([i, 1.0]) for i in range(8)]
+    assert [f.result(timeout=5) for f in futures] == [i + 1.0 for i in range(8)]
+    scheduler.close()
+    # The batch filled up before the deadline, so it was flushed as one call
+    assert [len(batch) for batch in model.batches] == [8]
+    stats = scheduler.stats()
+    assert stats['batches'] == 1 and stats['requests'] == 8 and stats['mean_batch_size'] == 8
+
+def test_lone_request_is_flushed_at_the_deadline():
+    model = _RecordingModel()
+    scheduler = InferenceScheduler(model.score_batch, max_batch_size=64, max_latency_ms=20)
+    started = time.perf_counter()
+    assert scheduler.score([2.0, 3.0], timeout=5) == 5.0
+    waited = time.perf_counter() - started
+    scheduler.close()
+    assert 0.015 <= waited < 1.0
+    assert scheduler.stats()['max_queue_wait_ms'] >= 15
+
+def test_models_and_widths_are_scored_separately():
+    default, other = _RecordingModel(), _RecordingModel()
+    scheduler = InferenceScheduler(default.score_batch, max_batch_size=4, max_latency_ms=200)
+    futures = [
+        scheduler.submit([1.0, 2.0]),
+        scheduler.submit([1.0, 2.0, 3.0]),
+        scheduler.submit([5.0, 5.0], model=other),
+        scheduler.submit([4.0, 4.0]),
+    ]
+    assert [f.result(timeout=5) for f in futures] == [3.0, 6.0, 10.0, 8.0]
+    scheduler.close()
+    assert sorted(batch.shape for batch in default.batches) == [(1, 3), (2, 2)]
+    assert [batch.shape for batch in other.batches] == [(1, 2)]
+
+def test_errors_reach_only_their_group():
+    def failing(matrix):
+        raise ValueError("bad model")
+    model = _RecordingModel()
+    scheduler = InferenceScheduler(failing, max_batch_size=2, max_latency_ms=200)
+    bad = scheduler.submit([1.0])
+    good = scheduler.submit([1.0], model=model)
+    with pytest.raises(ValueError, match="bad model"):
+        bad.result(timeout=5)
+    assert good.result(timeout=5) == 1.0
+    scheduler.close()
+
+def test_threads_get_their_own_scores():
+    model = _RecordingModel(delay=0.002)
+    scheduler = InferenceScheduler(model.score_batch, max_batch_size=16, max_latency_ms=5)
+    results = {}
+
+    def worker(i):
+        results[i] = scheduler.score([float(i)], timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(64)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+    assert results == {i: float(i) for i in range(64)}
+    assert sum(len(batch) for batch in model.batches) == 64
+    assert max(len(batch) for batch in model.batches) <= 16
+
+def test_close_flushes_queued_requests():
+    model = _RecordingModel()
+    scheduler = InferenceScheduler(model.score_batch, max_batch_size=100, max_latency_ms=10_000)
+    futures = [scheduler.submit([1.0]) for _ in range(3)]
+    scheduler.close()
+    assert [f.result(timeout=1) for f in futures] == [1.0, 1.0, 1.0]
@@ -0,0 +1,146 @@
+import json
+import logging
+import sys
+import threading
+import time
+
+import pytest
+
+from src.serving.log_pipeline import (JsonFormatter, LogPipeline, RouteSampler, configure_logging,
+                                      parse_sample_rates)
+
+class _ListHandler(logging.Handler):
+    """Collects formatted records and the thread that wrote each one"""
+
+    def __init__(self, gate=None):
+        super().__init__()
+        self.gate = gate
+        self.entered = threading.Event()
+        self.lines = []
+        self.threads = []
+
+    def emit(self, record):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait()
+        self.lines.append(self.format(record))
+        self.threads.append(threading.current_thread().name)
+
+def _record(message='hello', level=logging.INFO, args=(), **extra):
+    record = logging.LogRecord('ml-server', level, __file__, 1, message, args, None)
+    record.__dict__.update(extra)
+    return record
+
+@pytest.fixture
+def root_logger():
+    """Restore the root logger after configure_logging replaced its handlers"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+def test_json_formatter_includes_extra_fields():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = _record('score %s', args=(0.5,), route='/api/x', rss_bytes=10)
+        record.exc_info = sys.exc_info()
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'score 0.5' and entry['level'] == 'INFO' and entry['logger'] == 'ml-server'
+    assert entry['route'] == '/api/x' and entry['rss_bytes'] == 10
+    assert 'ValueError: boom' in entry['exc_info']
+
+def test_sampler_keeps_warnings_and_counts_skipped_records():
+    routes = {'route': '/hot'}
+    sampler = RouteSampler(lambda: routes['route'], {'/hot': 0.0}, default_rate=1.0)
+    info = _record()
+    assert not sampler.filter(info) and info.route == '/hot'
+    assert sampler.filter(_record(level=logging.WARNING))
+    routes['route'] = '/cold'
+    assert sampler.filter(_record())
+    routes['route'] = None  # outside a request
+    assert sampler.filter(_record())
+    assert sampler.sampled_out == 1
+
+def test_sampler_count_is_exact_across_threads():
+    sampler = RouteSampler(lambda: '/hot', default_rate=0.0)
+
+    def work():
+        for _ in range(2000):
+            sampler.filter(_record())
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sampler.sampled_out == 16000
+
+def test_parse_sample_rates():
+    assert parse_sample_rates(' /a/<x>=0.01, /b=1 ,') == {'/a/<x>': 0.01, '/b': 1.0}
+    assert parse_sample_rates('') == {}
+    with pytest.raises(ValueError, match='ROUTE=RATE'):
+        parse_sample_rates('/a')
+
+def test_records_are_written_by_the_writer_thread():
+    handler = _ListHandler()
+    pipeline = LogPipeline([handler])
+    pipeline.start()
+    for i in range(100):
+        pipeline.queue_handler.handle(_record('line %d', args=(i,)))
+    pipeline.stop()
+    assert handler.lines == [f'line {i}' for i in range(100)]
+    assert threading.current_thread().name not in handler.threads
+    assert pipeline.stats() == {"queue_depth": 0, "queue_size": 10000, "dropped": 0, "sampled_out": 0}
+
+def _flood_while_blocked(pipeline, handler, gate, n):
+    # Block the writer on one record, log `n` more, then let it go
+    gate.clear()
+    handler.entered.clear()
+    pipeline.queue_handler.handle(_record('held'))
+    assert handler.entered.wait(5)
+    for i in range(n):
+        pipeline.queue_handler.handle(_record('line %d', args=(i,)))
+    gate.set()
+
+def test_drops_are_counted_and_reported_at_most_once_per_interval():
+    gate = threading.Event()
+    handler = _ListHandler(gate)
+    pipeline = LogPipeline([handler], queue_size=2, drop_warning_seconds=3600)
+    pipeline.start()
+    # Two records fit in the queue while the writer is busy, the rest are dropped
+    _flood_while_blocked(pipeline, handler, gate, 10)
+    assert pipeline.dropped == 8
+    deadline = time.monotonic() + 5
+    while len(handler.lines) < 4:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert handler.lines == ['held', 'Dropped 8 log records because the log queue was full (8 in total)',
+                             'line 0', 'line 1']
+
+    # Within the interval new drops are not reported until the pipeline stops
+    _flood_while_blocked(pipeline, handler, gate, 5)
+    pipeline.stop()
+    assert pipeline.dropped == 11
+    assert handler.lines[4:] == ['held', 'line 0', 'line 1',
+                                 'Dropped 3 log records because the log queue was full (11 in total)']
+
+def test_configure_logging_defaults_to_text(root_logger):
+    handler = _ListHandler()
+    pipeline = configure_logging(logging.INFO, [handler])
+    logging.getLogger('ml-server').info("ready in %.1fs", 1.25)
+    logging.getLogger('ml-server').debug("not shown")
+    pipeline.stop()
+    [line] = handler.lines
+    assert line.endswith(' - ml-server - INFO - ready in 1.2s')
+    assert root_logger.handlers == [pipeline.queue_handler]
+
+    handler = _ListHandler()
+    pipeline = configure_logging(logging.INFO, [handler], json_format=True)
+    logging.getLogger('ml-server').info("ready")
+    pipeline.stop()
+    assert json.loads(handler.lines[0])['message'] == 'ready'
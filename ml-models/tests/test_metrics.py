@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.serving.metrics import MetricsRegistry, method_label
+from src.serving.model_manager import ModelManager
+
+def _samples(text):
+    """{'name{labels}': value} for every sample line of a rendered registry"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+def test_counters_and_histograms_render_totals():
+    metrics = MetricsRegistry()
+    requests = metrics.counter('requests_total', 'Requests', ('route',))
+    latency = metrics.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    requests.labels('/a').inc()
+    requests.labels('/a').inc(2)
+    requests.labels('/b "x"').inc()
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value)
+
+    text = metrics.render()
+    assert '# TYPE requests_total counter' in text and '# TYPE latency_seconds histogram' in text
+    samples = _samples(text)
+    assert samples['requests_total{route="/a"}'] == 3
+    assert samples['requests_total{route="/b \\"x\\""}'] == 1
+    # Buckets are cumulative and end with +Inf
+    assert [samples[f'latency_seconds_bucket{{le="{le}"}}'] for le in ('0.1', '1', '+Inf')] == [1, 3, 4]
+    assert samples['latency_seconds_sum'] == 4.05 and samples['latency_seconds_count'] == 4
+
+def test_observations_from_many_threads_are_all_counted():
+    metrics = MetricsRegistry()
+    counter = metrics.counter('events_total', 'Events')
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Finished threads are folded into the retired total, and stay counted
+    assert _samples(metrics.render())['events_total'] == 8000
+    counter.inc()
+    assert _samples(metrics.render())['events_total'] == 8001
+
+def test_callbacks_are_read_at_scrape_time_and_skip_none():
+    metrics = MetricsRegistry()
+    state = {'depth': None}
+    metrics.callback('queue_depth', 'Depth', lambda: state['depth'])
+    metrics.callback('lookups_total', 'Lookups', lambda: {('hit',): 3, ('miss',): None},
+                     kind='counter', labelnames=('result',))
+    assert _samples(metrics.render()) == {'lookups_total{result="hit"}': 3}
+    state['depth'] = 7
+    samples = _samples(metrics.render())
+    assert samples == {'queue_depth': 7, 'lookups_total{result="hit"}': 3}
+
+def test_duplicate_names_are_rejected():
+    metrics = MetricsRegistry()
+    metrics.counter('x_total', 'X')
+    with pytest.raises(ValueError, match='already registered'):
+        metrics.histogram('x_total', 'X')
+
+def test_method_labels_are_bounded():
+    assert [method_label(m) for m in ('GET', 'POST', 'PATCH', 'OPTIONS')] == ['GET', 'POST', 'PATCH', 'OPTIONS']
+    assert {method_label(m) for m in ('FOO', 'PROPFIND', 'X' * 1000, 'get', '')} == {'other'}
+
+def test_score_observer_follows_the_managed_model(tmp_path, trained_detector, training_rows):
+    path = tmp_path / 'anomaly_detector.joblib'
+    trained_detector.save_model(path)
+    manager = ModelManager(path, DeFiAnomalyDetector.load_model)
+    metrics = MetricsRegistry()
+    batch_size = metrics.histogram('batch_size', 'Rows', buckets=(1, 16))
+    manager.set_observers(lambda n_rows, seconds: batch_size.observe(n_rows))
+
+    # Probe scoring during validation is not observed
+    manager.reload()
+    assert 'batch_size_count' not in _samples(metrics.render())
+    manager.detector.score_batch(training_rows[:10])
+    # A detector that is not managed is never observed
+    DeFiAnomalyDetector.load_model(path).score_batch(training_rows[:10])
+    assert _samples(metrics.render())['batch_size_count'] == 1
+
+    # Swapped-in models get the observer too
+    swapped = DeFiAnomalyDetector.load_model(path)
+    assert manager.swap(swapped)
+    swapped.score_batch(training_rows[:40])
+    samples = _samples(metrics.render())
+    assert samples['batch_size_count'] == 2 and samples['batch_size_bucket{le="16"}'] == 1
+    assert np.isclose(samples['batch_size_sum'], 50)
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.models.anomaly_detector import DeFiAnomalyDetector, model_digest
+from src.serving.model_manager import ModelManager, ModelValidationError, file_version
+
+def _detector(rows, seed=0):
+    detector = DeFiAnomalyDetector()
+    detector.isolation_forest.set_params(random_state=seed, n_estimators=20)
+    detector.train(rows)
+    return detector
+
+@pytest.fixture
+def model_path(tmp_path, training_rows):
+    path = tmp_path / 'anomaly_detector.joblib'
+    _detector(training_rows).save_model(path)
+    return path
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+def test_reload_activates_and_reports_version(model_path, training_rows):
+    manager = ModelManager(model_path, DeFiAnomalyDetector.load_model)
+    status = manager.reload()
+    assert status['loaded'] and status['version'] == file_version(model_path)
+    assert manager.detector.n_features == 5 and not manager.changed_on_disk()
+    # Loaded with the memory-mapped flat export that save_model wrote
+    assert isinstance(manager.detector.flat_forest.threshold, np.memmap)
+    scores = manager.detector.score_batch(training_rows[:10])
+    assert scores.shape == (10,) and np.isfinite(scores).all()
+
+def test_reload_rejects_a_model_with_different_width(model_path, tmp_path, training_rows):
+    manager = ModelManager(model_path, DeFiAnomalyDetector.load_model)
+    manager.reload()
+    active = manager.detector
+    _detector(training_rows[:, :4]).save_model(model_path)
+    with pytest.raises(ModelValidationError, match="expects 4 features"):
+        manager.reload()
+    assert manager.detector is active and 'expects 4' in manager.status()['last_error']
+
+def test_swap_is_compare_and_swap(model_path, training_rows):
+    manager = ModelManager(model_path, DeFiAnomalyDetector.load_model)
+    manager.reload()
+    base, base_version = manager.detector, manager.version
+    first, second = _detector(training_rows, seed=1), _detector(training_rows, seed=2)
+
+    assert manager.swap(first, expected=base)
+    assert manager.detector is first and manager.version == f"{base_version}+1"
+    # `second` was derived from `base`, which is no longer active
+    assert not manager.swap(second, expected=base)
+    assert manager.detector is first and manager.swaps == 1
+    assert manager.swap(second)
+    assert manager.detector is second and manager.version == f"{base_version}+2"
+
+def test_concurrent_swaps_install_exactly_one(model_path, training_rows):
+    manager = ModelManager(model_path, DeFiAnomalyDetector.load_model)
+    manager.reload()
+    base = manager.detector
+    candidates = [_detector(training_rows, seed=i) for i in range(4)]
+    results = [None] * len(candidates)
+    barrier = threading.Barrier(len(candidates))
+
+    def attempt(i):
+        barrier.wait()
+        results[i] = manager.swap(candidates[i], expected=base)
+
+    threads = [threading.Thread(target=attempt, args=(i,)) for i in range(len(candidates))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(results) == 1
+    assert manager.detector is candidates[results.index(True)]
+
+def test_watcher_reloads_changed_file(model_path, training_rows):
+    manager = ModelManager(model_path, DeFiAnomalyDetector.load_model)
+    manager.reload()
+    old_version = manager.version
+    manager.start_watching(0.02)
+    try:
+        _detector(training_rows, seed=5).save_model(model_path)
+        _wait_for(lambda: manager.version != old_version)
+        assert manager.version == file_version(model_path)
+    finally:
+        manager.stop_watching()
+
+def test_watcher_survives_a_vanished_file_and_a_bad_model(model_path, training_rows):
+    calls = []
+
+    def flaky_loader(path, mmap_mode=None):
+        calls.append(path)
+        if len(calls) == 2:
+            raise FileNotFoundError(path)
+        if len(calls) == 3:
+            raise ValueError("corrupt model")
+        return DeFiAnomalyDetector.load_model(path, mmap_mode=mmap_mode)
+
+    manager = ModelManager(model_path, flaky_loader)
+    manager.reload()
+    first_version = manager.version
+    manager.start_watching(0.02)
+    try:
+        _detector(training_rows, seed=6).save_model(model_path)
+        # Call 2 (missing file) is retried on the next poll; call 3 fails and is not retried
+        _wait_for(lambda: len(calls) >= 3)
+        time.sleep(0.1)
+        assert len(calls) == 3 and manager.version == first_version
+        assert 'corrupt model' in manager.status()['last_error']
+        # A later change is still picked up, so the thread is alive
+        _detector(training_rows, seed=7).save_model(model_path)
+        _wait_for(lambda: manager.version == file_version(model_path))
+    finally:
+        manager.stop_watching()
+
+def test_flat_export_freshness_follows_content_not_mtime(model_path, training_rows):
+    flat_path = DeFiAnomalyDetector.flat_forest_path(model_path)
+    loaded = DeFiAnomalyDetector.load_model(model_path)
+    assert loaded.flat_forest.source_digest == model_digest(model_path)
+
+    # An export older than its model is still used while the content matches
+    os.utime(flat_path, (1, 1))
+    detector = DeFiAnomalyDetector.load_model(model_path, flat_only=True)
+    np.testing.assert_allclose(detector.score_batch(training_rows[:50]), loaded.score_batch(training_rows[:50]))
+
+    # A newer export that belongs to a different model is stale
+    retrained = _detector(training_rows, seed=9)
+    retrained.save_model(model_path, export_flat=False)
+    os.utime(flat_path, None)
+    with pytest.raises(FileNotFoundError, match="up-to-date"):
+        DeFiAnomalyDetector.load_model(model_path, flat_only=True)
+    recompiled = DeFiAnomalyDetector.load_model(model_path)
+    np.testing.assert_allclose(recompiled.score_batch(training_rows[:50]), retrained.score_batch(training_rows[:50]))
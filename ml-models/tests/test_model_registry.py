@@ -0,0 +1,80 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from src.serving.model_registry import ModelRegistry
+
+FALLBACK = object()
+
+class _SlowLoader:
+    """Counts loads; each one takes long enough for concurrent callers to pile up"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, path, mmap_mode=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(0.1)
+        if self.fail:
+            raise ValueError("corrupt model")
+        return SimpleNamespace(name=path.name)
+
+def _registry(tmp_path, loader):
+    (tmp_path / 'chains').mkdir()
+    (tmp_path / '0xabc.joblib').write_bytes(b'x' * 10)
+    (tmp_path / 'chains' / 'ethereum.joblib').write_bytes(b'y' * 20)
+    return ModelRegistry(tmp_path, loader, lambda: FALLBACK)
+
+def _get_concurrently(registry, n, *args):
+    results = [None] * n
+    barrier = threading.Barrier(n)
+
+    def get(i):
+        barrier.wait()
+        results[i] = registry.get(*args)
+
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_lookup_order_and_cache(tmp_path):
+    registry = _registry(tmp_path, _SlowLoader())
+    key, detector = registry.get('0xABC', 'ethereum')
+    assert (key, detector.name) == ('0xabc', '0xabc.joblib')
+    key, detector = registry.get('0xdef', 'Ethereum')
+    assert (key, detector.name) == ('chain:ethereum', 'ethereum.joblib')
+    assert registry.get('0xdef', 'polygon') == (None, FALLBACK)
+    registry.get('0xabc')
+    stats = registry.stats()
+    assert (stats['hits'], stats['misses'], stats['fallbacks']) == (1, 2, 1)
+    assert stats['loaded'] == 2 and stats['bytes'] == 30
+
+def test_loaded_models_get_the_score_observer(tmp_path):
+    registry = _registry(tmp_path, _SlowLoader())
+    observer = lambda n_rows, seconds: None
+    registry.score_observer = observer
+    assert registry.get('0xabc')[1].score_observer is observer
+
+def test_concurrent_misses_load_once(tmp_path):
+    loader = _SlowLoader()
+    registry = _registry(tmp_path, loader)
+    results = _get_concurrently(registry, 8, '0xabc')
+    assert loader.calls == 1
+    assert all(result[1] is results[0][1] for result in results) and results[0][0] == '0xabc'
+    stats = registry.stats()
+    assert stats['misses'] + stats['load_waits'] + stats['hits'] == 8 and stats['misses'] == 1
+
+def test_concurrent_failed_load_falls_back_once(tmp_path):
+    loader = _SlowLoader(fail=True)
+    registry = _registry(tmp_path, loader)
+    assert _get_concurrently(registry, 8, '0xabc') == [(None, FALLBACK)] * 8
+    assert loader.calls == 1
+    # A failed model is skipped until the directory changes
+    assert registry.get('0xabc') == (None, FALLBACK) and loader.calls == 1
+    assert registry.stats()['load_errors'] == 1
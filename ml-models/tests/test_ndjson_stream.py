@@ -0,0 +1,89 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from src.features.transaction_features import TransactionFeatureExtractor
+from src.serving.ndjson_stream import iter_ndjson_chunks, score_transaction_stream
+
+class _TrickleStream:
+    """File-like object that returns the given pieces one read at a time"""
+
+    def __init__(self, pieces):
+        self.pieces = list(pieces)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return self.pieces.pop(0) if self.pieces else b''
+
+def _lines(records):
+    return b''.join(json.dumps(record).encode() + b'\n' for record in records)
+
+def _transaction(i, **overrides):
+    tx = {'hash': f"0x{i:064x}", 'from': f"0x{i % 4:040x}", 'to': f"0x{(i + 1) % 7:040x}",
+          'value': float(i + 1), 'gasPrice': 20.0 + i % 3, 'gasUsed': 21000.0, 'timestamp': 1_700_000_000.0 + i}
+    tx.update(overrides)
+    return tx
+
+def test_chunks_preserve_every_record():
+    records = [{'i': i} for i in range(23)]
+    chunks = list(iter_ndjson_chunks(io.BytesIO(_lines(records)), chunk_size=5, read_size=7))
+    assert [record for chunk in chunks for record in chunk] == records
+    assert all(1 <= len(chunk) <= 5 for chunk in chunks)
+
+def test_partial_chunks_are_flushed_as_data_arrives():
+    stream = _TrickleStream([b'{"i": 0}\n{"i"', b': 1}\n', b'\n  \n{"i": 2}'])
+    chunks = iter_ndjson_chunks(stream, chunk_size=100)
+    assert next(chunks) == [{'i': 0}]
+    assert stream.reads == 1
+    assert next(chunks) == [{'i': 1}]
+    # The last line needs no trailing newline, blank lines are skipped
+    assert list(chunks) == [[{'i': 2}]]
+
+@pytest.mark.parametrize('body, message', [
+    (b'{"i": 0}\n{"i": \n', 'line 2'),
+    (b'{"i": 0}\n[1, 2]\n', 'line 2: expected a JSON object'),
+    (b'{"i": 0}\n' + b'x' * 100, 'line 2: longer than 50 bytes'),
+])
+def test_bad_lines_raise_with_line_number(body, message):
+    with pytest.raises(ValueError, match=message):
+        list(iter_ndjson_chunks(io.BytesIO(body), read_size=16, max_line_bytes=50))
+
+def test_scores_per_transaction_match_the_detector(trained_detector):
+    transactions = [_transaction(i) for i in range(30)]
+    chunks = iter_ndjson_chunks(io.BytesIO(_lines(transactions)), chunk_size=8)
+    records = list(score_transaction_stream(chunks, TransactionFeatureExtractor(), trained_detector))
+    assert [r['hash'] for r in records] == [tx['hash'] for tx in transactions]
+
+    # Each chunk sees the state of every earlier chunk
+    reference = TransactionFeatureExtractor()
+    expected = []
+    for start in range(0, 30, 8):
+        chunk = transactions[start:start + 8]
+        reference.ingest(chunk)
+        expected.extend(trained_detector.score_batch(reference.extract_basic_features_batch(chunk)))
+    np.testing.assert_allclose([r['anomaly_score'] for r in records], expected)
+    assert all(isinstance(r['anomaly_detected'], bool) for r in records)
+
+def test_records_are_strict_json():
+    # Without timestamps the window end of each chunk is NaN
+    transactions = [_transaction(i) for i in range(6)]
+    for tx in transactions:
+        del tx['timestamp']
+    records = list(score_transaction_stream([transactions[:3], transactions[3:]], TransactionFeatureExtractor()))
+    assert records and all(r['window_end'] is None and r['anomaly_score'] is None for r in records)
+    for record in records:
+        assert json.loads(json.dumps(record, allow_nan=False)) == record
+
+def test_long_stream_state_stays_bounded():
+    extractor = TransactionFeatureExtractor(graph_max_edges=200, profile_sketch_width=64)
+    transactions = [_transaction(i, **{'from': f"0xs{i}", 'to': f"0xr{i}", 'timestamp': 10.0 * i})
+                    for i in range(2000)]
+    chunks = iter_ndjson_chunks(io.BytesIO(_lines(transactions)), chunk_size=50)
+    assert sum(1 for _ in score_transaction_stream(chunks, extractor)) == 2000
+    assert extractor.graph_index.n_edges <= 200 and extractor.graph_index.n_nodes <= 400
+    assert extractor.address_profiles.nbytes == 8 * 64 * 4
+    # The stream spans 20000s; windows of senders idle for over an hour are pruned
+    assert len(extractor.temporal_stream) <= extractor.temporal_stream.PRUNE_MIN_SENDERS
@@ -0,0 +1,41 @@
+import numpy as np
+
+from benchmarks.synthetic import generate_transactions
+from src.features.transaction_features import TransactionFeatureExtractor
+
+def _reference(senders, recipients, values, extended):
+    # Brute-force network features: one row per sender in order of first appearance
+    order = list(dict.fromkeys(list(senders)))
+    edges = set(zip(senders, recipients))
+    n_recipients = len(set(recipients))
+    density = len(edges) / (len(order) * n_recipients)
+    rows = []
+    for address in order:
+        out_degree = sum(1 for s, _ in edges if s == address)
+        in_degree = sum(1 for _, d in edges if d == address)
+        row = [out_degree, in_degree, density]
+        if extended:
+            sent = [v for s, v in zip(senders, values) if s == address]
+            row += [sum(sent), out_degree / len(sent)]
+        rows.append(row)
+    return np.array(rows, dtype=float)
+
+def test_network_features_match_brute_force():
+    batch = generate_transactions(600, n_addresses=80, n_hubs=5, seed=3)
+    extractor = TransactionFeatureExtractor()
+    senders, recipients = batch.senders.tolist(), batch.recipients.tolist()
+    for extended in (False, True):
+        expected = _reference(senders, recipients, batch.value.tolist(), extended)
+        np.testing.assert_allclose(extractor.extract_network_features(batch, extended=extended), expected)
+
+def test_network_features_accept_records_and_empty_input():
+    extractor = TransactionFeatureExtractor()
+    records = [
+        {'from': '0xa', 'to': '0xb', 'value': 1.0},
+        {'from': '0xa', 'to': '0xb', 'value': 2.0},
+        {'from': '0xb', 'to': '0xa', 'value': 4.0},
+    ]
+    np.testing.assert_allclose(extractor.extract_network_features(records, extended=True),
+                               [[1, 1, 0.5, 3.0, 0.5], [1, 1, 0.5, 4.0, 1.0]])
+    assert extractor.extract_network_features([]).shape == (0, 3)
+    assert extractor.extract_network_features([], extended=True).shape == (0, 5)
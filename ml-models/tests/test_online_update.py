@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+from sklearn.base import clone
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.models.flat_forest import FlatIsolationForest
+from src.models.online_update import OnlineForestUpdater, ReservoirSample, _merge_moments, _moments
+from src.serving.model_manager import ModelManager
+
+def _forest(rows, scaler, n_estimators, seed, max_samples=128):
+    return IsolationForest(n_estimators=n_estimators, max_samples=max_samples,
+                           random_state=seed).fit(scaler.transform(rows))
+
+def test_reservoir_fills_then_overwrites_random_slots():
+    reservoir = ReservoirSample(capacity=100, n_features=2, seed=0)
+    reservoir.add(np.zeros((60, 2)))
+    assert reservoir.size == 60 and not reservoir.snapshot().any()
+    # The first 40 rows fill the reservoir, the rest overwrite random slots
+    reservoir.add(np.ones((1000, 2)))
+    rows = reservoir.snapshot()
+    assert reservoir.size == 100 and reservoir.seen == 1060
+    # An old row survives 960 overwrites with probability 0.99 ** 960 (about 6e-5)
+    assert rows.all()
+    rows[:] = 5
+    assert reservoir.snapshot().max() == 1  # snapshots are copies
+
+def test_reservoir_favours_recent_rows():
+    reservoir = ReservoirSample(capacity=500, n_features=1, seed=1)
+    for batch in range(20):
+        reservoir.add(np.full((100, 1), batch))
+    survivors = np.bincount(reservoir.snapshot()[:, 0].astype(int), minlength=20)
+    # Expected share of batch b is proportional to 0.998 ** (100 * (19 - b))
+    assert survivors[-1] > survivors[-5] > survivors[-10] > survivors[0]
+
+def test_merged_moments_match_numpy():
+    rng = np.random.default_rng(4)
+    blocks = [rng.normal(loc=i, scale=i + 1, size=(n, 3)) for i, n in enumerate([1, 7, 250, 40])]
+    merged = _moments(blocks[0])
+    for block in blocks[1:]:
+        merged = _merge_moments(merged, _moments(block))
+    rows = np.vstack(blocks)
+    count, mean, m2 = merged
+    assert count == len(rows)
+    np.testing.assert_allclose(mean, rows.mean(axis=0))
+    np.testing.assert_allclose(m2 / count, np.var(rows, axis=0))
+    # An empty summary leaves the other side unchanged
+    empty = (0, np.zeros(3), np.zeros(3))
+    assert _merge_moments(empty, empty) is empty
+
+def test_replace_trees_drops_the_oldest(training_rows):
+    scaler = StandardScaler().fit(training_rows)
+    old = _forest(training_rows, scaler, 10, seed=1)
+    new = _forest(training_rows, scaler, 3, seed=2)
+    replaced = FlatIsolationForest.from_sklearn(old, scaler).replace_trees(
+        FlatIsolationForest.from_sklearn(new, scaler))
+
+    # The same forest built in sklearn from the 7 newest old trees and the 3 new ones
+    expected = clone(old)
+    expected.__dict__.update(old.__dict__)
+    expected.estimators_ = old.estimators_[3:] + new.estimators_
+    expected.estimators_features_ = old.estimators_features_[3:] + new.estimators_features_
+    for name in ('_decision_path_lengths', '_average_path_length_per_tree'):
+        setattr(expected, name, list(getattr(old, name))[3:] + list(getattr(new, name)))
+    assert replaced.n_trees == 10
+    np.testing.assert_allclose(replaced.score_samples(training_rows[:300]),
+                               expected.score_samples(scaler.transform(training_rows[:300])), atol=1e-12)
+
+def test_replaced_trees_are_rescaled_to_the_forest_normalisation(training_rows):
+    scaler = StandardScaler().fit(training_rows)
+    flat = FlatIsolationForest.from_sklearn(_forest(training_rows, scaler, 10, seed=1, max_samples=256), scaler)
+    small = FlatIsolationForest.from_sklearn(_forest(training_rows, scaler, 10, seed=2, max_samples=64), scaler)
+    # Replacing every tree keeps this forest's normalisation, not the donor's
+    replaced = flat.replace_trees(small)
+    assert replaced.n_trees == 10 and replaced.normalizer == pytest.approx(flat.normalizer)
+    assert replaced.offset == flat.offset
+
+class _Manager:
+    """Managed detector for an updater, with the same install contract as ModelManager.swap"""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.refuse = False
+
+    def install(self, detector, expected):
+        if self.refuse or self.detector is not expected:
+            return False
+        self.detector = detector
+        return True
+
+def _updater(manager, **params):
+    params = dict(dict(reservoir_size=2000, min_rows=500, random_state=0), **params)
+    return OnlineForestUpdater(lambda: manager.detector, manager.install, **params)
+
+def test_rows_scored_as_anomalous_are_not_sampled(trained_detector, training_rows):
+    manager = _Manager(trained_detector)
+    updater = _updater(manager, max_score=0.5)
+    other = DeFiAnomalyDetector(flat_forest=trained_detector.flat_forest)
+    updater.observe(other, training_rows[:100], np.zeros(100))
+    scores = np.where(np.arange(100) % 4 == 0, 0.9, 0.3)
+    scores[1] = np.nan
+    updater.observe(trained_detector, training_rows[:100], scores)
+    updater._drain()
+    assert updater.excluded_rows == 26 and updater.reservoir.size == 74
+    kept = np.flatnonzero(scores <= 0.5)
+    np.testing.assert_array_equal(updater.reservoir.snapshot(), training_rows[kept])
+    assert updater.stats()['excluded_rows'] == 26
+
+def test_queue_is_bounded_between_updates(trained_detector, training_rows):
+    manager = _Manager(trained_detector)
+    updater = _updater(manager, reservoir_size=150, max_score=None)
+    for start in range(0, 400, 100):
+        updater.observe(trained_detector, training_rows[start:start + 100])
+    assert updater.dropped_rows == 250
+    updater._drain()
+    assert updater.reservoir.size == 150
+
+def test_update_installs_only_over_the_detector_it_started_from(trained_detector, training_rows):
+    manager = _Manager(trained_detector)
+    updater = _updater(manager)
+    # Not enough rows yet
+    updater.observe(trained_detector, training_rows[:100], np.zeros(100))
+    assert not updater.update() and updater.skipped == 1
+
+    updater.observe(trained_detector, training_rows[100:1000], np.zeros(900))
+    manager.refuse = True
+    assert not updater.update() and updater.skipped == 2
+    # The refused update's statistics stay pending for the next attempt
+    assert updater._pending[0] == 1000
+    manager.refuse = False
+    assert updater.update() and updater.updates == 1 and updater._pending is None
+    updated = manager.detector
+    assert updated is not trained_detector and updated.flat_forest.n_trees == trained_detector.flat_forest.n_trees
+    assert updater.trees_replaced == round(0.1 * updated.flat_forest.n_trees)
+    # The base scaler saw all 2000 training rows, merged with the 1000 new ones
+    expected_mean = (2000 * training_rows.mean(axis=0) + 1000 * training_rows[:1000].mean(axis=0)) / 3000
+    np.testing.assert_allclose(updated.scaler.mean_, expected_mean)
+    # Nothing new since the last update
+    assert not updater.update()
+
+def test_swap_through_the_manager_keeps_observers(tmp_path, trained_detector, training_rows):
+    path = tmp_path / 'anomaly_detector.joblib'
+    trained_detector.save_model(path)
+    manager = ModelManager(path, DeFiAnomalyDetector.load_model)
+    manager.reload()
+    reloads = []
+
+    def install(detector, expected):
+        if not reloads:
+            # A reload lands while the first update is being built
+            reloads.append(manager.reload())
+        return manager.swap(detector, expected=expected)
+
+    updater = OnlineForestUpdater(lambda: manager.detector, install, reservoir_size=2000, min_rows=500,
+                                  random_state=0)
+    manager.set_observers(sample_observer=updater.observe)
+    manager.detector.score_batch(training_rows[:1000])
+    assert not updater.update()
+    reloaded = manager.detector
+    assert manager.swaps == 0 and manager.version == reloads[0]['version']
+
+    assert updater.update()
+    assert manager.detector is not reloaded and manager.version.endswith('+1')
+    # The swapped-in model keeps feeding the updater
+    assert manager.detector.sample_observer == updater.observe
+    manager.detector.score_batch(training_rows[1000:1100])
+    assert updater._queued_rows == 100
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from src.serving.portfolio import DEFAULT_RISK_SCORE, HIGH_RISK_THRESHOLD, portfolio_risk
+from src.serving.risk_table import RiskScoreTable, write_risk_table
+
+@pytest.fixture
+def risk_scores():
+    rng = np.random.default_rng(3)
+    return {f"0x{i:040x}": float(rng.integers(0, 100)) for i in range(0, 40, 2)}
+
+@pytest.fixture
+def risk_table(tmp_path, risk_scores):
+    write_risk_table(risk_scores, tmp_path / 'risk.bin')
+    return RiskScoreTable(tmp_path / 'risk.bin')
+
+def _brute_force(user, scores):
+    total = weighted = 0.0
+    high = 0
+    for exposure in user.get('exposures') or []:
+        address = (exposure.get('protocol_address') or '').lower()
+        score = scores.get(address)
+        if score is not None and score >= HIGH_RISK_THRESHOLD:
+            high += 1
+        amount = float(exposure.get('amount', 0))
+        if address and amount > 0:
+            total += amount
+            weighted += amount * (DEFAULT_RISK_SCORE if score is None else score)
+    return (weighted / total if total else 0.0), len(user.get('exposures') or []), high
+
+def test_matches_per_user_reference(risk_table, risk_scores):
+    rng = np.random.default_rng(8)
+    users = []
+    for _ in range(60):
+        exposures = []
+        for _ in range(int(rng.integers(0, 6))):
+            i = int(rng.integers(0, 45))
+            address = f"0x{i:040x}"
+            exposures.append({
+                'protocol_address': address.upper().replace('0X', '0x') if i % 3 == 0 else address,
+                'amount': float(rng.choice([0.0, -5.0, rng.uniform(1, 1000)])),
+            })
+        users.append({'exposures': exposures})
+    users.append({})
+    users.append({'exposures': None})
+
+    result = portfolio_risk(users, risk_table)
+    expected = [_brute_force(user, risk_scores) for user in users]
+    np.testing.assert_allclose(result['risk_score'], [e[0] for e in expected], rtol=1e-6)
+    np.testing.assert_array_equal(result['exposure_count'], [e[1] for e in expected])
+    np.testing.assert_array_equal(result['high_risk_exposure_count'], [e[2] for e in expected])
+
+def test_unknown_and_missing_protocols(risk_table, risk_scores):
+    known = next(a for a, s in risk_scores.items() if s < HIGH_RISK_THRESHOLD)
+    users = [{'exposures': [
+        {'protocol_address': known, 'amount': 100},
+        {'protocol_address': '0x' + 'ee' * 20, 'amount': '300'},  # unscored: counts as the default
+        {'amount': 1000},                                        # no protocol: ignored
+    ]}]
+    result = portfolio_risk(users, risk_table)
+    expected = (100 * risk_scores[known] + 300 * DEFAULT_RISK_SCORE) / 400
+    assert result['risk_score'][0] == pytest.approx(expected)
+    assert result['exposure_count'][0] == 3
+    assert result['high_risk_exposure_count'][0] == 0
+
+def test_no_users():
+    result = portfolio_risk([], RiskScoreTable('/nonexistent/risk.bin'))
+    assert all(len(values) == 0 for values in result.values())
@@ -0,0 +1,70 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.serving import process_stats
+from src.serving.process_stats import HEAVY_MODULES, loaded_heavy_modules, resident_set_bytes
+
+ML_MODELS_DIR = Path(__file__).resolve().parent.parent
+
+def _no_proc(*args, **kwargs):
+    raise FileNotFoundError('/proc/self/statm')
+
+class _FakeResource:
+    RUSAGE_SELF = 0
+
+    def __init__(self, maxrss):
+        self.maxrss = maxrss
+
+    def getrusage(self, who):
+        return SimpleNamespace(ru_maxrss=self.maxrss)
+
+def test_resident_set_tracks_allocations():
+    before = resident_set_bytes()
+    block = np.ones(64 * 1024 * 1024 // 8)  # 64 MiB, touched by the fill
+    after = resident_set_bytes()
+    assert before > 0 and after - before > 32 * 1024 * 1024
+    del block
+
+def test_falls_back_to_peak_rss(monkeypatch):
+    # A module global shadows the builtin, so /proc reads fail
+    monkeypatch.setattr(process_stats, 'open', _no_proc, raising=False)
+    monkeypatch.setattr(process_stats, 'resource', _FakeResource(2048))
+    monkeypatch.setattr(process_stats.sys, 'platform', 'linux')
+    assert resident_set_bytes() == 2048 * 1024
+    # macOS reports bytes
+    monkeypatch.setattr(process_stats.sys, 'platform', 'darwin')
+    assert resident_set_bytes() == 2048
+    monkeypatch.setattr(process_stats, 'resource', None)
+    assert resident_set_bytes() is None
+
+def test_heavy_modules_follow_sys_modules(monkeypatch):
+    for name in HEAVY_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    assert loaded_heavy_modules() == []
+    monkeypatch.setitem(sys.modules, 'torch', SimpleNamespace())
+    monkeypatch.setitem(sys.modules, 'scipy', SimpleNamespace())
+    # Reported in HEAVY_MODULES order
+    assert loaded_heavy_modules() == ['scipy', 'torch']
+
+def test_flat_only_scoring_imports_no_heavy_module(tmp_path, trained_detector, training_rows):
+    model_path = tmp_path / 'anomaly_detector.joblib'
+    trained_detector.save_model(model_path)
+    np.save(tmp_path / 'rows.npy', training_rows[:20])
+    script = f"""
+import json, numpy as np
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.serving.process_stats import loaded_heavy_modules
+detector = DeFiAnomalyDetector.load_model({str(model_path)!r}, mmap_mode='r', flat_only=True)
+scores = detector.score_batch(np.load({str(tmp_path / 'rows.npy')!r}))
+print(json.dumps({{'heavy': loaded_heavy_modules(), 'scores': scores.tolist()}}))
+"""
+    result = subprocess.run([sys.executable, '-c', script], cwd=ML_MODELS_DIR,
+                            capture_output=True, text=True, check=True)
+    output = json.loads(result.stdout)
+    assert output['heavy'] == []
+    np.testing.assert_allclose(output['scores'], trained_detector.score_batch(training_rows[:20]))
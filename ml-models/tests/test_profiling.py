@@ -0,0 +1,97 @@
+import pstats
+
+import pytest
+from werkzeug.test import Client
+
+from src.serving.profiling import PROFILED_ENVIRON_KEY, ProfilingMiddleware
+
+def _busy_work():
+    return sum(i * i for i in range(2000))
+
+def _app(environ, start_response):
+    _busy_work()
+    flag = b'profiled' if environ.get(PROFILED_ENVIRON_KEY) else b'plain'
+    start_response('201 Created', [('Content-Type', 'text/plain')])
+    return [flag]
+
+def _streaming_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+
+    def body():
+        for _ in range(3):
+            _busy_work()
+            yield b'chunk'
+    return body()
+
+# Headers that ask for a profile from middleware built with admin_token=TOKEN
+TOKEN = 'secret'
+PROFILE = {'X-Profile': '1', 'X-Admin-Token': TOKEN}
+
+def _get(middleware, path='/', headers=None):
+    # Like a WSGI server: read the body, then close it (profiles are written on close)
+    response = Client(middleware).get(path, headers=headers)
+    response.get_data()
+    response.close()
+    return response
+
+def _profiles(directory):
+    return sorted(directory.glob('*.prof')) if directory.exists() else []
+
+def test_header_writes_a_profile_file(tmp_path):
+    middleware = ProfilingMiddleware(_app, tmp_path / 'profiles', admin_token=TOKEN)
+    response = _get(middleware, '/api/x', dict(PROFILE, **{'X-Request-ID': 'req/1'}))
+    assert response.status_code == 201 and response.data == b'profiled'
+    assert response.headers['X-Profile-Id'] == 'req_1'
+    [path] = _profiles(tmp_path / 'profiles')
+    assert path.name.endswith('-api_x-req_1.prof') and middleware.profiled == 1
+    functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+    assert '_busy_work' in functions
+
+def test_unprofiled_requests_pass_through(tmp_path):
+    middleware = ProfilingMiddleware(_app, tmp_path / 'profiles', header_enabled=False, admin_token=TOKEN)
+    response = _get(middleware, headers=PROFILE)
+    assert response.data == b'plain' and 'X-Profile-Id' not in response.headers
+    assert not _profiles(tmp_path / 'profiles') and middleware.profiled == 0
+
+def test_summary_replaces_the_body(tmp_path):
+    middleware = ProfilingMiddleware(_app, tmp_path / 'profiles', admin_token=TOKEN)
+    response = _get(middleware, '/api/x', dict(PROFILE, **{'X-Profile': 'summary'}))
+    assert response.status_code == 200 and response.headers['X-Profile-Status'] == '201 Created'
+    text = response.get_data(as_text=True)
+    assert text.startswith('GET /api/x -> 201 Created') and '_busy_work' in text
+    assert not _profiles(tmp_path / 'profiles')
+
+@pytest.mark.parametrize('configured, token, profiled', [
+    (TOKEN, None, False), (TOKEN, 'wrong', False), (TOKEN, TOKEN, True),
+    # Without a configured token nobody can ask for a profile
+    (None, None, False), (None, '', False), ('', '', False),
+])
+def test_admin_token_gates_the_header(tmp_path, configured, token, profiled):
+    middleware = ProfilingMiddleware(_app, tmp_path / 'profiles', admin_token=configured)
+    for mode in ('1', 'summary'):
+        headers = {'X-Profile': mode}
+        if token is not None:
+            headers['X-Admin-Token'] = token
+        response = _get(middleware, headers=headers)
+        assert (response.data != b'plain') is profiled
+    assert len(_profiles(tmp_path / 'profiles')) == int(profiled)
+
+def test_sampling_needs_no_header(tmp_path):
+    middleware = ProfilingMiddleware(_app, tmp_path / 'profiles', sample_rate=1.0, header_enabled=False)
+    assert _get(middleware).data == b'profiled'
+    assert len(_profiles(tmp_path / 'profiles')) == 1
+
+def test_streamed_bodies_are_profiled_and_one_request_at_a_time(tmp_path):
+    middleware = ProfilingMiddleware(_streaming_app, tmp_path / 'profiles', admin_token=TOKEN)
+    client = Client(middleware)
+    streaming = client.get('/stream', headers=PROFILE, buffered=False)
+    # While the first response is still open, a second one runs unprofiled
+    assert 'X-Profile-Id' not in client.get('/stream', headers=PROFILE).headers
+    assert b''.join(streaming.response) == b'chunk' * 3
+    streaming.close()
+
+    [path] = _profiles(tmp_path / 'profiles')
+    stats = {name: calls for (_, _, name), (calls, *_) in pstats.Stats(str(path)).stats.items()}
+    assert stats['_busy_work'] == 3
+    # The lock is released once the body is closed
+    assert 'X-Profile-Id' in client.get('/stream', headers=PROFILE).headers
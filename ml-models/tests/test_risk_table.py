@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+
+from src.serving.risk_table import (
+    RiskScoreTable, RiskTableRefresher, encode_address, fallback_risk_score, write_risk_table
+)
+
+def _scores(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    scores = {'0x' + rng.bytes(20).hex(): float(rng.uniform(0, 100)) for _ in range(n)}
+    # Addresses ending in zero bytes sort next to their truncated prefixes
+    scores['0x' + '00' * 20] = 1.0
+    scores['0x' + 'ab' * 19 + '00'] = 2.0
+    scores['0x' + 'ab' * 18 + '0000'] = 3.0
+    scores['0x' + 'ab' * 20] = 4.0
+    scores['0x' + '12' * 10 + '00' * 10] = 5.0
+    return scores
+
+def test_lookups_match_a_dict(tmp_path):
+    scores = _scores()
+    path = tmp_path / 'risk.bin'
+    assert write_risk_table(scores, path) == len(scores)
+    table = RiskScoreTable(path)
+    assert len(table) == len(scores)
+
+    rng = np.random.default_rng(1)
+    missing = ['0x' + rng.bytes(20).hex() for _ in range(50)] + ['0x' + 'ab' * 17 + '000000']
+    queries = list(scores) + missing
+    expected = np.array([np.float32(scores[a]) if a in scores else np.nan for a in queries])
+    for address, want in zip(queries, expected):
+        got = table.get(address)
+        assert (got is None) if np.isnan(want) else got == want
+    np.testing.assert_array_equal(table.get_many(queries), expected)
+
+def test_zero_trailing_addresses_resolve(tmp_path):
+    path = tmp_path / 'risk.bin'
+    write_risk_table({'0x' + '00' * 20: 11.0, '0x' + 'cd' * 19 + '00': 22.0}, path)
+    table = RiskScoreTable(path)
+    assert table.get('0x' + '00' * 20) == 11.0
+    assert table.get('0X' + 'CD' * 19 + '00') == 22.0
+    assert table.get('0x' + 'cd' * 19 + '01') is None
+    np.testing.assert_array_equal(table.get_many(['0x' + '00' * 20, '0x' + 'cd' * 19 + '00']), [11.0, 22.0])
+
+def test_invalid_addresses_never_match(tmp_path):
+    path = tmp_path / 'risk.bin'
+    write_risk_table({'0x' + '00' * 20: 9.0, 'not-an-address': 1.0}, path)
+    table = RiskScoreTable(path)
+    assert len(table) == 1
+    # An invalid query encodes as empty bytes and must not hit the all-zero key
+    assert table.get('0xzz', default=-1) == -1
+    assert np.isnan(table.get_many(['', '0x12', 'abc'])).all()
+    assert encode_address('0x' + '0g' * 20) is None
+
+def test_missing_file_is_empty_until_written(tmp_path):
+    path = tmp_path / 'risk.bin'
+    table = RiskScoreTable(path, check_interval=0)
+    assert len(table) == 0 and table.get('0x' + 'ab' * 20) is None
+    write_risk_table({'0x' + 'ab' * 20: 7.0}, path)
+    assert table.get('0x' + 'ab' * 20) == 7.0
+
+def test_rebuilt_table_is_remapped(tmp_path):
+    path = tmp_path / 'risk.bin'
+    write_risk_table({'0x' + 'ab' * 20: 7.0}, path)
+    table = RiskScoreTable(path, check_interval=3600)
+    write_risk_table({'0x' + 'ab' * 20: 8.0, '0x' + 'cd' * 20: 9.0}, path)
+    # Not re-checked before the interval elapses
+    assert table.get('0x' + 'ab' * 20) == 7.0
+    assert table.refresh(force=True)
+    assert len(table) == 2 and table.get('0x' + 'ab' * 20) == 8.0
+    assert not table.refresh(force=True)
+
+def test_bad_header_is_ignored(tmp_path):
+    path = tmp_path / 'risk.bin'
+    write_risk_table({'0x' + 'ab' * 20: 7.0}, path)
+    table = RiskScoreTable(path, check_interval=0)
+    # Swapped in like a rebuild, so the old mapping stays intact
+    (tmp_path / 'bad.bin').write_bytes(b'garbage' * 10)
+    os.replace(tmp_path / 'bad.bin', path)
+    assert table.get('0x' + 'ab' * 20) == 7.0
+
+def test_fallback_score_is_deterministic_and_bounded():
+    addresses = ['0x' + bytes([i]).hex() * 20 for i in range(256)]
+    scores = [fallback_risk_score(a) for a in addresses]
+    assert all(20 <= s <= 80 for s in scores)
+    assert fallback_risk_score('0x' + 'AB' * 20) == fallback_risk_score('0x' + 'ab' * 20)
+    assert len(set(scores)) > 30
+
+def test_refresher_rebuilds_and_skips_when_locked(tmp_path):
+    path = tmp_path / 'tables' / 'risk.bin'
+    refresher = RiskTableRefresher(lambda: {'0x' + 'ab' * 20: 42.0}, path)
+    assert refresher.refresh_now()
+    assert RiskScoreTable(path).get('0x' + 'ab' * 20) == 42.0
+    assert not any(name.endswith('.tmp') for name in os.listdir(path.parent))
+
+    import fcntl
+    with open(path.with_name(path.name + '.lock'), 'w') as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        assert not refresher.refresh_now(force=True)
+
+def test_refreshers_on_one_path_coalesce_rebuilds(tmp_path):
+    path = tmp_path / 'risk.bin'
+    calls = []
+    def source():
+        calls.append(1)
+        return {'0x' + 'ab' * 20: float(len(calls))}
+    workers = [RiskTableRefresher(source, path, interval=60.0) for _ in range(3)]
+    assert [worker.refresh_now() for worker in workers] == [True, False, False]
+    assert len(calls) == 1
+
+    # Half an interval later the next worker to wake up rebuilds, and only that one
+    written = path.stat().st_mtime - 31
+    os.utime(path, (written, written))
+    assert [worker.refresh_now() for worker in reversed(workers)] == [True, False, False]
+    assert RiskScoreTable(path).get('0x' + 'ab' * 20) == 2.0
+    assert workers[0].refresh_now(force=True) and len(calls) == 3
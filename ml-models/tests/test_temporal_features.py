@@ -0,0 +1,82 @@
+import numpy as np
+
+from benchmarks.synthetic import generate_transactions
+from src.features.temporal_features import StreamingTemporalFeatures
+from src.features.transaction_features import TransactionFeatureExtractor
+
+def _reference(events):
+    # Brute-force [tx_frequency, value_velocity, gas_volatility] over a list of (timestamp, value, gas_price)
+    if not events:
+        return np.zeros(3)
+    timestamps = np.array([e[0] for e in events])
+    span_hours = (timestamps.max() - timestamps.min()) / 3600
+    gas = np.array([e[2] for e in events])
+    return np.array([
+        len(events) / span_hours if span_hours > 0 else 0.0,
+        np.mean([e[1] for e in events]),
+        np.std(gas, ddof=1) if len(events) > 1 else 0.0,
+    ])
+
+def test_unbounded_stream_matches_batch_extraction():
+    batch = generate_transactions(2000, n_addresses=150, seed=5)
+    extractor = TransactionFeatureExtractor(temporal_window_seconds=None)
+    rows = extractor.stream_temporal_features(batch)
+    # stream_temporal_features orders senders by first appearance, the batch version by address
+    senders = list(dict.fromkeys(batch.senders.tolist()))
+    by_address = np.argsort(np.array(senders, dtype=object), kind='stable')
+    np.testing.assert_allclose(rows[by_address], extractor.extract_temporal_features(batch), rtol=1e-9)
+
+def test_sliding_window_matches_brute_force():
+    batch = generate_transactions(3000, n_addresses=40, seed=6, block_time=30.0)
+    window = 1800.0
+    stream = StreamingTemporalFeatures(window_seconds=window)
+    stream.update_batch(batch)
+    now = float(batch.timestamp.max())
+    senders = batch.senders.tolist()
+    for address in set(senders):
+        events = [(t, v, g) for s, t, v, g in zip(senders, batch.timestamp.tolist(), batch.value.tolist(),
+                                                   batch.gas_price.tolist())
+                  if s == address and t >= now - window]
+        np.testing.assert_allclose(stream.get_features(address, now=now), _reference(events),
+                                   rtol=1e-6, atol=1e-9)
+
+def test_update_and_push_agree():
+    records = [
+        {'from': '0xa', 'timestamp': 0, 'value': 1, 'gasPrice': 10},
+        {'from': '0xa', 'timestamp': 1800, 'value': 3, 'gasPrice': 30},
+        {'from': '0xb', 'timestamp': 1900, 'value': 5, 'gasPrice': 20},
+    ]
+    stream = StreamingTemporalFeatures()
+    stream.update_many(records)
+    np.testing.assert_allclose(stream.get_features('0xa'), [4.0, 2.0, np.std([10, 30], ddof=1)])
+    np.testing.assert_allclose(stream.get_features('0xb'), [0.0, 5.0, 0.0])
+    np.testing.assert_array_equal(stream.get_features('0xunknown'), np.zeros(3))
+
+def test_expiry_and_prune():
+    stream = StreamingTemporalFeatures(window_seconds=100)
+    stream.push('0xa', 0, 1.0, 1.0)
+    stream.push('0xb', 10, 2.0, 2.0)
+    stream.push('0xb', 120, 4.0, 6.0)
+    # 0xb's first event has left the window relative to its latest event
+    np.testing.assert_allclose(stream.get_features('0xb'), [0.0, 4.0, 0.0])
+    np.testing.assert_array_equal(stream.get_features('0xa', now=200), np.zeros(3))
+    assert stream.prune(now=200) == 1
+    assert '0xa' not in stream and '0xb' in stream
+    assert len(stream) == 1
+
+def test_window_end_queries_are_bounded_and_read_only():
+    stream = StreamingTemporalFeatures(window_seconds=100)
+    events = [(t, float(t), 10.0 + t % 7) for t in range(0, 200, 10)]
+    for timestamp, value, gas_price in events:
+        stream.push('0xa', timestamp, value, gas_price)
+    latest = stream.get_features('0xa')
+    # The window relative to the latest event holds 90..190
+    np.testing.assert_allclose(latest, _reference([e for e in events if e[0] >= 90]))
+    # A past window end leaves out later events (events before 90 already expired on push)
+    np.testing.assert_allclose(stream.get_features('0xa', now=150), _reference([e for e in events if 90 <= e[0] <= 150]))
+    np.testing.assert_allclose(stream.get_features('0xa', now=215), _reference([e for e in events if e[0] >= 115]))
+    # A window end far in the future sees nothing, and deletes nothing
+    np.testing.assert_array_equal(stream.get_features('0xa', now=1e9), np.zeros(3))
+    np.testing.assert_array_equal(stream.get_features('0xa', now=-1), np.zeros(3))
+    np.testing.assert_array_equal(stream.get_features('0xa'), latest)
+    np.testing.assert_array_equal(stream.get_features('0xa', now=190), latest)
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from src.models.anomaly_detector import DeFiAnomalyDetector
+from src.models.training import iter_feature_chunks, main, merge_forests, train_out_of_core
+
+COLUMNS = ['value', 'gas', 'delta', 'noise', 'fanout']
+
+@pytest.fixture
+def sources(tmp_path, training_rows):
+    frame = pd.DataFrame(training_rows, columns=COLUMNS)
+    frame['label'] = 'x'
+    paths = {'npy': tmp_path / 'rows.npy', 'csv': tmp_path / 'rows.csv', 'parquet': tmp_path / 'rows.parquet'}
+    np.save(paths['npy'], training_rows)
+    frame.to_csv(paths['csv'], index=False)
+    frame.to_parquet(paths['parquet'], index=False)
+    return paths
+
+@pytest.mark.parametrize('kind', ['npy', 'csv', 'parquet'])
+def test_chunks_reassemble_the_matrix(sources, training_rows, kind):
+    chunks = list(iter_feature_chunks(sources[kind], chunk_size=300))
+    assert [len(c) for c in chunks] == [300] * 6 + [200]
+    # Non-numeric columns are dropped from tabular input
+    np.testing.assert_allclose(np.vstack(chunks), training_rows, rtol=1e-12)
+
+def test_column_selection_and_unknown_format(sources, training_rows, tmp_path):
+    chunks = list(iter_feature_chunks(sources['parquet'], chunk_size=1000, columns=['gas', 'fanout']))
+    np.testing.assert_array_equal(np.vstack(chunks), training_rows[:, [1, 4]])
+    with pytest.raises(ValueError, match="Unsupported"):
+        list(iter_feature_chunks(tmp_path / 'rows.json'))
+
+def test_merged_forest_averages_tree_depths(training_rows):
+    scaled = StandardScaler().fit_transform(training_rows)
+    trees = [IsolationForest(n_estimators=1, max_samples=128, random_state=seed).fit(scaled) for seed in range(12)]
+    merged = merge_forests(trees)
+    assert merged.n_estimators == 12 and len(merged.estimators_) == 12
+    assert len(merged.estimators_features_) == 12
+
+    probe = np.vstack([scaled[:200], scaled[:20] * 6])
+    # score = -2^(-E[h(x)] / c(n)) with E over trees, so the merged score is the
+    # geometric mean of the one-tree scores
+    per_tree = np.array([tree.score_samples(probe) for tree in trees])
+    expected = -np.exp2(np.log2(-per_tree).mean(axis=0))
+    np.testing.assert_allclose(merged.score_samples(probe), expected, rtol=1e-12)
+
+def test_split_and_merged_forest_matches_original(training_rows):
+    forest = IsolationForest(n_estimators=8, max_samples=64, random_state=4).fit(training_rows)
+    parts = []
+    for i in range(8):
+        part = IsolationForest(n_estimators=1, max_samples=64, random_state=i).fit(training_rows)
+        part.estimators_ = forest.estimators_[i:i + 1]
+        part.estimators_features_ = forest.estimators_features_[i:i + 1]
+        part._decision_path_lengths = forest._decision_path_lengths[i:i + 1]
+        part._average_path_length_per_tree = forest._average_path_length_per_tree[i:i + 1]
+        parts.append(part)
+    merged = merge_forests(parts)
+    np.testing.assert_allclose(merged.score_samples(training_rows), forest.score_samples(training_rows), rtol=1e-12)
+
+def test_train_out_of_core(sources, training_rows):
+    detector = train_out_of_core(sources['npy'], n_estimators=16, max_samples=128, chunk_size=300,
+                                 n_jobs=2, offset_sample_size=len(training_rows), random_state=3)
+    reference = StandardScaler().fit(training_rows)
+    np.testing.assert_allclose(detector.scaler.mean_, reference.mean_, rtol=1e-10)
+    np.testing.assert_allclose(detector.scaler.scale_, reference.scale_, rtol=1e-10)
+    forest = detector.isolation_forest
+    assert forest.n_estimators == 16 and forest.max_samples_ == 128
+
+    # The offset sample is the whole set here, so the threshold flags 10% of it
+    flagged = (detector.predict_batch(training_rows) == -1).mean()
+    assert abs(flagged - 0.1) < 0.005
+    outliers = training_rows[:20] + np.array([1.0, 20.0, 0.5, 2.0, 5.0]) * 8
+    assert (detector.predict_batch(outliers) == -1).all()
+    # The compiled flat forest agrees with the merged sklearn forest
+    np.testing.assert_allclose(detector.flat_forest.score_samples(training_rows),
+                               forest.score_samples(detector.scaler.transform(training_rows)), atol=1e-12)
+
+def test_training_is_independent_of_workers_and_format(sources, training_rows):
+    kwargs = dict(n_estimators=6, max_samples=64, chunk_size=500, random_state=9)
+    one = train_out_of_core(sources['npy'], n_jobs=1, **kwargs)
+    three = train_out_of_core(sources['parquet'], n_jobs=3, **kwargs)
+    np.testing.assert_allclose(one.score_batch(training_rows), three.score_batch(training_rows), rtol=1e-12)
+
+def test_cli_writes_a_loadable_model(sources, training_rows, tmp_path):
+    output = tmp_path / 'model.joblib'
+    main([str(sources['csv']), '-o', str(output), '--columns', ','.join(COLUMNS),
+          '--n-estimators', '4', '--max-samples', '32', '--n-jobs', '1', '--contamination', 'auto'])
+    loaded = DeFiAnomalyDetector.load_model(output, flat_only=True)
+    assert loaded.n_features == 5
+    assert loaded.flat_forest.offset == -0.5
+    assert np.isfinite(loaded.score_batch(training_rows[:10])).all()
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features import transaction_batch
+from src.features.transaction_batch import TransactionBatch, factorize
+
+RECORDS = [
+    {'hash': '0x1', 'from': '0xa', 'to': '0xb', 'value': '5', 'gasPrice': 10, 'gasUsed': 21000, 'timestamp': 100},
+    {'hash': '0x2', 'from': '0xc', 'to': '0xa', 'value': 7.5, 'gasPrice': 11, 'gasUsed': 50000, 'timestamp': 101},
+    {'hash': '0x3', 'from': '0xa', 'to': '0xd', 'value': 1, 'gasPrice': 12, 'gasUsed': 21000, 'timestamp': 102},
+]
+
+def _assert_batches_equal(a, b):
+    np.testing.assert_array_equal(a.addresses, b.addresses)
+    np.testing.assert_array_equal(a.from_ids, b.from_ids)
+    np.testing.assert_array_equal(a.to_ids, b.to_ids)
+    for name in TransactionBatch.NUMERIC_COLUMNS:
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+    np.testing.assert_array_equal(a.hashes, b.hashes)
+
+def test_from_records_encodes_addresses_senders_first():
+    batch = TransactionBatch.from_records(RECORDS)
+    assert batch.addresses.tolist() == ['0xa', '0xc', '0xb', '0xd']
+    assert batch.senders.tolist() == ['0xa', '0xc', '0xa']
+    assert batch.recipients.tolist() == ['0xb', '0xa', '0xd']
+    assert batch.value.dtype == np.float64
+    np.testing.assert_array_equal(batch.value, [5.0, 7.5, 1.0])
+    assert len(batch) == 3 and batch.n_addresses == 4
+
+def test_constructors_agree(tmp_path):
+    expected = TransactionBatch.from_records(RECORDS)
+    frame = pd.DataFrame(RECORDS)
+    _assert_batches_equal(TransactionBatch.from_frame(frame), expected)
+    _assert_batches_equal(TransactionBatch.from_json(json.dumps(RECORDS)), expected)
+    _assert_batches_equal(TransactionBatch.from_json('\n'.join(json.dumps(r) for r in RECORDS).encode()), expected)
+    frame.to_csv(tmp_path / 'tx.csv', index=False)
+    csv_batch = TransactionBatch.from_csv(tmp_path / 'tx.csv', dtype={'hash': str})
+    np.testing.assert_array_equal(csv_batch.senders, expected.senders)
+    np.testing.assert_array_equal(csv_batch.value, expected.value)
+
+def test_missing_optional_columns_are_nan():
+    batch = TransactionBatch.from_records([{'from': '0xa', 'to': '0xb', 'value': 1}])
+    assert np.isnan(batch.gas_price).all() and np.isnan(batch.timestamp).all()
+    assert batch.hashes is None
+
+def test_empty_and_coerce():
+    empty = TransactionBatch.from_records([])
+    assert len(empty) == 0 and empty.n_addresses == 0
+    batch = TransactionBatch.from_records(RECORDS)
+    assert TransactionBatch.coerce(batch) is batch
+    _assert_batches_equal(TransactionBatch.coerce(RECORDS), batch)
+
+@pytest.mark.parametrize('n', [0, 10, transaction_batch.SMALL_FACTORIZE_SIZE + 100])
+def test_factorize_matches_pandas(n):
+    rng = np.random.default_rng(n)
+    values = np.array([f"0x{i:x}" for i in rng.integers(0, max(n // 3, 1), size=n)], dtype=object)
+    codes, uniques = factorize(values)
+    expected_codes, expected_uniques = pd.factorize(values)
+    np.testing.assert_array_equal(codes, expected_codes)
+    np.testing.assert_array_equal(uniques, np.asarray(expected_uniques, dtype=object))
+    np.testing.assert_array_equal(uniques[codes], values)
@@ -0,0 +1,164 @@
+import pickle
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from src.features.transaction_graph import TransactionGraphIndex
+
+def _batches(n_batches=6, size=150, n_addresses=60, seed=0):
+    rng = np.random.default_rng(seed)
+    addresses = [f"0x{i:040x}" for i in range(n_addresses)]
+    batches = []
+    for b in range(n_batches):
+        # A skewed sender distribution gives a few hubs and many leaves
+        senders = rng.zipf(1.6, size=size) % n_addresses
+        recipients = rng.integers(0, n_addresses, size=size)
+        batches.append([
+            {'hash': f"0x{b:08x}{i:056x}", 'from': addresses[s], 'to': addresses[r],
+             'value': float(rng.uniform(0, 10)), 'gasPrice': 1.0, 'gasUsed': 1.0, 'timestamp': float(b * size + i)}
+            for i, (s, r) in enumerate(zip(senders, recipients))
+        ])
+    return addresses, batches
+
+class _BruteForceGraph:
+    def __init__(self):
+        self.count = defaultdict(int)
+        self.value = defaultdict(float)
+
+    def update(self, transactions):
+        for tx in transactions:
+            self.count[tx['from'], tx['to']] += 1
+            self.value[tx['from'], tx['to']] += tx['value']
+
+    def out(self, address):
+        return {d for (s, d) in self.count if s == address}
+
+    def into(self, address):
+        return {s for (s, d) in self.count if d == address}
+
+    def fanout(self, address):
+        reached = set(self.out(address))
+        for neighbor in list(reached):
+            reached |= self.out(neighbor)
+        reached.discard(address)
+        return len(reached)
+
+    def overlap(self, a, b):
+        first, second = self.out(a) | self.into(a), self.out(b) | self.into(b)
+        union = first | second
+        return len(first & second) / len(union) if union else 0.0
+
+    def row(self, address):
+        return [len(self.out(address)), len(self.into(address)),
+                sum(v for (s, _), v in self.value.items() if s == address),
+                sum(v for (_, d), v in self.value.items() if d == address),
+                self.fanout(address)]
+
+@pytest.mark.parametrize('compact_min_edges', [1, 64, 10_000])
+def test_matches_brute_force(compact_min_edges):
+    addresses, batches = _batches()
+    graph = TransactionGraphIndex(compact_min_edges=compact_min_edges)
+    reference = _BruteForceGraph()
+    for batch in batches:
+        graph.update(batch)
+        reference.update(batch)
+    queried = addresses + ['0x' + 'ff' * 20]
+
+    assert graph.n_edges == len(reference.count)
+    assert graph.n_nodes == len({a for edge in reference.count for a in edge})
+    ids = {address: graph.node_id(address) for address in addresses if address in graph}
+    names = {node: address for address, node in ids.items()}
+    for address in queried:
+        assert graph.degree(address) == (len(reference.out(address)), len(reference.into(address)))
+        assert {names[n] for n in graph.out_neighbors(address).tolist()} == reference.out(address)
+        assert {names[n] for n in graph.in_neighbors(address).tolist()} == reference.into(address)
+        # Each distinct edge is stored once
+        assert len(graph.out_neighbors(address)) == len(reference.out(address))
+        assert graph.two_hop_fanout(address) == reference.fanout(address)
+    for (s, d), count in reference.count.items():
+        got_count, got_value = graph.edge(s, d)
+        assert got_count == count and got_value == pytest.approx(reference.value[s, d])
+    assert graph.edge(addresses[0], '0x' + 'ff' * 20) == (0, 0.0)
+    for a, b in [(addresses[0], addresses[1]), (addresses[2], addresses[30]), (addresses[5], queried[-1])]:
+        assert graph.counterparty_overlap(a, b) == pytest.approx(reference.overlap(a, b))
+    np.testing.assert_allclose(graph.features(queried), [reference.row(a) for a in queried])
+
+def test_compaction_keeps_adjacency():
+    addresses, batches = _batches(n_batches=3)
+    compacted = TransactionGraphIndex(compact_fraction=0.0, compact_min_edges=1)
+    lazy = TransactionGraphIndex(compact_min_edges=10**9)
+    for batch in batches:
+        compacted.update(batch)
+        lazy.update(batch)
+    assert compacted._out.pending_count == 0 and lazy._out.compacted_edges == 0
+    for address in addresses:
+        assert sorted(compacted.out_neighbors(address)) == sorted(lazy.out_neighbors(address))
+        assert sorted(compacted.in_neighbors(address)) == sorted(lazy.in_neighbors(address))
+
+def test_fanout_expansion_is_capped():
+    graph = TransactionGraphIndex()
+    hub, leaves = '0xhub', [f"0xleaf{i}" for i in range(5)]
+    transactions = [{'from': hub, 'to': leaf, 'value': 1.0} for leaf in leaves]
+    transactions += [{'from': leaf, 'to': f"{leaf}-child", 'value': 1.0} for leaf in leaves]
+    graph.update(transactions)
+    assert graph.two_hop_fanout(hub) == 10
+    assert graph.two_hop_fanout(hub, max_neighbors=2) == 7
+    # Cycles back to the address itself are not counted
+    graph.update([{'from': leaves[0], 'to': hub, 'value': 1.0}])
+    assert graph.two_hop_fanout(hub) == 10
+
+def test_pickle_round_trip_then_continue():
+    _, batches = _batches(n_batches=4)
+    graph = TransactionGraphIndex(compact_min_edges=32)
+    for batch in batches[:2]:
+        graph.update(batch)
+    restored = pickle.loads(pickle.dumps(graph))
+    for batch in batches[2:]:
+        graph.update(batch)
+        restored.update(batch)
+    addresses = list(graph._node_ids)
+    np.testing.assert_array_equal(restored.features(addresses), graph.features(addresses))
+
+def test_eviction_keeps_the_most_recent_edges():
+    addresses, batches = _batches(n_batches=10, size=40)
+    graph = TransactionGraphIndex(compact_min_edges=16, max_edges=120)
+    last_seen = {}
+    for b, batch in enumerate(batches):
+        graph.update(batch)
+        for tx in batch:
+            last_seen[tx['from'], tx['to']] = b
+        assert graph.n_edges <= 120
+    assert graph.evictions > 0
+
+    kept = {(graph.address(s), graph.address(d))
+            for s, d in zip(graph.edge_src[:graph.n_edges].tolist(), graph.edge_dst[:graph.n_edges].tolist())}
+    dropped = set(last_seen) - kept
+    assert min(last_seen[edge] for edge in kept) >= max(last_seen[edge] for edge in dropped)
+
+    # The structure left matches a graph built from just the kept edges
+    reference = TransactionGraphIndex()
+    for batch in batches:
+        reference.update([tx for tx in batch if (tx['from'], tx['to']) in kept])
+    assert graph.n_nodes == reference.n_nodes
+    queried = sorted(set(addresses) | set(reference._node_ids))
+    features, expected = graph.features(queried), reference.features(queried)
+    np.testing.assert_array_equal(features[:, [0, 1, 4]], expected[:, [0, 1, 4]])
+    # Values only count since an edge was last (re)added, so they can fall short
+    # of the full history but always sum the kept edges
+    sent, received = dict.fromkeys(queried, 0.0), dict.fromkeys(queried, 0.0)
+    for s, d in kept:
+        count, value = graph.edge(s, d)
+        assert 0 < count <= reference.edge(s, d)[0]
+        sent[s] += value
+        received[d] += value
+    np.testing.assert_allclose(features[:, 2], [sent[a] for a in queried])
+    np.testing.assert_allclose(features[:, 3], [received[a] for a in queried])
+
+def test_update_reports_senders_with_new_recipients():
+    graph = TransactionGraphIndex()
+    grown = graph.update([{'from': 'a', 'to': 'b', 'value': 1.0}, {'from': 'c', 'to': 'b', 'value': 1.0}])
+    assert sorted(graph.address(n) for n in grown) == ['a', 'c']
+    assert graph.update([{'from': 'a', 'to': 'b', 'value': 2.0}]).size == 0
+    grown = graph.update([{'from': 'b', 'to': 'd', 'value': 1.0}])
+    assert sorted(graph.fanout_dependents(grown)) == ['a', 'b', 'c']
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from src.serving.wire_format import HEADER, HEADER_SIZE, MAGIC, WireFormatError, decode_matrix, encode_matrix
+
+@pytest.mark.parametrize('dtype', ['<f4', '<f8'])
+def test_round_trip(training_rows, dtype):
+    payload = encode_matrix(training_rows, dtype=dtype)
+    assert len(payload) == HEADER_SIZE + training_rows.size * np.dtype(dtype).itemsize
+    decoded = decode_matrix(payload)
+    assert decoded.dtype == np.dtype(dtype) and decoded.shape == training_rows.shape
+    np.testing.assert_array_equal(decoded, training_rows.astype(dtype))
+
+def test_decoding_is_a_read_only_view(training_rows):
+    payload = bytearray(encode_matrix(training_rows))
+    decoded = decode_matrix(memoryview(payload))
+    # The header keeps float64 values 8-byte aligned
+    assert HEADER_SIZE % 8 == 0 and decoded.base is not None
+    payload[HEADER_SIZE:HEADER_SIZE + 8] = np.float64(123.0).tobytes()
+    assert decoded[0, 0] == 123.0
+    with pytest.raises(ValueError):
+        decode_matrix(bytes(payload))[0, 0] = 1.0
+
+def test_vectors_and_empty_matrices():
+    decoded = decode_matrix(encode_matrix(np.arange(4.0)))
+    assert decoded.shape == (4, 1)
+    assert decode_matrix(encode_matrix(np.empty((0, 5)))).shape == (0, 5)
+
+@pytest.mark.parametrize('matrix, dtype, message', [
+    (np.zeros((2, 2, 2)), '<f8', '3 dimensions'),
+    (np.zeros((2, 2)), '<i8', 'Unsupported dtype'),
+])
+def test_encode_rejects(matrix, dtype, message):
+    with pytest.raises(WireFormatError, match=message):
+        encode_matrix(matrix, dtype=dtype)
+
+def _header(rows=2, cols=2, code=2, magic=MAGIC):
+    return HEADER.pack(magic, code, rows, cols)
+
+@pytest.mark.parametrize('payload, message', [
+    (b'SNTM', 'shorter than the 24-byte header'),
+    (_header(magic=b'XXXX') + bytes(32), 'Bad magic'),
+    (_header(code=9) + bytes(32), 'Unknown dtype code 9'),
+    (_header() + bytes(31), 'header describes 56'),
+    (_header() + bytes(33), 'header describes 56'),
+    # Sizes that would overflow a naive allocation are rejected before reading
+    (_header(rows=2 ** 40, cols=2 ** 20), 'header describes'),
+])
+def test_decode_rejects_malformed_payloads(payload, message):
+    with pytest.raises(WireFormatError, match=message):
+        decode_matrix(payload)
+
+@pytest.mark.parametrize('value', [np.nan, np.inf, -np.inf])
+@pytest.mark.parametrize('dtype', ['<f4', '<f8'])
+def test_decode_rejects_non_finite_values(value, dtype):
+    matrix = np.ones((3, 4))
+    matrix[2, 1] = value
+    payload = encode_matrix(matrix, dtype=dtype)
+    with pytest.raises(WireFormatError, match='NaN or infinite'):
+        decode_matrix(payload)
+    assert np.isnan(decode_matrix(payload, allow_non_finite=True)[2, 1]) == np.isnan(value)
+
+def test_wire_format_error_is_a_value_error():
+    # The server maps ValueErrors from bad input to 400 responses
+    assert issubclass(WireFormatError, ValueError)